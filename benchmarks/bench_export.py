@@ -0,0 +1,198 @@
+"""
+End-to-end export benchmark against the local stub C2C API.
+
+Starts benchmarks/stub_api.py in a separate process, points c2c_gpx.main at it and
+runs the real main() flow, then reports documents per second, wall time per stage,
+request counts and peak RSS.
+
+    python benchmarks/bench_export.py --copies 50 --latency 0.02 -o before.json
+    python benchmarks/bench_export.py --copies 50 --latency 0.02 --cache warm --compare before.json
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+from urllib.request import urlopen
+
+import c2c_gpx.main
+
+from common import compare_results, load_results, save_results
+from stub_api import add_stub_arguments, make_server, stub_from_args
+
+STAGES = ("get_document_versions", "get_collection_versions", "get_documents_data", "write_outputs")
+
+
+def serve_stub(args: argparse.Namespace, ports: "multiprocessing.Queue[int]") -> None:
+    server = make_server(stub_from_args(args))
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def timed(func: Callable[..., Any], stage_times: dict[str, float]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stage_times[func.__name__] = stage_times.get(func.__name__, 0.0) + time.perf_counter() - start
+
+    return wrapper
+
+
+def instrument_stages(stage_times: dict[str, float]) -> dict[str, Callable[..., Any]]:
+    """Wrap the main stages with timers, return the original functions."""
+    originals = {name: getattr(c2c_gpx.main, name) for name in STAGES}
+    for name, func in originals.items():
+        setattr(c2c_gpx.main, name, timed(func, stage_times))
+    return originals
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def fetch_stats(stub_url: str) -> dict[str, int]:
+    with urlopen(f"{stub_url}/_stats") as response:
+        stats: dict[str, int] = json.load(response)
+        return stats
+
+
+def run_export(url: str, output: str, cache: str | None) -> None:
+    sys.argv = ["c2c_gpx", url, "-o", output, *(["--http-cache", cache] if cache else ["--no-http-cache"])]
+    c2c_gpx.main.main()
+
+
+def count_waypoints(path: str) -> int:
+    with open(path, encoding="utf-8") as f:
+        return sum(line.count("<wpt ") for line in f)
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    ports: multiprocessing.Queue[int] = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub, args=(args, ports), daemon=True)
+    stub.start()
+    stub_url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+
+    c2c_gpx.main.API_BASE_URL = stub_url
+    c2c_gpx.main.delay = args.delay
+
+    if args.book:
+        url = f"{c2c_gpx.main.BASE_URL}/books/1"
+    else:
+        url = f"{c2c_gpx.main.BASE_URL}/{args.doc_type}?bbox=600000,5700000,800000,5800000"
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = os.path.join(tmpdir, "c2c_cache") if args.cache != "none" else None
+            output = os.path.join(tmpdir, "export.gpx")
+
+            if args.cache == "warm":
+                run_export(url, output, cache)
+
+            stats_before = fetch_stats(stub_url)
+            stage_times: dict[str, float] = {}
+            originals = instrument_stages(stage_times)
+
+            error = None
+            start = time.perf_counter()
+            try:
+                run_export(url, output, cache)
+            except Exception as e:
+                error = repr(e)
+            wall_time = time.perf_counter() - start
+
+            for name, func in originals.items():
+                setattr(c2c_gpx.main, name, func)
+
+            stats = fetch_stats(stub_url)
+            documents = count_waypoints(output) if error is None else 0
+            output_size = os.path.getsize(output) if error is None else 0
+    finally:
+        stub.terminate()
+
+    return {
+        "error": error,
+        "documents": documents,
+        "documents_per_second": documents / wall_time,
+        "wall_time": wall_time,
+        "stages": stage_times,
+        "requests": {k: v - stats_before.get(k, 0) for k, v in stats.items() if v - stats_before.get(k, 0)},
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_size,
+    }
+
+
+def print_report(result: dict[str, Any]) -> None:
+    if result["error"]:
+        print(f"export failed: {result['error']}")
+    print(f"documents:          {result['documents']}")
+    print(f"wall time:          {result['wall_time']:.3f} s")
+    print(f"documents / second: {result['documents_per_second']:.1f}")
+    print(f"peak RSS:           {result['peak_rss_mb']:.1f} MB")
+    print(f"output size:        {result['output_bytes']} bytes")
+    print("stages:")
+    for name, duration in result["stages"].items():
+        print(f"  {name:<20} {duration:>10.3f} s")
+    print("requests:")
+    for name, count in sorted(result["requests"].items()):
+        print(f"  {name:<20} {count:>10}")
+
+
+def stage_timings(result: dict[str, Any]) -> dict[str, dict[str, float]]:
+    timings = {"total": {"wall_time": result["wall_time"]}}
+    timings.update({name: {"wall_time": duration} for name, duration in result["stages"].items()})
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark a full export against a local stub C2C API")
+    parser.add_argument(
+        "--doc-type", default="routes", choices=("routes", "waypoints", "outings"), help="Searched document type"
+    )
+    parser.add_argument("--book", action="store_true", help="Export a book (all routes) instead of a search")
+    parser.add_argument(
+        "--cache",
+        default="cold",
+        choices=("none", "cold", "warm"),
+        help="HTTP cache: disabled, empty, or filled by a first untimed export (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Delay between uncached API calls in seconds (default: %(default)s)"
+    )
+    parser.add_argument("-o", "--output", help="Save results as JSON to this file")
+    parser.add_argument("--compare", help="Compare results to a JSON file saved by a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Current/baseline wall time ratio above which a stage is a regression (default: %(default)s)",
+    )
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+
+    if args.output:
+        save_results(args.output, {"export": result})
+
+    if args.compare:
+        baseline = load_results(args.compare)["export"]
+        return int(compare_results(stage_timings(baseline), stage_timings(result), "wall_time", args.threshold))
+
+    return 1 if result["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
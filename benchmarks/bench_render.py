@@ -0,0 +1,179 @@
+"""
+Markdown rendering benchmarks.
+
+Times c2c_markdown.parse_code, clean_and_html and get_document_description over the
+recorded documents of benchmarks/corpus, and over generated stress inputs
+(large L# tables, emoji-dense paragraphs, many wikilinks).
+
+    python benchmarks/bench_render.py -o before.json
+    python benchmarks/bench_render.py -o after.json --compare before.json
+    python benchmarks/bench_render.py record routes/53914 waypoints/37318
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+import c2c_gpx.main
+from c2c_gpx import c2c_markdown as mkd
+from c2c_gpx.records import compact_document
+from c2c_gpx.settings import ExportSettings
+
+from common import compare_results, load_corpus, load_results, record_document, save_results
+
+# measure the renderer itself, not the fallback
+SETTINGS = ExportSettings(render_max_size=None, render_timeout=None)
+
+EMOJIS = (":smile:", ":rock_climbing:", ":sunny:", ":warning:", ":ok_hand:", ":snowflake:", ":skitouring:")
+
+
+def make_ltag_table(rows: int) -> str:
+    lines = ["L#= | longueur | cotation | description"]
+    for i in range(rows):
+        if i % 10 == 9:
+            lines.append("L#~ vire, marcher 20 m à gauche")
+        lines.append(
+            f"L# | {20 + i % 30} m | 6{'abc'[i % 3]} | dalle puis [[routes/{1000 + i}|dièdre]] | relais chaîné"
+        )
+    return "\n".join(lines)
+
+
+def make_emoji_paragraph(words: int) -> str:
+    return " ".join(EMOJIS[i % len(EMOJIS)] if i % 4 == 0 else f"mot{i}" for i in range(words))
+
+
+def make_wikilinks(links: int) -> str:
+    kinds = ("routes", "waypoints", "outings", "articles")
+    return "\n".join(
+        f"Voir [[{kinds[i % 4]}/{10000 + i}/fr/slug-{i}|lien {i}]] et [[{kinds[(i + 1) % 4]}/{20000 + i}]]."
+        for i in range(links)
+    )
+
+
+def stress_inputs(scale: int) -> dict[str, str]:
+    return {
+        "ltag_table": make_ltag_table(200 * scale),
+        "emoji_paragraph": make_emoji_paragraph(2000 * scale),
+        "wikilinks": make_wikilinks(200 * scale),
+    }
+
+
+def document_texts(document_data: dict[str, Any]) -> list[str]:
+    return [
+        v
+        for loc in document_data["locales"]
+        for k, v in loc.items()
+        if k not in ("title", "lang", "version", "topic_id") and isinstance(v, str) and v
+    ]
+
+
+def collect_cases(scale: int) -> dict[str, Callable[[], Any]]:
+    cases: dict[str, Callable[[], Any]] = {}
+
+    for doc_type, documents in load_corpus().items():
+        for document_id, document_data in documents.items():
+            texts = document_texts(document_data)
+            record = compact_document(doc_type, document_data)
+            name = f"{doc_type}/{document_id}"
+            cases[f"parse_code[{name}]"] = lambda texts=texts: [mkd.parse_code(t) for t in texts]
+            cases[f"clean_and_html[{name}]"] = lambda texts=texts: [c2c_gpx.main.clean_and_html(t) for t in texts]
+            cases[f"get_document_description[{name}]"] = lambda doc_type=doc_type, record=record: (
+                c2c_gpx.main.get_document_description(SETTINGS, doc_type, record)
+            )
+
+    for name, text in stress_inputs(scale).items():
+        cases[f"parse_code[stress:{name}]"] = lambda text=text: mkd.parse_code(text)
+        cases[f"clean_and_html[stress:{name}]"] = lambda text=text: c2c_gpx.main.clean_and_html(text)
+
+    return cases
+
+
+def time_case(func: Callable[[], Any], repeat: int, min_time: float) -> dict[str, float]:
+    """Time func, calling it in loops of at least min_time seconds, return per call stats."""
+    func()  # warm up parsers and caches
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    results: dict[str, dict[str, float]] = {}
+    for name, func in collect_cases(args.scale).items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(func, args.repeat, args.min_time)
+        print(f"{name:<55} {results[name]['median'] * 1000:>10.3f} ms")
+
+    if args.output:
+        save_results(args.output, results)
+
+    if args.compare:
+        return int(compare_results(load_results(args.compare), results, "median", args.threshold))
+    return 0
+
+
+def record(args: argparse.Namespace) -> int:
+    for ref in args.documents:
+        doc_type, document_id = ref.strip("/").split("/")[:2]
+        print(f"recorded {record_document(doc_type, int(document_id))}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark C2C markdown rendering")
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record", help="Add documents from the C2C API to the corpus")
+    record_parser.add_argument("documents", nargs="+", help="Documents to record, e.g. routes/53914")
+
+    parser.add_argument("-o", "--output", help="Save results as JSON to this file")
+    parser.add_argument("--compare", help="Compare results to a JSON file saved by a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Current/baseline median ratio above which a benchmark is a regression (default: %(default)s)",
+    )
+    parser.add_argument("-k", "--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed loops (default: %(default)s)")
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="Min duration of one timed loop in seconds (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="Size multiplier of the stress inputs (default: %(default)s)"
+    )
+
+    args = parser.parse_args()
+    if args.command == "record":
+        return record(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
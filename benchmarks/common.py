@@ -0,0 +1,92 @@
+"""Helpers shared by the benchmark scripts."""
+
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+from typing import Any
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+DOC_TYPES = ("routes", "waypoints", "outings")
+
+
+def load_corpus(corpus_dir: str = CORPUS_DIR) -> dict[str, dict[int, dict[str, Any]]]:
+    """Load the recorded documents, as {doc_type: {document_id: document_data}}."""
+    corpus: dict[str, dict[int, dict[str, Any]]] = {}
+    for doc_type in DOC_TYPES:
+        corpus[doc_type] = {}
+        doc_dir = os.path.join(corpus_dir, doc_type)
+        if not os.path.isdir(doc_dir):
+            continue
+        for name in sorted(os.listdir(doc_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(doc_dir, name), encoding="utf-8") as f:
+                document_data = json.load(f)
+            corpus[doc_type][document_data["document_id"]] = document_data
+    return corpus
+
+
+def record_document(doc_type: str, document_id: int, corpus_dir: str = CORPUS_DIR) -> str:
+    """Download a document from the C2C API into the corpus, return its path."""
+    import c2c_gpx.main
+    from c2c_gpx.settings import ExportSettings
+
+    document_data = c2c_gpx.main.get_document_data(
+        ExportSettings(session=c2c_gpx.main.http_session()), doc_type, document_id
+    )
+    os.makedirs(os.path.join(corpus_dir, doc_type), exist_ok=True)
+    path = os.path.join(corpus_dir, doc_type, f"{document_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document_data, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    return path
+
+
+def run_metadata() -> dict[str, Any]:
+    """Describe the environment a benchmark ran in, to be stored next to its results."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "c2c_gpx": importlib.metadata.version("c2c_gpx"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def save_results(path: str, results: dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": run_metadata(), "results": results}, f, indent=2)
+        f.write("\n")
+    print(f"results saved to {path}")
+
+
+def load_results(path: str) -> dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        results: dict[str, Any] = json.load(f)["results"]
+        return results
+
+
+def compare_results(
+    baseline: dict[str, dict[str, float]], results: dict[str, dict[str, float]], key: str, threshold: float
+) -> bool:
+    """Print current results against baseline ones, return True if any of them regressed above threshold."""
+    regressed = False
+    print(f"{'benchmark':<45} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, stats in results.items():
+        if name not in baseline:
+            print(f"{name:<45} {'-':>12} {stats[key]:>12.6f} {'-':>7}")
+            continue
+        ratio = stats[key] / baseline[name][key] if baseline[name][key] else float("inf")
+        flag = " !" if ratio > threshold else ""
+        regressed |= ratio > threshold
+        print(f"{name:<45} {baseline[name][key]:>12.6f} {stats[key]:>12.6f} {ratio:>7.2f}{flag}")
+    return regressed
@@ -0,0 +1,147 @@
+"""
+Load test of the export server (c2c_gpx.server) against the local stub C2C API.
+
+Starts benchmarks/stub_api.py in a separate process and the export server in this one,
+then runs --users concurrent clients, each requesting --requests exports in a row.
+Reports the time to first byte and the duration of the exports (p50, p95, max), and
+the throughput in exports and waypoints per second.
+
+    python benchmarks/load_test.py --users 8 --requests 5 --copies 20 --latency 0.02
+    python benchmarks/load_test.py --users 8 --requests 5 --copies 20 --latency 0.02 --cache warm
+"""
+
+import argparse
+import asyncio
+import http.client
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from urllib.parse import quote
+
+import c2c_gpx.main
+from c2c_gpx.server import ExportService
+from c2c_gpx.settings import ExportSettings
+
+from bench_export import serve_stub
+from common import save_results
+from stub_api import add_stub_arguments
+
+
+def start_server(settings: ExportSettings) -> int:
+    """Run the export server in a background event loop, return its port."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(ExportService(settings=settings).start("127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    port: int = server.sockets[0].getsockname()[1]
+    return port
+
+
+def request_export(port: int, url: str) -> dict[str, Any]:
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    try:
+        connection.request("GET", f"/export?url={quote(url)}")
+        response = connection.getresponse()
+        first_chunk = response.read1()
+        first_byte = time.perf_counter() - start
+        body = first_chunk + response.read()
+    finally:
+        connection.close()
+    return {
+        "status": response.status,
+        "first_byte": first_byte,
+        "duration": time.perf_counter() - start,
+        "waypoints": body.count(b"<wpt "),
+        "bytes": len(body),
+    }
+
+
+def quantiles(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    ports: multiprocessing.Queue[int] = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub, args=(args, ports), daemon=True)
+    stub.start()
+    c2c_gpx.main.API_BASE_URL = f"http://127.0.0.1:{ports.get(timeout=30)}"
+    c2c_gpx.main.delay = args.delay
+    url = f"{c2c_gpx.main.BASE_URL}/{args.doc_type}?bbox=600000,5700000,800000,5800000"
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            session = c2c_gpx.main.http_session(os.path.join(tmpdir, "c2c_cache") if args.cache != "none" else None)
+            port = start_server(ExportSettings(session=session))
+            if args.cache == "warm":
+                request_export(port, url)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.users) as executor:
+                results = list(executor.map(lambda _: request_export(port, url), range(args.users * args.requests)))
+            wall_time = time.perf_counter() - start
+            session.close()
+    finally:
+        stub.terminate()
+
+    return {
+        "users": args.users,
+        "exports": len(results),
+        "errors": sum(result["status"] != 200 for result in results),
+        "wall_time": wall_time,
+        "exports_per_second": len(results) / wall_time,
+        "waypoints_per_second": sum(result["waypoints"] for result in results) / wall_time,
+        "first_byte": quantiles([result["first_byte"] for result in results]),
+        "duration": quantiles([result["duration"] for result in results]),
+    }
+
+
+def print_report(result: dict[str, Any]) -> None:
+    print(f"exports:              {result['exports']} by {result['users']} users, {result['errors']} errors")
+    print(f"wall time:            {result['wall_time']:.3f} s")
+    print(f"exports / second:     {result['exports_per_second']:.2f}")
+    print(f"waypoints / second:   {result['waypoints_per_second']:.1f}")
+    for name in ("first_byte", "duration"):
+        values = result[name]
+        print(f"{name + ' (s)':<21} p50 {values['p50']:.3f}  p95 {values['p95']:.3f}  max {values['max']:.3f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the export server against a local stub C2C API")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent clients (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=3, help="Exports per client (default: %(default)s)")
+    parser.add_argument(
+        "--doc-type", default="routes", choices=("routes", "waypoints", "outings"), help="Searched document type"
+    )
+    parser.add_argument(
+        "--cache",
+        default="cold",
+        choices=("none", "cold", "warm"),
+        help="HTTP cache: disabled, empty, or filled by a first untimed export (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Delay between uncached API calls in seconds (default: %(default)s)"
+    )
+    parser.add_argument("-o", "--output", help="Save results as JSON to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.output:
+        save_results(args.output, {"load_test": result})
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
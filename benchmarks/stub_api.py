@@ -0,0 +1,235 @@
+"""
+Local stub of the C2C API, replaying the documents of benchmarks/corpus.
+
+Serves search pages (/routes?offset=...&limit=...), documents (/routes/{id}) and
+books (/books/{id}, associated with every route), with configurable latency, jitter,
+error and rate limiting (429) rates. Search filters are ignored, the language parameters
+are not: documents have only their locale in l, or the one in cook (or their first one)
+with its texts rendered to HTML in cooked, as the API does, and search results only the
+one in pl (or their first one).
+
+Request counters are available at /_stats.
+
+    python benchmarks/stub_api.py --port 8080 --latency 0.05 --copies 100
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+from c2c_gpx.c2c_markdown import parse_code
+
+from common import load_corpus
+
+# ids of the copies of a document are shifted by multiples of this offset
+COPY_ID_OFFSET = 100_000_000
+
+LISTING_FIELDS = (
+    "document_id",
+    "version",
+    "type",
+    "activities",
+    "waypoint_type",
+    "elevation",
+    "elevation_min",
+    "elevation_max",
+    "global_rating",
+    "rock_free_rating",
+    "orientations",
+    "date_start",
+    "areas",
+    "available_langs",
+)
+# locale fields that are not rendered in cooked
+LOCALE_METADATA = ("lang", "title", "version", "topic_id")
+
+
+class StubApi:
+    def __init__(
+        self,
+        copies: int = 1,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.corpus = load_corpus()
+        self.copies = copies
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: dict[str, int] = {}
+        self.cooked: dict[tuple[str, int, str], dict[str, Any]] = {}
+
+        self.ids = {
+            doc_type: [doc_id + i * COPY_ID_OFFSET for i in range(copies) for doc_id in sorted(documents)]
+            for doc_type, documents in self.corpus.items()
+        }
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def get_document(
+        self, doc_type: str, document_id: int, lang: str | None = None, cook: str | None = None
+    ) -> dict[str, Any] | None:
+        copy, original_id = divmod(document_id, COPY_ID_OFFSET)
+        document = self.corpus.get(doc_type, {}).get(original_id)
+        if document is None or copy >= self.copies:
+            return None
+        if lang is not None:
+            document = {**document, "locales": [loc for loc in document["locales"] if loc["lang"] == lang]}
+        elif cook is not None and (locales := document["locales"]):
+            locale = next((loc for loc in locales if loc["lang"] == cook), locales[0])
+            document = {**document, "locales": [locale], "cooked": self.cook(doc_type, original_id, locale)}
+        return {**document, "document_id": document_id}
+
+    def cook(self, doc_type: str, document_id: int, locale: dict[str, Any]) -> dict[str, Any]:
+        """The texts of a locale rendered to HTML, as in the cooked field of the API documents."""
+        key = (doc_type, document_id, locale["lang"])
+        with self.lock:
+            cooked = self.cooked.get(key)
+        if cooked is None:
+            cooked = {
+                k: parse_code(v) if isinstance(v, str) and k not in LOCALE_METADATA else v for k, v in locale.items()
+            }
+            with self.lock:
+                self.cooked[key] = cooked
+        return cooked
+
+    def search(self, doc_type: str, offset: int, limit: int, lang: str | None = None) -> dict[str, Any]:
+        ids = self.ids[doc_type]
+        documents = []
+        for document_id in ids[offset : offset + limit]:
+            document = self.get_document(doc_type, document_id)
+            assert document is not None
+            listing = {k: document[k] for k in LISTING_FIELDS if k in document}
+            locales = [
+                {"lang": loc["lang"], "title": loc["title"], "version": loc.get("version")}
+                for loc in document["locales"]
+            ]
+            if lang is not None:
+                locales = [next((loc for loc in locales if loc["lang"] == lang), locales[0])]
+            listing["locales"] = locales
+            if geometry := document.get("geometry"):
+                # the search results have the point, not the detailed geometry
+                listing["geometry"] = {"geom": geometry.get("geom"), "version": geometry.get("version")}
+            documents.append(listing)
+        return {"documents": documents, "total": len(ids)}
+
+    def book(self, book_id: int) -> dict[str, Any]:
+        routes = [{"document_id": document_id} for document_id in self.ids["routes"]]
+        return {"document_id": book_id, "associations": {"routes": routes}}
+
+    def handle(self, path: str, query: dict[str, list[str]]) -> tuple[int, dict[str, str], Any]:
+        """Return (status, headers, json body) for a request."""
+        parts = path.strip("/").split("/")
+
+        if parts == ["_stats"]:
+            with self.lock:
+                return 200, {}, dict(self.stats)
+
+        kind = "search" if len(parts) == 1 else ("book" if parts[0] == "books" else "document")
+        self.count(f"requests.{kind}")
+
+        with self.lock:
+            draw = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+
+        if draw < self.rate_limit_rate:
+            self.count("status.429")
+            return 429, {"Retry-After": "1"}, {"status": "error", "errors": [{"description": "Too many requests"}]}
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.count("status.500")
+            return 500, {}, {"status": "error", "errors": [{"description": "Internal server error"}]}
+
+        body: Any = None
+        if kind == "search" and parts[0] in self.ids:
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["30"])[0])
+            body = self.search(parts[0], offset, limit, query.get("pl", [None])[0])
+        elif kind == "book" and parts[1].isdigit():
+            body = self.book(int(parts[1]))
+        elif kind == "document" and parts[1].isdigit():
+            body = self.get_document(parts[0], int(parts[1]), query.get("l", [None])[0], query.get("cook", [None])[0])
+
+        if body is None:
+            self.count("status.404")
+            return 404, {}, {"status": "error", "errors": [{"description": "Not found"}]}
+
+        self.count("status.200")
+        return 200, {}, body
+
+
+def make_server(api: StubApi, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            parsed = urlparse(self.path)
+            status, headers, body = api.handle(parsed.path, parse_qs(parsed.query))
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Serve each corpus document N times (default: %(default)s)"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="Response latency in seconds (default: %(default)s)")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Max latency variation in seconds (default: %(default)s)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Ratio of 500 responses (default: %(default)s)")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="Ratio of 429 responses (default: %(default)s)"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and error draws")
+
+
+def stub_from_args(args: argparse.Namespace) -> StubApi:
+    return StubApi(
+        copies=args.copies,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the benchmark corpus as a stub C2C API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(stub_from_args(args), args.host, args.port)
+    print(f"stub C2C API listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Export camptocamp.org documents to GPX, GeoJSON, KML and CSV (see c2c_gpx.exporter for the Python API)."""
+
+from .exporter import Exporter
+
+__all__ = ["Exporter"]
@@ -2,7 +2,11 @@ import markdown
 import bleach
 import bleach.css_sanitizer
 import secrets
+import signal
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from threading import RLock
 
 from .wikilinks import C2CWikiLinkExtension
@@ -49,6 +53,45 @@ value of _iframe_secret_tag present into server memory.
 """
 
 
+class RenderBudgetExceeded(Exception):
+    """
+    Raised by parse_code() when a text is bigger than max_size, or when its
+    parsing takes more than timeout seconds.
+    """
+
+
+@contextmanager
+def time_budget(timeout):
+    """
+    Interrupt the enclosed code after timeout seconds.
+
+    Regex engine checks for signals while matching, so SIGALRM is able to stop
+    a catastrophic backtracking. Signals can only be handled by the main
+    thread : elsewhere (e.g. in the workers of the export server), nothing
+    interrupts the enclosed code, and the budget is only checked once it is
+    over. There, only max_size of parse_code() bounds the parsing time.
+    """
+    if (not timeout or not hasattr(signal, "setitimer") or
+            threading.current_thread() is not threading.main_thread()):
+        start = time.perf_counter()
+        yield
+        if timeout and time.perf_counter() - start > timeout:
+            raise RenderBudgetExceeded(
+                f"parsing took more than {timeout}s")
+        return
+
+    def handler(signum, frame):
+        raise RenderBudgetExceeded(f"parsing took more than {timeout}s")
+
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
 def _get_cleaner():
     global _cleaner
 
@@ -149,11 +192,21 @@ def _get_markdown_parser():
     return _markdown_parser
 
 
-def parse_code(text):
+def parse_code(text, max_size=None, timeout=None, preprocess=None):
     """
     Get markdown, and returns HTML.
     This function is thread-safe
+
+    preprocess(text), if given, rewrites the text before parsing, within the
+    same time budget. Raises RenderBudgetExceeded if text is longer than
+    max_size characters, or if parsing takes more than timeout seconds (see
+    time_budget() for the threads other than the main one).
     """
+    global _markdown_parser, _cleaner
+
+    if max_size is not None and len(text) > max_size:
+        raise RenderBudgetExceeded(
+            f"text is longer than {max_size} characters")
 
     # we need parsing to be thread safe because
     # L numbering, and Markdown() has internal global variables
@@ -170,11 +223,20 @@ def parse_code(text):
         parser.reset()
 
         try:
-            text = parser.convert(text)
-
-            # we keep clean function into thread safe part,
-            # because we are not sure of this function
-            text = cleaner.clean(text=text)
+            with time_budget(timeout):
+                if preprocess is not None:
+                    text = preprocess(text)
+                text = parser.convert(text)
+
+                # we keep clean function into thread safe part,
+                # because we are not sure of this function
+                text = cleaner.clean(text=text)
+        except RenderBudgetExceeded:
+            # parser or cleaner has been interrupted anywhere, do not trust
+            # their state
+            _markdown_parser = None
+            _cleaner = None
+            raise
         except Exception as e:
             logger.exception("While parsing markdown", exc_info=e)
             text = _PARSER_EXCEPTION_MESSAGE
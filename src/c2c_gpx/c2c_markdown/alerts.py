@@ -3,6 +3,8 @@ from markdown.blockprocessors import BlockProcessor
 from xml.etree import ElementTree  # nosec
 import re
 
+from .prefilter import has_marker, ALERT
+
 
 class AlertProcessor(BlockProcessor):
     RE = re.compile(r'(^|\n)[ ]{0,3}(!{2,4})(([^!]|$).*)')
@@ -14,7 +16,8 @@ class AlertProcessor(BlockProcessor):
     }
 
     def test(self, parent, block):
-        return bool(self.RE.search(block))
+        return (has_marker(self.parser, block, ALERT) and
+                bool(self.RE.search(block)))
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
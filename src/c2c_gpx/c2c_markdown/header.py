@@ -4,6 +4,8 @@ from xml.etree import ElementTree  # nosec
 import re
 import logging
 
+from .prefilter import has_marker, HEADER
+
 logger = logging.getLogger('MARKDOWN')
 
 
@@ -20,7 +22,8 @@ class C2CHeaderProcessor(BlockProcessor):
                     r'(\n|$)')
 
     def test(self, parent, block):
-        return bool(self.RE.search(block))
+        return (has_marker(self.parser, block, HEADER) and
+                bool(self.RE.search(block)))
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
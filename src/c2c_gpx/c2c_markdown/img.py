@@ -13,6 +13,8 @@ from xml.etree import ElementTree  # nosec
 
 import re
 
+from .prefilter import has_marker, IMAGE
+
 # \w\W pattern is a trick for capturing all, including new spaces
 IMG_RE = r'(?:^|\n)\[img=(\d+)([a-z_ ]*)(/\]|\]([\w\W]*?)\[/img\])'
 
@@ -35,7 +37,8 @@ class C2CImageBlock(BlockProcessor):
         self.config = config
 
     def test(self, parent, block):
-        return bool(self.RE.search(block))
+        return (has_marker(self.parser, block, IMAGE) and
+                bool(self.RE.search(block)))
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
@@ -13,6 +13,8 @@ from markdown.treeprocessors import Treeprocessor
 from xml.etree import ElementTree  # nosec
 import re
 
+from .prefilter import has_marker, LTAG
+
 
 def _pairwise(iterable):
     """
@@ -230,7 +232,8 @@ class LTagProcessor(BlockProcessor):
     CELL_SEPARATOR = '__--|--__'
 
     def test(self, parent, block):
-        return bool(self.RE_TESTER.search(block))
+        return (has_marker(self.parser, block, LTAG) and
+                bool(self.RE_TESTER.search(block)))
 
     def run(self, parent, blocks):
 
@@ -0,0 +1,51 @@
+'''
+c2corg block prefilter for Python-Markdown
+==============================================
+
+BlockParser calls test() on every block processor for every block, and each
+C2C processor starts with its own regex search over the whole block.
+
+This module scans a block once for the line-start markers of all C2C block
+syntaxes (headers, L#, alerts, images, videos, [p]). Processors check the
+marker set first, and only run their own regex when their marker is present.
+Plain text blocks are rejected by a single scan.
+'''
+
+import re
+
+HEADER = 'header'
+LTAG = 'ltag'
+ALERT = 'alert'
+IMAGE = 'image'
+VIDEO = 'video'
+PTAG = 'ptag'
+
+# Each alternative is a necessary condition of the matching processor RE,
+# so a missing marker means the processor test() would have failed.
+MARKERS_RE = re.compile(r'^(?:'
+                        r'(?P<header>#)'
+                        r'|(?P<image>\[img=\d)'
+                        r'|(?P<video>\[video\])'
+                        r'|(?P<ptag>\[p\])'
+                        r'|[ ]{0,3}(?:(?P<ltag>[LR]#)|(?P<alert>!!))'
+                        r')', re.MULTILINE)
+
+
+def get_block_markers(parser, block):
+    """
+    Returns the set of C2C markers present in block.
+
+    All processors are tested on the same block string in a row, so the last
+    result is cached on the parser.
+    """
+    cached = getattr(parser, '_c2c_block_markers', None)
+    if cached is not None and cached[0] is block:
+        return cached[1]
+
+    markers = frozenset(m.lastgroup for m in MARKERS_RE.finditer(block))
+    parser._c2c_block_markers = (block, markers)
+    return markers
+
+
+def has_marker(parser, block, marker):
+    return marker in get_block_markers(parser, block)
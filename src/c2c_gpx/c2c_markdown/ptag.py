@@ -10,6 +10,8 @@ from markdown.blockprocessors import BlockProcessor
 from xml.etree import ElementTree  # nosec
 import re
 
+from .prefilter import has_marker, PTAG
+
 P_RE = r'(?:\n|^)\[p\](?:\n|$)'
 
 
@@ -25,7 +27,8 @@ class C2CPTag(BlockProcessor):
     RE = re.compile(P_RE)
 
     def test(self, parent, block):
-        return bool(self.RE.search(block))
+        return (has_marker(self.parser, block, PTAG) and
+                bool(self.RE.search(block)))
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
@@ -10,6 +10,8 @@ from markdown.blockprocessors import BlockProcessor
 from xml.etree import ElementTree  # nosec
 import re
 
+from .prefilter import has_marker, VIDEO
+
 
 class C2CVideoExtension(Extension):
     def __init__(self, *args, **kwargs):
@@ -45,7 +47,8 @@ class C2CVideoBlock(BlockProcessor):
                              r"\[/video\]")
 
     def test(self, parent, block):
-        return bool(self.RE.search(block))
+        return (has_marker(self.parser, block, VIDEO) and
+                bool(self.RE.search(block)))
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
@@ -0,0 +1,65 @@
+"""Minification of the generated HTML descriptions, enabled with the --compact flag."""
+
+import re
+
+BLOCK_TAGS = "p|hr|h[1-6]|table|tbody|thead|tr|td|th|ul|ol|li|div|blockquote|pre"
+
+# <pre> blocks, where whitespace is meaningful
+PRE_RE = re.compile(r"(<pre\b.*?</pre>)", re.DOTALL | re.IGNORECASE)
+SPACES_RE = re.compile(r"\s+")
+SPACES_AROUND_BLOCKS_RE = re.compile(rf"\s*(</?(?:{BLOCK_TAGS})\b[^>]*>)\s*", re.IGNORECASE)
+# a chain of line breaks (including the </br> typo), with the block tags around it
+LINE_BREAKS_RE = re.compile(
+    rf"(?P<before></?(?:{BLOCK_TAGS})\b[^>]*>)?(?:</?br\s*/?>)+(?P<after></?(?:{BLOCK_TAGS})\b)?", re.IGNORECASE
+)
+# attributes only used by the camptocamp.org stylesheets and scripts, but the id of the headings (the [toc] anchors)
+SITE_ATTRIBUTE_RE = re.compile(
+    r'(<(?!h[1-6]\b)[a-z][a-z0-9]*\b[^<>]*?)\s+id="[^"<>]*"|(<[a-z][a-z0-9]*\b[^<>]*?)\s+(?:translate|c2c:[a-z-]+)="[^"<>]*"'
+)
+EMPTY_PARAGRAPH_RE = re.compile(r"<p>(?:\s|&nbsp;)*</p>")
+# a heading followed by the end of the text, a rule or another heading
+HEADING_RE = re.compile(r'<h([1-6])(?: id="[^"<>]*")?>[^<]*</h\1>(?=$|<hr>|<h([1-6])[ >])')
+# the lang and title slug of a document URL: https://www.camptocamp.org/routes/53914/fr/dalle-du-jour
+C2C_URL_SLUG_RE = re.compile(r"(https://www\.camptocamp\.org/[a-z]+/\d+)/[a-z]{2}(?:/[^\"'<>\s]*)?(?=[\"'<>\s])")
+
+
+def _line_breaks(match: re.Match[str]) -> str:
+    before, after = match["before"] or "", match["after"] or ""
+    # line breaks next to a block are not displayed
+    if before or after:
+        return before + after
+    return "<br/>"
+
+
+def _empty_section(match: re.Match[str]) -> str:
+    # a heading is empty when the next one is not a subheading
+    next_level = match[2]
+    if next_level is None or int(next_level) <= int(match[1]):
+        return ""
+    return match[0]
+
+
+def _minify_text(text: str) -> str:
+    text = SPACES_RE.sub(" ", text)
+    while True:
+        text, count = SITE_ATTRIBUTE_RE.subn(lambda m: m[1] or m[2], text)
+        if not count:
+            break
+    text = SPACES_AROUND_BLOCKS_RE.sub(r"\1", text)
+    text = LINE_BREAKS_RE.sub(_line_breaks, text)
+    text = EMPTY_PARAGRAPH_RE.sub("", text)
+    return text
+
+
+def minify_html(text: str) -> str:
+    """
+    Minify an HTML description: collapse whitespace and line break chains, drop empty
+    paragraphs and sections, camptocamp.org site attributes, and the lang and title slug
+    of camptocamp.org URLs.
+    """
+    text = C2C_URL_SLUG_RE.sub(r"\1", text)
+    parts = PRE_RE.split(text)
+    # odd parts are <pre> blocks
+    text = "".join(part if i % 2 else _minify_text(part) for i, part in enumerate(parts))
+    text = HEADING_RE.sub(_empty_section, text)
+    return text.strip()
@@ -0,0 +1,122 @@
+"""
+Cache of the finished exports of the export server, by canonical search URL.
+
+Search URLs that find the same documents get the same key: parameters are sorted,
+paging parameters dropped, the bbox rounded to the meter and the values of the list
+filters (activities, areas...) sorted. Finished GPX files are stored in a directory
+with an index of their key, size and time: a repeated export is served from disk
+while it is fresher than max_age, and the least recently used files are evicted
+beyond max_bytes.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, BinaryIO
+from urllib.parse import urlencode
+
+from .filters import FILTERS
+from .resolvers import collection_of
+
+# search parameters that do not change the set of found documents
+PAGING_PARAMS = ("limit", "offset")
+
+
+def canonical_search(doc_type: str, params: dict[str, Any]) -> str:
+    """Canonical form of the search of doc_type with params, e.g. routes?act=rock_climbing%2Cskitouring&bbox=..."""
+    if (collection := collection_of(doc_type)) is not None:
+        # without the language and title of the collection URL
+        doc_type = f"{collection[0]}/{collection[1]}"
+    filters = FILTERS.get(doc_type, {})
+    canonical = []
+    for key, value in params.items():
+        if key in PAGING_PARAMS:
+            continue
+        values = value if isinstance(value, list) else str(value).split(",")
+        values = [v.strip() for v in values if v.strip()]
+        if key == "bbox":
+            with contextlib.suppress(ValueError):  # left to the API
+                values = [str(round(float(v))) for v in values]
+        elif key in filters and filters[key].kind == "any":
+            values = sorted(set(values))
+        canonical.append((key, ",".join(values)))
+    return f"{doc_type}?{urlencode(sorted(canonical))}"
+
+
+class ExportCache:
+    """Finished exports, stored as {directory}/{sha256 of the key}.gpx, with an index.json of their entries."""
+
+    def __init__(self, directory: str, max_age: float = 86400.0, max_bytes: int | None = None) -> None:
+        self.directory = directory
+        self.max_age = max_age  # in seconds, older exports are run again
+        self.max_bytes = max_bytes  # total size of the files, None for no limit
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                # key: {"file", "size", "time" (of the export), "used" (last time served), "waypoints"}
+                self.index: dict[str, dict[str, Any]] = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".gpx")
+
+    def get(self, key: str) -> tuple[str, dict[str, Any]] | None:
+        """Path and entry of the fresh export of key, or None."""
+        entry = self.index.get(key)
+        if entry is None or time.time() - entry["time"] > self.max_age:
+            return None
+        path = os.path.join(self.directory, entry["file"])
+        if not os.path.exists(path):
+            del self.index[key]
+            return None
+        entry["used"] = time.time()
+        return path, entry
+
+    def open(self, key: str) -> BinaryIO:
+        """Temporary file for a new export of key, stored by commit() once complete."""
+        # unique, as the same search can be exported by concurrent requests
+        return open(f"{self._path(key)}.{uuid.uuid4().hex[:8]}.tmp", "wb")
+
+    def commit(self, key: str, file: BinaryIO, waypoints: int) -> None:
+        file.close()
+        path = self._path(key)
+        os.replace(file.name, path)
+        now = time.time()
+        self.index[key] = {
+            "file": os.path.basename(path),
+            "size": os.path.getsize(path),
+            "time": now,
+            "used": now,
+            "waypoints": waypoints,
+        }
+        self._evict()
+        self.save_index()
+
+    def discard(self, file: BinaryIO) -> None:
+        file.close()
+        os.remove(file.name)
+
+    def _evict(self) -> None:
+        """Remove the expired exports, then the least recently used ones beyond max_bytes."""
+        now = time.time()
+        entries = sorted(self.index.items(), key=lambda item: item[1]["used"])
+        total = sum(entry["size"] for _, entry in entries)
+        for key, entry in entries:
+            expired = now - entry["time"] > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                continue
+            del self.index[key]
+            total -= entry["size"]
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, entry["file"]))
+
+    def save_index(self) -> None:
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,128 @@
+"""
+Python API of c2c_gpx.
+
+    from c2c_gpx import Exporter
+
+    exporter = Exporter(detail="summary", compact=True)
+    for waypoint in exporter.waypoints("https://www.camptocamp.org/routes?act=rock_climbing&bbox=..."):
+        print(waypoint.name, waypoint.latitude, waypoint.longitude)
+
+    with open("guidebook.kml", "w", encoding="utf-8") as f:
+        exporter.write(f, "https://www.camptocamp.org/books/57964", format="kml")
+
+Importing c2c_gpx has no side effect: nothing is cached or configured until an
+Exporter is created or the c2c_gpx command runs. An exporter keeps its HTTP session
+(and cache), the markdown renderer and its local index between exports, so that a
+long-running service pays their setup once.
+
+Each exporter passes its own ExportSettings to the functions of c2c_gpx.main, so that
+exporters with different settings can run at the same time. Exports print nothing:
+their progress and warnings are logged to the c2c_gpx logger.
+"""
+
+import datetime
+from collections.abc import Iterator
+from typing import IO, Any
+
+from . import main
+from .records import DocumentRecord
+from .resolvers import Versions
+from .scheduler import RateLimiter
+from .settings import ExportReport, ExportSettings
+from .spatial_index import SpatialIndex
+from .writers import WRITERS, ExportMetadata, Waypoint
+
+
+class Exporter:
+    """
+    Exports camptocamp.org searches and collections (books, areas, profiles) as waypoints.
+
+    http_cache is the SQLite file caching the API responses (None for no cache), delay a
+    longer duration (in seconds) between the API calls of this exporter sent to the network
+    (those of all the exports of the process stay spaced by c2c_gpx.main.delay), and
+    workers the number of threads resolving the URLs and fetching the documents. The other
+    settings are those of the c2c_gpx command options of the same name, langs being a tuple,
+    e.g. ("en", "fr"). The report of the last export (texts exported as plain text...) is
+    kept in report.
+    """
+
+    def __init__(
+        self,
+        http_cache: str | None = "c2c_cache",
+        detail: str = "full",
+        compact: bool = False,
+        max_description_bytes: int | None = None,
+        tracks: bool = False,
+        track_tolerance: float = 10.0,
+        local_index: str | None = None,
+        delay: float | None = None,
+        workers: int = 4,
+        langs: tuple[str, ...] = ExportSettings.langs,
+    ) -> None:
+        if detail not in main.DETAIL_LEVELS:
+            raise ValueError(f"unknown detail {detail!r}, choose among {', '.join(main.DETAIL_LEVELS)}")
+        if not langs or any(lang not in main.LANGS for lang in langs):
+            raise ValueError(f"unknown languages {langs!r}, choose among {', '.join(main.LANGS)}")
+        self.settings = ExportSettings(
+            session=main.http_session(http_cache),
+            rate_limiter=RateLimiter(delay, parent=main.api_rate_limiter) if delay is not None else None,
+            langs=tuple(langs),
+            detail=detail,
+            description_budget=max_description_bytes,
+            compact=compact,
+            spatial_index=SpatialIndex(local_index) if local_index is not None else None,
+            record_tracks=tracks,
+        )
+        self.track_tolerance = track_tolerance
+        self.workers = max(1, workers)
+        self.report = ExportReport()
+
+    def close(self) -> None:
+        if self.settings.session is not None:
+            self.settings.session.close()
+        if self.settings.spatial_index is not None:
+            self.settings.spatial_index.close()
+
+    def __enter__(self) -> "Exporter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def documents(self, *urls: str) -> dict[str, Versions]:
+        """IDs and versions of the documents of search and collection URLs, by type, each document once."""
+        return main.get_collection_versions(self.settings, list(urls), self.workers)
+
+    def waypoints(self, *urls: str) -> Iterator[Waypoint]:
+        """
+        Waypoints of the documents of search and collection URLs, rendered one at a time
+        while the next documents are fetched by the workers.
+        """
+        settings = self.settings.new_export()
+        self.report = settings.report
+        documents = [
+            (doc_type, document_id)
+            for doc_type, versions in main.get_collection_versions(settings, list(urls), self.workers).items()
+            for document_id in versions
+        ]
+        for doc_type, _, data in main.fetch_records(settings, documents, self.workers):
+            assert data is not None
+            yield self._waypoint(settings, doc_type, data)
+
+    def _waypoint(self, settings: ExportSettings, doc_type: str, data: DocumentRecord) -> Waypoint:
+        waypoint = main.create_waypoint(settings, doc_type, data)
+        if self.settings.record_tracks:
+            waypoint.track = main.get_tracks([data], self.track_tolerance).get(data.document_id)
+        return waypoint
+
+    def write(self, stream: IO[str], *urls: str, format: str = "gpx") -> int:
+        """Write the waypoints of the URLs to a text stream in format (gpx, geojson, kml or csv), return their count."""
+        if format not in WRITERS:
+            raise ValueError(f"unknown format {format!r}, choose among {', '.join(WRITERS)}")
+        metadata = ExportMetadata(
+            description="created with c2c-gpx v" + main.__version__, link=urls[0], time=datetime.datetime.now()
+        )
+        with WRITERS[format](str(getattr(stream, "name", f"<{format}>")), metadata, stream) as writer:
+            for waypoint in self.waypoints(*urls):
+                writer.write(waypoint)
+        return writer.count
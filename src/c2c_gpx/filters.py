@@ -0,0 +1,121 @@
+"""
+Local evaluation of the common search filters of camptocamp.org, on the search results
+stored in the local index (--local-index).
+
+Each supported URL parameter is read as the API reads it: a comma separated list of
+values, of which a document must have one, or a "min,max" range, inclusive, of
+numbers or of ratings in their C2C order. Documents without the filtered field do not
+match. Other parameters (u, date...) are left to the API.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+GLOBAL_RATINGS = (
+    "F", "F+", "PD-", "PD", "PD+", "AD-", "AD", "AD+", "D-", "D", "D+", "TD-", "TD", "TD+",
+    "ED-", "ED", "ED+", "ED4", "ED5", "ED6", "ED7",
+)  # fmt: skip
+CLIMBING_RATINGS = (
+    "2", "3a", "3b", "3c", "4a", "4b", "4c", "5a", "5a+", "5b", "5b+", "5c", "5c+",
+    "6a", "6a+", "6b", "6b+", "6c", "6c+", "7a", "7a+", "7b", "7b+", "7c", "7c+",
+    "8a", "8a+", "8b", "8b+", "8c", "8c+", "9a", "9a+", "9b", "9b+", "9c", "9c+",
+)  # fmt: skip
+
+
+@dataclass(frozen=True)
+class Filter:
+    """A search parameter, on field of the search results: one of values (kind "any") or a range."""
+
+    field: str
+    kind: str  # any, range
+    ratings: tuple[str, ...] | None = None  # order of the values of a rating range, None for numbers
+
+    def parse(self, value: Any) -> tuple[Any, ...]:
+        values = value if isinstance(value, list) else str(value).split(",")
+        values = [v.strip() for v in values if v.strip()]
+        if self.kind == "any":
+            return tuple(sorted(values))
+        low, high = values
+        if self.ratings is None:
+            return float(low), float(high)
+        return self.ratings.index(low), self.ratings.index(high)
+
+    def _value(self, document: dict[str, Any]) -> Any:
+        value = document.get(self.field)
+        if self.field == "areas":
+            return [area["document_id"] for area in value or []]
+        if self.ratings is not None and value is not None:
+            return self.ratings.index(value) if value in self.ratings else None
+        return value
+
+    def matches(self, document: dict[str, Any], parsed: tuple[Any, ...]) -> bool:
+        value = self._value(document)
+        if value is None:
+            return False
+        if self.kind == "any":
+            values = value if isinstance(value, list) else [value]
+            return any(str(v) in parsed for v in values)
+        low, high = parsed
+        return bool(low <= value <= high)
+
+    def implies(self, parsed: tuple[Any, ...], other: tuple[Any, ...]) -> bool:
+        """True if the documents matching parsed all match other."""
+        if self.kind == "any":
+            return set(parsed) <= set(other)
+        return bool(other[0] <= parsed[0] and parsed[1] <= other[1])
+
+
+# supported parameters, by document type
+FILTERS: dict[str, dict[str, Filter]] = {
+    "routes": {
+        "act": Filter("activities", "any"),
+        "fac": Filter("orientations", "any"),
+        "a": Filter("areas", "any"),
+        "grat": Filter("global_rating", "range", GLOBAL_RATINGS),
+        "frat": Filter("rock_free_rating", "range", CLIMBING_RATINGS),
+        "rmina": Filter("elevation_min", "range"),
+        "rmaxa": Filter("elevation_max", "range"),
+    },
+    "waypoints": {
+        "wtyp": Filter("waypoint_type", "any"),
+        "a": Filter("areas", "any"),
+        "walt": Filter("elevation", "range"),
+    },
+    "outings": {
+        "act": Filter("activities", "any"),
+        "a": Filter("areas", "any"),
+    },
+}
+
+# fields of the search results kept in the local index
+INDEXED_FIELDS = sorted({f.field for filters in FILTERS.values() for f in filters.values()})
+
+LocalFilters = dict[str, tuple[Any, ...]]
+
+
+def split_filters(doc_type: str, params: dict[str, Any]) -> tuple[LocalFilters, dict[str, Any]]:
+    """Split search parameters into the parsed filters evaluated locally and the others."""
+    supported = FILTERS.get(doc_type, {})
+    local: LocalFilters = {}
+    remote: dict[str, Any] = {}
+    for key, value in params.items():
+        if key in supported:
+            try:
+                local[key] = supported[key].parse(value)
+                continue
+            except ValueError:
+                # not understood, such as an unknown rating, the API decides
+                pass
+        remote[key] = value
+    return local, remote
+
+
+def matches(doc_type: str, document: dict[str, Any], local: LocalFilters) -> bool:
+    filters = FILTERS.get(doc_type, {})
+    return all(filters[key].matches(document, parsed) for key, parsed in local.items())
+
+
+def implies(doc_type: str, local: LocalFilters, other: LocalFilters) -> bool:
+    """True if the documents matching the local filters all match the other ones."""
+    filters = FILTERS.get(doc_type, {})
+    return all(key in local and filters[key].implies(local[key], parsed) for key, parsed in other.items())
@@ -0,0 +1,236 @@
+"""
+Thumbnails of the images referenced in descriptions, enabled with the --images flag.
+
+Images are downloaded concurrently under a global rate limit, shrunk when Pillow is
+installed (pip install c2c_gpx[images]), and stored in an on-disk cache addressed by
+the SHA-256 of their content, so that repeated exports do not download them again.
+The camptocamp.org image links of the rendered descriptions are then replaced by
+the thumbnails, inlined as data URIs or written as sidecar files, within a total
+byte budget.
+"""
+
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from .scheduler import RateLimiter
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from PIL import Image
+else:
+    try:
+        from PIL import Image
+    except ImportError:  # optional dependency, thumbnails are then used as served by camptocamp.org
+        Image = None
+
+logger = logging.getLogger(__name__)
+
+# image references of the markdown texts: [img=781122 right]caption[/img] or [img=781500/]
+IMAGE_REF_RE = re.compile(r"\[img=(\d+)")
+# the links rendered from image references by clean_and_html
+IMAGE_LINK_RE = re.compile(
+    r'<a href="https://media\.camptocamp\.org/c2corg-active/uploads/images/(\d+)\.jpg">\[📸 ?(.*?)\]</a>', re.DOTALL
+)
+# the tags of a sanitized caption, whose text is already escaped
+TAG_RE = re.compile(r"<[^<>]*>")
+
+
+def collect_image_ids(texts: Iterable[str]) -> list[int]:
+    """IDs of the images referenced in texts, without duplicates, in order of appearance."""
+    return list(dict.fromkeys(int(image_id) for text in texts for image_id in IMAGE_REF_RE.findall(text)))
+
+
+class ThumbnailCache:
+    """
+    Thumbnails stored by content hash ({directory}/ab/abcdef....jpg), with an index of
+    the hash of each (image id, size) pair.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index: dict[str, str] = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.jpg")
+
+    def get(self, key: str) -> bytes | None:
+        digest = self.index.get(key)
+        if digest is None:
+            return None
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # a temporary file of its own, the same image may be stored by several threads or processes
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                raise
+        with self._lock:
+            self.index[key] = digest
+        return digest
+
+    def save_index(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+
+
+def make_thumbnail(data: bytes, max_size: int, quality: int = 70) -> bytes:
+    """Shrink an image to fit in max_size x max_size pixels, as a JPEG. Without Pillow, data is returned as is."""
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_size, max_size))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def get_thumbnails(
+    image_ids: list[int],
+    fetch: Callable[[int], bytes],
+    cache: ThumbnailCache,
+    max_size: int,
+    workers: int = 4,
+    rate_limiter: RateLimiter | None = None,
+) -> dict[int, bytes]:
+    """
+    Thumbnails of the images, from the cache or downloaded with fetch(image_id) in workers threads.
+
+    Images that cannot be downloaded or decoded are left out.
+    """
+    thumbnails: dict[int, bytes] = {}
+    missing = []
+    for image_id in image_ids:
+        if (data := cache.get(f"{image_id}:{max_size}")) is not None:
+            thumbnails[image_id] = data
+        else:
+            missing.append(image_id)
+
+    def download(image_id: int) -> bytes | None:
+        if rate_limiter:
+            rate_limiter.wait()
+        with tracer.span("download_image", image_id=image_id):
+            try:
+                thumbnail = make_thumbnail(fetch(image_id), max_size)
+            except Exception as e:
+                logger.warning("image %s skipped: %s", image_id, e)
+                return None
+        cache.put(f"{image_id}:{max_size}", thumbnail)
+        return thumbnail
+
+    if missing:
+        logger.info("Downloading %d images (%d cached)...", len(missing), len(thumbnails))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image") as executor:
+            for image_id, thumbnail in zip(missing, executor.map(download, missing), strict=True):
+                if thumbnail is not None:
+                    thumbnails[image_id] = thumbnail
+        cache.save_index()
+
+    # in order of appearance, which is the order of the byte budget
+    return {image_id: thumbnails[image_id] for image_id in image_ids if image_id in thumbnails}
+
+
+class ImageEmbedder:
+    """
+    Replaces the image links of rendered descriptions by their thumbnails.
+
+    Thumbnails are inlined as data URIs, or written once to sidecar_dir and referenced
+    by a path relative to the output. Once budget bytes have been embedded, the
+    remaining links are kept as they are: a data URI counts at each of its occurrences,
+    a sidecar file once.
+    """
+
+    def __init__(self, thumbnails: dict[int, bytes], budget: int | None = None, sidecar_dir: str | None = None):
+        self.thumbnails = thumbnails
+        self.budget = budget
+        self.sidecar_dir = sidecar_dir
+        self.used = 0
+        self.embedded: dict[int, str] = {}  # src of each embedded image
+        self.skipped: set[int] = set()  # over budget
+        self._lock = threading.Lock()
+
+    def _src(self, image_id: int) -> str | None:
+        if image_id in self.embedded:
+            src = self.embedded[image_id]
+            if self.sidecar_dir is not None:
+                return src
+            if self.budget is not None and self.used + len(src) > self.budget:
+                return None
+            self.used += len(src)
+            return src
+        data = self.thumbnails.get(image_id)
+        if data is None or image_id in self.skipped:
+            return None
+
+        if self.sidecar_dir is None:
+            src = "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+            size = len(src)
+        else:
+            name = f"{hashlib.sha256(data).hexdigest()}.jpg"
+            path = os.path.join(self.sidecar_dir, name)
+            if not os.path.exists(path):
+                os.makedirs(self.sidecar_dir, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            src = f"{os.path.basename(self.sidecar_dir)}/{name}"
+            size = len(data)
+
+        if self.budget is not None and self.used + size > self.budget:
+            self.skipped.add(image_id)
+            return None
+        self.used += size
+        self.embedded[image_id] = src
+        return src
+
+    def substitute(self, text: str) -> str:
+        """Replace the image links of a rendered (and sanitized) description."""
+
+        def replace(match: re.Match[str]) -> str:
+            with self._lock:
+                src = self._src(int(match[1]))
+            if src is None:
+                return match[0]
+            caption = match[2]
+            alt = TAG_RE.sub("", caption).replace('"', "&quot;") if caption else match[1]
+            figure = f'<img src="{src}" alt="{alt}">'
+            if caption:
+                figure += f"<br/><i>{caption}</i>"
+            return f"<span>{figure}</span>"
+
+        return IMAGE_LINK_RE.sub(replace, text)
+
+    def summary(self) -> str:
+        where = "inlined" if self.sidecar_dir is None else f"written to {self.sidecar_dir}"
+        skipped = f", {len(self.skipped)} over the budget" if self.skipped else ""
+        return f"{len(self.embedded)} images {where} ({self.used / 1e3:.1f} kB){skipped}"
@@ -0,0 +1,54 @@
+"""
+JSON decoding of the API responses and of the document geometries.
+
+Documents are decoded with orjson or msgspec when one of them is installed
+(c2c_gpx[json]), and with the standard library otherwise. Once the responses are
+cached, decoding is a large share of the CPU time of an export.
+
+Point geometries, decoded for every exported document, are parsed directly from
+their text when no faster decoder is installed.
+"""
+
+import json
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import msgspec
+    import orjson
+else:
+    try:
+        import orjson
+    except ImportError:  # optional dependency
+        orjson = None
+
+    try:
+        import msgspec
+    except ImportError:  # optional dependency
+        msgspec = None
+
+loads: Callable[[str | bytes], Any]
+if orjson is not None:
+    BACKEND = "orjson"
+    loads = orjson.loads
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    loads = msgspec.json.decode
+else:
+    BACKEND = "json"
+    loads = json.loads
+
+
+def parse_point(geom: str) -> tuple[float, float]:
+    """(x, y) of a GeoJSON point, e.g. {"type": "Point", "coordinates": [700000.0, 5700000.0]}."""
+    if BACKEND == "json" and '"Point"' in geom and (key := geom.find('"coordinates"')) >= 0:
+        start = geom.find("[", key)
+        comma = geom.find(",", start)
+        end = geom.find("]", comma)
+        try:
+            # a third (altitude) coordinate is ignored
+            return float(geom[start + 1 : comma]), float(geom[comma + 1 : end].partition(",")[0])
+        except ValueError:
+            pass  # not in the usual form
+    x, y = loads(geom)["coordinates"][:2]
+    return float(x), float(y)
@@ -1,39 +1,112 @@
 import argparse
-import json
+import contextlib
+import datetime
+import functools
+import html
+import importlib.metadata
+import itertools
+import logging
 import os
 import re
+import sys
 import time
+from collections import deque
+from collections.abc import Callable, Generator, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import timedelta
 from typing import Any
 from urllib.parse import parse_qs, urlparse
 
-import datetime
 import gpxpy
 import gpxpy.gpx
-import importlib.metadata
 import markdown
 import requests
 import requests_cache
 import tqdm
 from pyproj import Transformer
 
-requests_cache.install_cache(
-    "c2c_cache", backend="sqlite", expire_after=timedelta(days=1)
+from . import c2c_markdown as mkd
+from .compact import minify_html
+from .images import ImageEmbedder, ThumbnailCache, collect_image_ids, get_thumbnails
+from .json_backend import loads
+from .metrics import metrics
+from .profiling import profiler
+from .records import ASSOCIATION_KEYS, DocumentRecord, compact_document, document_version
+from .resolvers import Versions, collection_of, resolve_all
+from .scheduler import RateLimiter, SingleFlight
+from .settings import ExportSettings
+from .spatial_index import SpatialIndex
+from .tracing import tracer
+from .tracks import Segment, parse_geom_detail, simplify, to_wgs84
+from .update import has_tracks, iter_gpx_waypoints, read_export_link, read_waypoint_key
+from .writers import (
+    WRITERS,
+    ExportMetadata,
+    GpxWriter,
+    OutputWriter,
+    ShardedWriter,
+    Waypoint,
+    area_key,
+    grid_key,
+    output_paths,
+    split_path,
 )
 
 __version__ = importlib.metadata.version("c2c_gpx")
 
-# converts GPS coords from Web Mercator (3857) to WGS84 (4326)
-transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
+# progress of the exports, printed by the c2c_gpx command (named for python -m c2c_gpx.main too)
+logger = logging.getLogger("c2c_gpx.main")
 
 # Base URL for the C2C API
 API_BASE_URL = "https://api.camptocamp.org"
 BASE_URL = "https://www.camptocamp.org"
+MEDIA_URL = "https://media.camptocamp.org/c2corg-active"
 
 delay = 0.5  # duration (in seconds) between c2c api calls
 
+# spaces the uncached API calls of all the threads, and coalesces the concurrent fetches of a document
+api_rate_limiter = RateLimiter(delay)
+document_flights = SingleFlight()
+
+max_retries = 3  # retries of an API call failing with a connection error, a 429 or a 5xx status
+retry_backoff = 1.0  # duration (in seconds) before the first retry, doubled for each following one
+request_timeout = 30.0  # in seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 headers = {"User-Agent": "C2C-GPX-Exporter-User"}
 
+# languages of the exported texts (ExportSettings.langs)
+LANGS = ("fr", "it", "de", "en", "es", "ca", "eu", "sl", "zh")
+
+# levels of detail of the descriptions (ExportSettings.detail)
+DETAIL_LEVELS = ("title", "summary", "full")
+# locale fields rendered by the detail levels below full, the others are not kept in the records
+DETAIL_TEXTS: dict[str, tuple[str, ...]] = {"title": (), "summary": ("title_prefix", "summary")}
+# (field, heading) of the sections of the full route descriptions, by priority
+ROUTE_SECTIONS = (
+    ("description", "Description"),
+    ("gear", "Équipement"),
+    ("remarks", "Remarques"),
+    ("route_history", "Historique"),
+)
+
+
+@functools.cache
+def get_transformer() -> Transformer:
+    """Converter of GPS coords from Web Mercator (3857) to WGS84 (4326), built on first use."""
+    return Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
+
+
+def http_session(cache: str | None = "c2c_cache", expire_after: timedelta = timedelta(days=1)) -> requests.Session:
+    """HTTP session for the API calls, caching the responses in the cache SQLite file unless it is None."""
+    new_session = (
+        requests_cache.CachedSession(cache, backend="sqlite", expire_after=expire_after)
+        if cache is not None
+        else requests.Session()
+    )
+    new_session.headers.update(headers)
+    return new_session
+
 
 def create_route_grade(route: dict[str, Any]) -> str:
     gradings = ""
@@ -115,11 +188,21 @@ def increment_pitches(text: str) -> str:
     return text
 
 
-def clean_and_html(text: str) -> str:
+def document_key(doc_type: str, record: DocumentRecord) -> str:
+    return f"{doc_type}/{record.document_id}"
 
 
+@profiler.stage("clean_and_html")
+def clean_and_html(text: str, max_size: int | None = None, timeout: float | None = None) -> str:
+    """
+    Render C2C markdown to HTML, raise mkd.RenderBudgetExceeded if text is longer than max_size
+    characters or if rendering takes more than timeout seconds.
+    """
+    # pre-processing regexes can backtrack too, so they share the time budget with the parser
+    return mkd.parse_code(text, max_size=max_size, timeout=timeout, preprocess=_replace_c2c_links)
 
 
+def _replace_c2c_links(text: str) -> str:
     # replace C2C links with HTML ones
     text = re.sub(
         r"\[\[(routes|waypoints|outings|articles|images)/(\d+)(?:/(\w+)/([^|\]]+))?(?:\|(.*?))?\]\]",
@@ -156,8 +239,7 @@ def clean_and_html(text: str) -> str:
         text,
     )
 
-    from . import c2c_markdown as mkd
-    return mkd.parse_code(text)
+    return text
 
     text = text.replace("|", "<td>")
 
@@ -166,162 +248,530 @@ def clean_and_html(text: str) -> str:
     return html
 
 
-def get_locale(route: dict[str, Any], lang: str = "fr") -> dict[str, Any] | None:
-    for loc in route["locales"]:
-        if loc["lang"] == lang:
-            assert isinstance(loc, dict)
-            return loc
-    return None
+def plain_text_html(text: str) -> str:
+    return html.escape(text).replace("\n", "<br/>")
+
+
+def render_field(settings: ExportSettings, text: str, doc_type: str, document_id: int, field: str) -> str:
+    """Render a document text field, falling back to plain text when out of the render budget."""
+    try:
+        rendered = clean_and_html(text, settings.render_max_size, settings.render_timeout)
+    except mkd.RenderBudgetExceeded as e:
+        document = f"{doc_type}/{document_id}"
+        logger.info("%s %s: %s, exported as plain text", document, field, e)
+        settings.report.render_fallbacks.append((document, field))
+        return plain_text_html(text)
+    if settings.image_embedder is not None:
+        rendered = settings.image_embedder.substitute(rendered)
+    return rendered
+
+
+class DescriptionBudget:
+    """
+    Byte budget of a waypoint description, spent by its sections in priority order.
+
+    Markdown sources are about the size of their HTML, so a section is truncated
+    (by paragraphs) or dropped before being rendered when its source does not fit.
+    """
+
+    separator = "<br/>"
 
+    def __init__(self, settings: ExportSettings) -> None:
+        self.settings = settings
+        self.budget = settings.description_budget
+        self.used = 0
 
-def get_locales(
-    route: dict[str, Any], langs: tuple[str, ...] = ("fr", "en")
-) -> dict[str, Any]:
-    for lang in langs:
-        if loc := get_locale(route, lang):
-            return loc
-    raise RuntimeError(f"route {route['document_id']} has no locale in {langs}")
+    def add(self, html: str) -> str:
+        """Spend the size of a section that is always included."""
+        self.used += size_of(html) + len(self.separator)
+        return html
 
+    def render(self, text: str, template: str, doc_type: str, document_id: int, field: str) -> str | None:
+        """Render the markdown text in template ({} is replaced by the HTML), None if it does not fit."""
+        if self.budget is None:
+            return self.add(template.format(render_field(self.settings, text, doc_type, document_id, field)))
 
-def format_route_description(route_data: dict[str, Any]) -> str:
+        remaining = self.budget - self.used - len(self.separator) - size_of(template)
+        paragraphs = text.split("\n\n")
+        count = len(paragraphs)
+        while count and size_of("\n\n".join(paragraphs[:count])) > remaining:
+            count -= 1
 
-    route_id = route_data["document_id"]
-    desc = get_locales(route_data)
+        while count:
+            content = render_field(self.settings, "\n\n".join(paragraphs[:count]), doc_type, document_id, field)
+            if count < len(paragraphs):
+                content += TRUNCATED_HTML
+            if size_of(content) <= remaining:
+                return self.add(template.format(content))
+            # shrink in proportion of the overflow
+            count = min(count - 1, count * remaining // size_of(content))
+        return None
+
+
+TRUNCATED_HTML = "<p>…</p>"
+
+
+def size_of(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def format_route_description(settings: ExportSettings, route: DocumentRecord) -> str:
+
+    route_id = route.document_id
+    desc = route.locale
     # title = desc["title"]
     title_prefix = desc.get("title_prefix")
     summary = desc.get("summary")
-    route_history = desc.get("route_history")
-    description = desc.get("description")
-    remarks = desc.get("remarks")
-    gear = desc.get("gear")
+    detail = settings.detail
+    budget = DescriptionBudget(settings)
 
     lines = [f'<p> <a href="{BASE_URL}/routes/{route_id}">{route_id}</a>']
 
-    if title_prefix:
-        lines.append(f"<b>Secteur</b> : {title_prefix}")
+    if detail != "title":
+        if title_prefix:
+            lines.append(f"<b>Secteur</b> : {title_prefix}")
+
+        if cotation := create_route_grade(route.attributes):
+            lines.append(f"<b>Cotations</b> : {cotation}")
 
-    if cotation := create_route_grade(route_data):
-        lines.append(f"<b>Cotations</b> : {cotation}")
+        if altitude := create_route_altitude(route.attributes):
+            lines.append(f"<b>Altitude</b> : {altitude}")
 
-    if altitude := create_route_altitude(route_data):
-        lines.append(f"<b>Altitude</b> : {altitude}")
+        if orientation := create_route_orientation(route.attributes):
+            lines.append(f"<b>Orientation</b> : {orientation}")
+        # TODO: use compass rose image for orientation ?
 
-    if orientation := create_route_orientation(route_data):
-        lines.append(f"<b>Orientation</b> : {orientation}")
-    # TODO: use compass rose image for orientation ?
+        if height := create_route_height(route.attributes):
+            lines.append(f"<b>Dénivelé</b> : {height}")
 
-    if height := create_route_height(route_data):
-        lines.append(f"<b>Dénivelé</b> : {height}")
+        # TODO: add rock type (limestone, sandstone), climbing type (multi-pitch, bloc,...)
 
-    # TODO: add rock type (limestone, sandstone), climbing type (multi-pitch, bloc,...)
+    for line in lines:
+        budget.add(line)
+    budget.add("</p><br/><hr>")
 
-    if summary is not None:
-        lines.append(clean_and_html(summary))
+    summary_html = None
+    if detail != "title" and summary is not None:
+        summary_html = budget.render(summary, "{}", "routes", route_id, "summary")
+    if summary_html:
+        lines.append(summary_html)
     lines.append("</p>")
 
     lines.append("<hr>")
 
-    if route_history is not None:
-        lines.append(f"<h1>Historique</h1> {clean_and_html(route_history)}")
-    if description is not None:
-        lines.append(f"<h1>Description</h1> {clean_and_html(description)}")
-    if remarks is not None:
-        lines.append(f"<h1>Remarques</h1> {clean_and_html(remarks)}")
-    if gear is not None:
-        lines.append(f"<h1>Équipement</h1> {clean_and_html(gear)}")
+    if detail == "full":
+        # rendered in priority order, shown in document order
+        sections = {
+            field: budget.render(text, f"<h1>{heading}</h1> {{}}", "routes", route_id, field)
+            for field, heading in ROUTE_SECTIONS
+            if (text := desc.get(field)) is not None
+        }
+        lines.extend(
+            content for field in ("route_history", "description", "remarks", "gear") if (content := sections.get(field))
+        )
 
     body = "<br/>".join(lines)
     return body
 
 
-def get_document_coord(document_data: dict[str, Any]) -> tuple[float, float]:
-    x, y = json.loads(document_data["geometry"]["geom"])["coordinates"]
-    lon, lat = transformer.transform(x, y)
+@profiler.stage("get_document_coord", key=lambda record: str(record.document_id))
+def get_document_coord(record: DocumentRecord) -> tuple[float, float]:
+    if record.coordinates is None:
+        raise ValueError(f"document {record.document_id} has no location")
+    lon, lat = get_transformer().transform(*record.coordinates)
     assert isinstance(lon, float)
     assert isinstance(lat, float)
     return lon, lat
 
 
-def get_default_description(doc_type: str, document_data: dict[str, Any]) -> str:
-    document_id = document_data["document_id"]
-    desc = get_locales(document_data)
+def get_default_description(settings: ExportSettings, doc_type: str, record: DocumentRecord) -> str:
+    document_id = record.document_id
+    desc = record.locale
+    detail = settings.detail
+    budget = DescriptionBudget(settings)
 
     lines = [
         f'<p> <a href="{BASE_URL}/{doc_type}/{document_id}">{doc_type.strip("s")} #{document_id}</a></p>'
     ]
-
-    for k, v in desc.items():
-        if k in ("title", "lang", "version", "topic_id") or not v:
-            continue
-
-        content = clean_and_html(v) if isinstance(v, str) else v
-        lines.append(f"<b>{k}</b></br>{content}")
+    budget.add(lines[0])
+    if detail == "title":
+        return lines[0]
+
+    fields = [k for k, v in desc.items() if v and (detail == "full" or k == "summary")]
+    # rendered with the summary and description first, shown in document order
+    priority = {"summary": 0, "description": 1}
+    contents: dict[str, str | None] = {}
+    for k in sorted(fields, key=lambda k: priority.get(k, 2)):
+        v = desc[k]
+        if isinstance(v, str):
+            contents[k] = budget.render(v, f"<b>{k}</b></br>{{}}", doc_type, document_id, k)
+        else:
+            contents[k] = budget.add(f"<b>{k}</b></br>{v}")
+    lines.extend(content for k in fields if (content := contents[k]))
     body = "<br/>".join(lines)
     return body
 
 
-def get_document_description(doc_type: str, document_data: dict[str, Any]) -> str:
+@profiler.stage("get_document_description", key=lambda settings, doc_type, record: document_key(doc_type, record))
+def get_document_description(settings: ExportSettings, doc_type: str, record: DocumentRecord) -> str:
     if doc_type == "routes":
-        return format_route_description(document_data)
-
-    return get_default_description(doc_type, document_data)
+        return format_route_description(settings, record)
+
+    return get_default_description(settings, doc_type, record)
+
+
+@profiler.stage("minify_description")
+def minify_description(settings: ExportSettings, description: str) -> str:
+    minified = minify_html(description)
+    compact_sizes = settings.report.compact_sizes
+    compact_sizes[0] += len(description.encode("utf-8"))
+    compact_sizes[1] += len(minified.encode("utf-8"))
+    return minified
+
+
+def create_waypoint(settings: ExportSettings, doc_type: str, record: DocumentRecord) -> Waypoint:
+    """Create the exported waypoint of any document type."""
+    document_id = record.document_id
+    lon, lat = get_document_coord(record)
+    description = get_document_description(settings, doc_type, record)
+    if settings.compact:
+        description = minify_description(settings, description)
+    return Waypoint(
+        doc_type=doc_type,
+        document_id=document_id,
+        name=record.title,
+        latitude=lat,
+        longitude=lon,
+        description=description,
+        url=f"{BASE_URL}/{doc_type}/{document_id}",
+        area=record.area,
+        version=record.version,
+    )
 
 
 def create_document_waypoint(
-    doc_type: str, document_data: dict[str, Any]
+    settings: ExportSettings, doc_type: str, record: DocumentRecord
 ) -> gpxpy.gpx.GPXWaypoint:
     """Create a GPX waypoint from any document type."""
-    loc = get_locales(document_data)
-    title = loc["title"]
-    lon, lat = get_document_coord(document_data)
-    wp = gpxpy.gpx.GPXWaypoint(latitude=lat, longitude=lon, name=title)
-
-    description = get_document_description(doc_type, document_data)
-    wp.description = description
-
     # TODO: use other attributes ?
     # wp.comment
     # wp.symbol
     # wp.elevation
     # wp.link
+    return create_waypoint(settings, doc_type, record).to_gpx()
 
-    return wp
 
+def iter_waypoints(
+    settings: ExportSettings,
+    doc_type: str,
+    records: dict[int, DocumentRecord],
+    tracks: dict[int, list[Segment]] | None = None,
+) -> Iterator[Waypoint]:
+    for doc_id, record in records.items():
+        waypoint = create_waypoint(settings, doc_type, record)
+        if tracks:
+            waypoint.track = tracks.get(doc_id)
+        yield waypoint
 
-def get_document_data(doc_type: str, document_id: int) -> dict[str, Any]:
-    url = f"{API_BASE_URL}/{doc_type}/{document_id}"
-    response = requests.get(url)
-    if not getattr(response, "from_cache", False):
-        time.sleep(delay)
-    response_json = response.json()
-    assert isinstance(response_json, dict)
-    return response_json
+
+@profiler.stage("get_tracks")
+def get_tracks(records: Iterable[DocumentRecord], tolerance: float) -> dict[int, list[Segment]]:
+    """
+    Tracks of the documents having a geom_detail line (routes and outings, kept with record_tracks),
+    by document ID, simplified with tolerance meters and converted to (longitude, latitude) in a single pass.
+    """
+    lines = {}
+    for record in records:
+        if record.geom_detail:
+            segments = [simplify(segment, tolerance) for segment in parse_geom_detail(record.geom_detail)]
+            lines[record.document_id] = segments
+    return to_wgs84(lines, get_transformer().transform)
 
 
+def get_associated_ids(record: DocumentRecord, assoc_type: str, waypoint_types: set[str] | None = None) -> list[int]:
+    """
+    IDs of the documents of assoc_type associated to a document (kept with record_associations),
+    optionally filtered by waypoint type.
+    """
+    ids: list[int] = []
+    for key in ASSOCIATION_KEYS[assoc_type]:
+        ids.extend(
+            doc_id
+            for doc_id, waypoint_type in record.associations.get(key, [])
+            if not waypoint_types or waypoint_type is None or waypoint_type in waypoint_types
+        )
+    return ids
+
+
+@profiler.stage("get_associated_documents")
+def get_associated_documents(
+    settings: ExportSettings,
+    doc_type: str,
+    records: dict[int, DocumentRecord],
+    associations: dict[str, set[str] | None],
+    workers: int = 4,
+) -> dict[str, dict[int, DocumentRecord]]:
+    """
+    Fetch the documents associated to the exported ones, by type.
+
+    Association IDs are deduplicated across all documents, and exclude the exported
+    documents, so that each associated document is fetched once.
+    """
+    output: dict[str, dict[int, DocumentRecord]] = {}
+    for assoc_type, waypoint_types in associations.items():
+        references = [
+            doc_id for record in records.values() for doc_id in get_associated_ids(record, assoc_type, waypoint_types)
+        ]
+        ids = dict.fromkeys(doc_id for doc_id in references if assoc_type != doc_type or doc_id not in records)
+        logger.info("Fetching %d associated %s (%d associations)...", len(ids), assoc_type, len(references))
+        # associations may point to deleted or merged documents
+        fetched = get_documents_data(settings, assoc_type, list(ids), skip_missing=True, workers=workers)
+        output[assoc_type] = {
+            doc_id: record
+            for doc_id, record in fetched.items()
+            # associations listed without waypoint type, and documents without location
+            if (not waypoint_types or record.waypoint_type in waypoint_types) and record.coordinates is not None
+        }
+    return output
+
+
+@profiler.stage("rate_limit_wait")
+def rate_limit_wait(settings: ExportSettings) -> None:
+    api_rate_limiter.interval = delay
+    if settings.rate_limiter is not None:
+        settings.rate_limiter.wait()
+        return
+    api_rate_limiter.wait()
+
+
+def received_bytes(response: requests.Response) -> int:
+    """Bytes of the response body as transferred, before decompression."""
+    try:
+        # urllib3 counts the bytes pulled from the socket
+        return int(response.raw.tell())
+    except (AttributeError, TypeError, ValueError):
+        return int(response.headers.get("Content-Length", len(response.content)))
+
+
+def retry_wait(response: requests.Response | None, attempt: int) -> float:
+    retry_after: str = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return float(retry_after)
+    return float(retry_backoff * 2**attempt)
+
+
+def cached_response(
+    settings: ExportSettings, url: str, params: dict[str, Any] | None
+) -> requests.Response | None:
+    """The fresh response of the HTTP cache to a GET, None when it must be sent."""
+    session = settings.session
+    if not isinstance(session, requests_cache.CachedSession):
+        return None
+    response = session.get(url, params=params, headers=headers, only_if_cached=True)
+    # requests_cache answers 504 when the response is missing or expired
+    return None if response.status_code == 504 else response
+
+
+def api_get(
+    settings: ExportSettings,
+    path: str,
+    endpoint: str,
+    params: dict[str, Any] | None = None,
+    base_url: str | None = None,
+) -> requests.Response:
+    """
+    GET a C2C API path (or a path of base_url), retrying connection errors, 429 and 5xx responses.
+
+    The call is counted in metrics under endpoint (search, document, book...),
+    and the enclosing trace span is tagged with its cache status. Requests sent
+    to the network are spaced by the rate limiter of settings across all threads,
+    each one waiting for its slot before being sent.
+    """
+    url = f"{base_url or API_BASE_URL}/{path}"
+    for attempt in range(max_retries + 1):
+        response = None
+        start = time.perf_counter()
+        try:
+            response = cached_response(settings, url, params) if attempt == 0 else None
+            if response is None:
+                # profiled apart (rate_limit_wait stage), kept out of the latency of the request
+                rate_limit_wait(settings)
+                get = settings.session.get if settings.session is not None else requests.get
+                start = time.perf_counter()
+                response = get(url, params=params, headers=headers, timeout=request_timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+        else:
+            from_cache = getattr(response, "from_cache", False)
+            metrics.record(
+                endpoint,
+                response.status_code,
+                from_cache,
+                0 if from_cache else received_bytes(response),
+                len(response.content),
+                time.perf_counter() - start,
+            )
+            tracer.annotate(cache="hit" if from_cache else "miss", status=response.status_code, retries=attempt)
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                response.raise_for_status()
+                return response
+
+        metrics.record_retry(endpoint)
+        with tracer.span("retry_wait", endpoint=endpoint):
+            time.sleep(retry_wait(response, attempt))
+
+    raise AssertionError("unreachable")
+
+
+@profiler.stage("get_document_data", key=lambda settings, doc_type, document_id: f"{doc_type}/{document_id}")
+def get_document_data(settings: ExportSettings, doc_type: str, document_id: int) -> dict[str, Any]:
+    """
+    A document with a single locale: the one in the first of the langs of settings it is translated in.
+
+    The API answers l=<lang> with the locale in lang only. The lang is chosen among the languages
+    the document was listed with by a search (see get_document_versions), and is the first of
+    langs for the other documents, whose locale is requested again in the first language they
+    are translated in when they are not translated in it.
+    """
+    preferred = settings.langs
+
+    def fetch() -> dict[str, Any]:
+        path = f"{doc_type}/{document_id}"
+        listed = settings.document_langs.get((doc_type, document_id), preferred)
+        lang = next((candidate for candidate in preferred if candidate in listed), preferred[0])
+        response_json = loads(api_get(settings, path, "document", params={"l": lang}).content)
+        assert isinstance(response_json, dict)
+        if not response_json.get("locales"):
+            available = response_json.get("available_langs") or []
+            best = next((candidate for candidate in preferred if candidate in available), None)
+            if best is not None and best != lang:
+                response_json = loads(api_get(settings, path, "document", params={"l": best}).content)
+                assert isinstance(response_json, dict)
+        return response_json
+
+    # concurrent exports of the same document share a single API call
+    return document_flights.do((doc_type, document_id, preferred), fetch)
+
+
+def get_document_record(settings: ExportSettings, doc_type: str, document_id: int) -> DocumentRecord:
+    """
+    Fetch a document and keep the fields used by the export: the texts of the detail level,
+    and its line and associations when they are exported.
+    """
+    return compact_document(
+        doc_type,
+        get_document_data(settings, doc_type, document_id),
+        settings.record_tracks,
+        settings.record_associations,
+        DETAIL_TEXTS.get(settings.detail),
+        settings.langs,
+    )
+
+
+def fetch_records(
+    settings: ExportSettings, documents: Iterable[tuple[str, int]], workers: int = 4, skip_missing: bool = False
+) -> Generator[tuple[str, int, DocumentRecord | None], None, None]:
+    """
+    (doc_type, document_id, record) of the documents, in order, fetched by workers threads
+    a few documents ahead of the consumer. With skip_missing, the record of a document
+    not found is None.
+    """
+
+    def fetch(doc_type: str, document_id: int) -> DocumentRecord | None:
+        try:
+            return get_document_record(settings, doc_type, document_id)
+        except requests.HTTPError as e:
+            if not skip_missing or e.response is None or e.response.status_code != 404:
+                raise
+            logger.warning("%s/%s not found, skipped", doc_type, document_id)
+            return None
+
+    workers = max(1, workers)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+    pending: deque[tuple[str, int, Future[DocumentRecord | None]]] = deque()
+    try:
+        for doc_type, document_id in documents:
+            pending.append((doc_type, document_id, executor.submit(fetch, doc_type, document_id)))
+            if len(pending) > 2 * workers:
+                fetched_type, fetched_id, record = pending.popleft()
+                yield fetched_type, fetched_id, record.result()
+        while pending:
+            fetched_type, fetched_id, record = pending.popleft()
+            yield fetched_type, fetched_id, record.result()
+    finally:
+        # the consumer may stop before the end
+        executor.shutdown(cancel_futures=True)
+
+
+@profiler.stage("get_documents_data")
 def get_documents_data(
-    doc_type: str, document_ids: list[int]
-) -> dict[int, dict[str, Any]]:
-    documents_data: dict[int, dict[str, Any]] = dict()
-    for doc_id in tqdm.tqdm(document_ids, total=len(document_ids)):
-        documents_data[doc_id] = get_document_data(doc_type, doc_id)
-    return documents_data
+    settings: ExportSettings, doc_type: str, document_ids: list[int], skip_missing: bool = False, workers: int = 4
+) -> dict[int, DocumentRecord]:
+    """Records of the documents, by ID, fetched by workers threads, their payloads being dropped as they are fetched."""
+    records = fetch_records(settings, ((doc_type, doc_id) for doc_id in document_ids), workers, skip_missing)
+    return {
+        doc_id: record
+        for _, doc_id, record in tqdm.tqdm(records, total=len(document_ids))
+        if record is not None
+    }
+
+
+def image_variant(max_size: int) -> str:
+    """Smallest camptocamp.org resized image at least max_size pixels wide: SI (200), MI (400) or BI (1500)."""
+    if max_size <= 200:
+        return "SI"
+    return "MI" if max_size <= 400 else "BI"
+
+
+def fetch_image(settings: ExportSettings, image_id: int, max_size: int) -> bytes:
+    """Download the smallest resized version of an image that fits max_size."""
+    image = loads(api_get(settings, f"images/{image_id}", "document").content)
+    stem, ext = os.path.splitext(image["filename"])
+    response = api_get(settings, f"{stem}{image_variant(max_size)}{ext}", "image", base_url=MEDIA_URL)
+    return response.content
+
+
+@profiler.stage("get_images")
+def get_images(
+    settings: ExportSettings,
+    records: Iterable[DocumentRecord],
+    max_size: int,
+    cache_dir: str,
+    budget: int | None,
+    sidecar_dir: str | None,
+    workers: int,
+) -> ImageEmbedder:
+    """Download the thumbnails of the images referenced in the texts of the documents."""
+    texts = (value for record in records for value in record.locale.values() if isinstance(value, str))
+    image_ids = collect_image_ids(texts)
+    thumbnails = get_thumbnails(
+        image_ids,
+        lambda image_id: fetch_image(settings, image_id, max_size),
+        ThumbnailCache(cache_dir),
+        max_size,
+        workers,
+    )
+    return ImageEmbedder(thumbnails, budget, sidecar_dir)
 
 
 def build_gpx(
-    doc_type: str, documents_data: dict[int, dict[str, Any]]
+    settings: ExportSettings, doc_type: str, documents_data: dict[int, DocumentRecord]
 ) -> gpxpy.gpx.GPX:
     gpx = gpxpy.gpx.GPX()
-    for doc_data in documents_data.values():
-        wp = create_document_waypoint(doc_type, doc_data)
-        gpx.waypoints.append(wp)
+    for waypoint in iter_waypoints(settings, doc_type, documents_data):
+        gpx.waypoints.append(waypoint.to_gpx())
 
     return gpx
 
 
-def save_gpx(gpx: gpxpy.gpx.GPX, name: str) -> None:
-    with open(name, "w", encoding="utf-8") as f:
-        f.write(gpx.to_xml())
-    print(f"file {name} created with {len(gpx.waypoints)} waypoints")
+@profiler.stage("write_outputs")
+def write_outputs(waypoints: Iterable[Waypoint], writers: list[OutputWriter]) -> None:
+    """Write each waypoint to all the writers, in a single pass."""
+    for waypoint in waypoints:
+        with tracer.span("write_waypoint"):
+            for writer in writers:
+                writer.write(waypoint)
 
 
 def parse_c2c_url(url: str) -> tuple[str, dict[str, Any]]:
@@ -347,38 +797,170 @@ def parse_c2c_url(url: str) -> tuple[str, dict[str, Any]]:
 
     return doc_type, params
 
-def get_book_routes(book_url: dict[str, Any]) -> list[int]:
-    book_id = book_url.split("/")[1]
-    url = f"{API_BASE_URL}/books/{book_id}"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data: dict[str, Any] = response.json()
 
-    print([d["document_id"] for d in data["associations"]["routes"]])
+def get_collection_document(settings: ExportSettings, path: str) -> dict[str, Any]:
+    """A collection document (e.g. books/57964), with its associations."""
+    data: dict[str, Any] = loads(api_get(settings, path, "collection", params={"l": settings.langs[0]}).content)
+    return data
 
-    return [d["document_id"] for d in data["associations"]["routes"]]
-
-
-def get_document_ids(doc_type: str, params: dict[str, Any]) -> list[int]:
-    """Get document IDs based on the document type and search parameters."""
 
-    url = f"{API_BASE_URL}/{doc_type}"
-    output: list[int] = []
+@profiler.stage("resolve_collections")
+def get_collection_versions(settings: ExportSettings, urls: list[str], workers: int = 4) -> dict[str, Versions]:
+    """
+    IDs of the documents of search and collection URLs (books, areas, profiles), with their version,
+    by type. The URLs are resolved in workers threads, and each document is listed once.
+    """
+    searches = [parse_c2c_url(url) for url in urls]
+    collections = resolve_all(
+        searches,
+        functools.partial(get_document_versions, settings),
+        functools.partial(get_collection_document, settings),
+        workers,
+    )
+    logger.info("%s found", ", ".join(f"{len(versions)} {doc_type}" for doc_type, versions in collections.items()))
+    return collections
+
+
+@profiler.stage("get_document_ids")
+def get_document_versions(settings: ExportSettings, doc_type: str, params: dict[str, Any]) -> Versions:
+    """Get document IDs, with their version, based on the document type and search parameters."""
+    spatial_index = settings.spatial_index
+    local = spatial_index.query(doc_type, params) if spatial_index is not None else None
+    if (
+        local is not None
+        and not settings.verify_index
+        and (not settings.check_new_documents or count_documents(settings, doc_type, params) == len(local))
+    ):
+        logger.info("%d %s found in the local index", len(local), doc_type)
+        return local
+
+    output: Versions = {}
+    listings: list[dict[str, Any]] = []
     offset = 0
     while True:
-        search_params = {**params, "offset": offset}
-        response = requests.get(url, params=search_params, headers=headers)
-        response.raise_for_status()
-        data: dict[str, Any] = response.json()
-        documents = data["documents"]
+        # listings with a single locale, in the preferred language
+        search_params = {**params, "offset": offset, "pl": settings.langs[0]}
+        with tracer.span("search_page", offset=offset):
+            response = api_get(settings, doc_type, "search", params=search_params)
+            data: dict[str, Any] = loads(response.content)
+            documents = data["documents"]
+            tracer.annotate(count=len(documents))
         # TODO: compare len(documents) to data["total"] for breaking
         if len(documents) == 0:
             break
         offset += len(documents)
-        output.extend(d["document_id"] for d in documents)
+        output.update((d["document_id"], document_version(d)) for d in documents)
+        settings.document_langs.update(
+            ((doc_type, d["document_id"]), tuple(d["available_langs"])) for d in documents if d.get("available_langs")
+        )
+        if spatial_index is not None:
+            listings.extend(documents)
+
+    if local is not None:
+        log_index_differences(local, output)
+    if spatial_index is not None:
+        spatial_index.add_search(doc_type, params, listings)
     return output
 
 
+def log_index_differences(local: Versions, found: Versions) -> None:
+    """Compare the documents of a search answered by the local index with those found by the API."""
+    missing = [doc_id for doc_id in found if doc_id not in local]
+    extra = [doc_id for doc_id in local if doc_id not in found]
+    outdated = [doc_id for doc_id, version in found.items() if doc_id in local and local[doc_id] != version]
+    if not (missing or extra or outdated):
+        logger.info("local index verified: same %d documents as the API", len(found))
+        return
+    lines = [f"local index differs from the API ({len(local)} documents instead of {len(found)}):"]
+    for name, ids in (("missing", missing), ("extra", extra), ("outdated", outdated)):
+        if ids:
+            lines.append(f"  {len(ids)} {name}: {', '.join(map(str, ids[:10]))}{', ...' if len(ids) > 10 else ''}")
+    logger.warning("\n".join(lines))
+
+
+def count_documents(settings: ExportSettings, doc_type: str, params: dict[str, Any]) -> int:
+    """Number of documents of a search, in a single API call."""
+    response = api_get(settings, doc_type, "search", params={**params, "limit": 1, "offset": 0})
+    total: int = loads(response.content)["total"]
+    return total
+
+
+def get_document_ids(settings: ExportSettings, doc_type: str, params: dict[str, Any]) -> list[int]:
+    """Get document IDs based on the document type and search parameters."""
+    return list(get_document_versions(settings, doc_type, params))
+
+
+@profiler.stage("update_gpx")
+def update_gpx(
+    settings: ExportSettings,
+    doc_type: str,
+    versions: Versions,
+    existing: str,
+    output: str,
+    metadata: ExportMetadata,
+    workers: int = 4,
+) -> None:
+    """
+    Rewrite the existing GPX export to output, re-rendering only the changed documents.
+
+    Unchanged waypoints are copied verbatim in their existing order, those of changed
+    documents are replaced, those of documents no longer found are removed, and new
+    documents are added at the end. A document has changed when the version of its
+    attributes, of its locale or of its geometry has (see document_version).
+
+    Raises ValueError when the existing export has tracks, which would be dropped.
+    """
+    if has_tracks(existing):
+        raise ValueError(f"{existing} has tracks, --update does not support them")
+    existing_versions: Versions = {}
+    for xml in iter_gpx_waypoints(existing):
+        if (key := read_waypoint_key(xml)) and key[0] == doc_type:
+            existing_versions[key[1]] = key[2]
+    changed = [
+        doc_id
+        for doc_id, version in versions.items()
+        if version is None or doc_id not in existing_versions or existing_versions[doc_id] != version
+    ]
+    documents_data = get_documents_data(settings, doc_type, changed, workers=workers)
+
+    kept = removed = 0
+    # written next to the output, which may be the existing file
+    tmp_path = f"{output}.tmp.gz" if output.endswith(".gz") else f"{output}.tmp"
+    try:
+        with GpxWriter(tmp_path, metadata) as writer:
+            for xml in iter_gpx_waypoints(existing):
+                key = read_waypoint_key(xml)
+                if key is None or key[0] != doc_type:
+                    # not a camptocamp.org document
+                    writer.write_record(f"\n  {xml}")
+                elif key[1] not in versions:
+                    removed += 1
+                elif key[1] in documents_data:
+                    writer.write(create_waypoint(settings, doc_type, documents_data.pop(key[1])))
+                else:
+                    writer.write_record(f"\n  {xml}")
+                    kept += 1
+            updated = len(changed) - len(documents_data)
+            for record in documents_data.values():
+                writer.write(create_waypoint(settings, doc_type, record))
+    except BaseException:
+        # the writer may have failed before creating the file
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output)
+
+    logger.info(
+        "file %s updated with %d waypoints: %d unchanged, %d updated, %d added, %d removed",
+        output,
+        writer.count,
+        kept,
+        updated,
+        len(documents_data),
+        removed,
+    )
+
+
 def generate_filename(doc_type: str, params: dict[str, Any]) -> str:
     """Generate a filename based on document type and search parameters."""
     parts = [doc_type]
@@ -390,15 +972,105 @@ def generate_filename(doc_type: str, params: dict[str, Any]) -> str:
     return "_".join(parts) + ".gpx"
 
 
+def export_filename(urls: list[str]) -> str:
+    """Generate a filename based on the searches and collections of the URLs."""
+    names = []
+    for url in urls:
+        doc_type, params = parse_c2c_url(url)
+        if collection := collection_of(doc_type):
+            doc_type = "-".join(str(part) for part in collection)
+        names.append(generate_filename(doc_type, params).removesuffix(".gpx"))
+    return "_".join(names) + ".gpx"
+
+
+def parse_formats(value: str) -> list[str]:
+    formats = list(dict.fromkeys(fmt.strip().lower() for fmt in value.split(",") if fmt.strip()))
+    unknown = [fmt for fmt in formats if fmt not in WRITERS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"unknown format {', '.join(unknown) or repr(value)}, choose among {', '.join(WRITERS)}"
+        )
+    return formats
+
+
+def parse_langs(value: str) -> tuple[str, ...]:
+    preferred = tuple(dict.fromkeys(lang.strip().lower() for lang in value.split(",") if lang.strip()))
+    unknown = [lang for lang in preferred if lang not in LANGS]
+    if unknown or not preferred:
+        raise argparse.ArgumentTypeError(
+            f"unknown language {', '.join(unknown) or repr(value)}, choose among {', '.join(LANGS)}"
+        )
+    return preferred
+
+
+def parse_associations(value: str) -> dict[str, set[str] | None]:
+    """Parse the --associations value: TYPE[:WAYPOINT_TYPE+...],... e.g. waypoints:access+hut,outings"""
+    associations: dict[str, set[str] | None] = {}
+    for item in value.split(","):
+        assoc_type, _, waypoint_types = item.strip().partition(":")
+        if assoc_type not in ASSOCIATION_KEYS or (waypoint_types and assoc_type != "waypoints"):
+            raise argparse.ArgumentTypeError(
+                f"invalid association {item!r}, expected {', '.join(ASSOCIATION_KEYS)}, "
+                + "with optional waypoint types for waypoints (e.g. waypoints:access+hut)"
+            )
+        associations[assoc_type] = set(waypoint_types.split("+")) if waypoint_types else None
+    return associations
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size, with an optional k, M or G suffix."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)[bB]?\s*", value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r}, expected e.g. 500k or 2M")
+    number, unit = match.groups()
+    return int(float(number) * 1000 ** " KMG".index(unit.upper() or " "))
+
+
+def parse_shard_key(value: str) -> Callable[[Waypoint], str]:
+    """Parse the --shard-by value: area, or grid:SIZE with SIZE the cell size in degrees."""
+    if value == "area":
+        return area_key
+    kind, _, size = value.partition(":")
+    try:
+        if kind == "grid" and float(size) > 0:
+            return grid_key(float(size))
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"invalid shard key {value!r}, expected area or grid:SIZE (e.g. grid:0.5)")
+
+
+def create_writers(
+    filename: str,
+    formats: list[str],
+    metadata: ExportMetadata,
+    shard_size: int | None = None,
+    shard_bytes: int | None = None,
+    shard_key: Callable[[Waypoint], str] | None = None,
+    compress: bool = False,
+) -> list[OutputWriter]:
+    writers: list[OutputWriter] = []
+    for fmt, path in output_paths(filename, formats, compress).items():
+        if shard_size or shard_bytes or shard_key:
+            writers.append(ShardedWriter(WRITERS[fmt], path, metadata, shard_size, shard_bytes, shard_key))
+        else:
+            writers.append(WRITERS[fmt](path, metadata))
+    return writers
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Export camptocamp.org documents (routes, outings, waypoints, xreports) to GPX format"
     )
     parser.add_argument(
-        "url",
+        "urls",
         type=str,
-        help="Camptocamp.org search URL "
-        + "(e.g., https://www.camptocamp.org/routes?act=rock_climbing&bbox=616096,5333945,627309,5346461)",
+        nargs="*",
+        metavar="url",
+        help="Camptocamp.org search URLs "
+        + "(e.g., https://www.camptocamp.org/routes?act=rock_climbing&bbox=616096,5333945,627309,5346461), "
+        + "or collection URLs: books/ID (routes of a guidebook), areas/ID (routes of an area), profiles/ID "
+        + "(favorite routes and outings of a user). Several URLs are exported together, each document once. "
+        + "Optional with --update",
     )
     parser.add_argument(
         "-o",
@@ -407,31 +1079,356 @@ def main() -> None:
         default=None,
         help="Output GPX filename (default: auto-generated based on params)",
     )
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=parse_formats,
+        default=["gpx"],
+        help=f"Comma separated output formats among {', '.join(WRITERS)}, written in the same pass. "
+        + "With several formats, the output filename extension is replaced by each format one (default: gpx)",
+    )
+    parser.add_argument(
+        "--update",
+        type=str,
+        default=None,
+        metavar="EXISTING_GPX",
+        help="Update an existing GPX export: only new and modified documents are fetched and rendered, "
+        + "the others are copied as is. Written to --output, or in place",
+    )
+    parser.add_argument(
+        "--associations",
+        type=parse_associations,
+        default={},
+        help="Also export the documents of these types associated to the exported ones, each fetched once, "
+        + "optionally filtered by waypoint type (e.g. waypoints:access+hut,outings)",
+    )
+    parser.add_argument(
+        "--local-index",
+        type=str,
+        nargs="?",
+        const="c2c_index.sqlite",
+        default=None,
+        metavar="INDEX_FILE",
+        help="Index the documents of the searches by coordinates in this SQLite file (default: %(const)s), "
+        + "and answer locally the searches within the bbox of a previous one (of the day) with the same "
+        + "or narrower filters: activities, orientations, areas, ratings, elevations and waypoint types",
+    )
+    parser.add_argument(
+        "--check-new",
+        action="store_true",
+        help="With --local-index, check with a single API call that no document was added or removed "
+        + "since the indexed search, and search the API again otherwise",
+    )
+    parser.add_argument(
+        "--verify-index",
+        action="store_true",
+        help="With --local-index, search the API anyway and print the differences with the local answer",
+    )
+    parser.add_argument(
+        "--http-cache",
+        type=str,
+        default="c2c_cache",
+        metavar="CACHE_FILE",
+        help="SQLite file caching the API responses for a day (default: %(default)s)",
+    )
+    parser.add_argument("--no-http-cache", action="store_true", help="Do not cache the API responses")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of threads resolving the URLs and fetching the documents, within the API rate limit "
+        + "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--langs",
+        type=parse_langs,
+        default=ExportSettings.langs,
+        help=f"Comma separated languages of the texts, by preference, among {', '.join(LANGS)}. "
+        + "Only the locale in the first one is downloaded, or in the next ones when it is missing (default: fr,en)",
+    )
+    parser.add_argument(
+        "--detail",
+        choices=DETAIL_LEVELS,
+        default=ExportSettings.detail,
+        help="Level of detail of the descriptions: title (link only), summary (main fields and summary) "
+        + "or full (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-description-bytes",
+        type=parse_size,
+        default=None,
+        help="Max size of a description (e.g. 4k), its sections are truncated or dropped to fit, "
+        + "the summary first, then the description, gear, remarks and history",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Minify the descriptions: collapse whitespace and line breaks, drop empty sections and shorten "
+        + "camptocamp.org links",
+    )
+    parser.add_argument(
+        "--tracks",
+        action="store_true",
+        help="Also export the lines of the routes and outings as tracks (not in csv)",
+    )
+    parser.add_argument(
+        "--track-tolerance",
+        type=float,
+        default=10.0,
+        help="Simplify the tracks, dropping points closer than this distance (in meters) "
+        + "to the simplified line, 0 to keep all the points (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--images",
+        choices=("data", "sidecar"),
+        default=None,
+        help="Replace the image links of the descriptions by thumbnails, inlined as data URIs (data) "
+        + "or written next to the output in a OUTPUT_images directory (sidecar)",
+    )
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        default=200,
+        help="Max width and height (in pixels) of the thumbnails, resized with Pillow when it is installed "
+        + "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--image-budget",
+        type=parse_size,
+        default=None,
+        help="Max total size of the embedded thumbnails (e.g. 5M), the following images are kept as links",
+    )
+    parser.add_argument(
+        "--image-workers",
+        type=int,
+        default=4,
+        help="Number of concurrent image downloads, within the API rate limit (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--image-cache",
+        type=str,
+        default="c2c_thumbnails",
+        help="Directory of the thumbnail cache, reused by the following exports (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress the output files while writing them (.gz suffix), "
+        + "also enabled by an output filename ending with .gz",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        help="Split the output into files of at most this number of waypoints",
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=parse_size,
+        default=None,
+        help="Split the output into files of about this size at most (e.g. 500k, 2M)",
+    )
+    parser.add_argument(
+        "--shard-by",
+        type=parse_shard_key,
+        default=None,
+        help="Split the output by C2C area (area) or by grid cell of SIZE degrees (grid:SIZE), "
+        + "combined with --shard-size and --shard-bytes. Shards are listed in an index file",
+    )
 
-    parser.add_argument("--version", action="version", version=__version__)
+    parser.add_argument(
+        "--render-timeout",
+        type=float,
+        default=ExportSettings.render_timeout,
+        help="Max duration (in seconds) for rendering one text field before falling back to plain text, "
+        + "0 to disable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--render-max-size",
+        type=int,
+        default=ExportSettings.render_max_size,
+        help="Max length (in characters) of a rendered text field, longer ones are exported as plain text, "
+        + "0 to disable (default: %(default)s)",
+    )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the wall time, CPU time, call count and memory peak of each export stage",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=str,
+        default=None,
+        help="Write the --profile report as JSON to this file (implies --profile)",
+    )
 
-    doc_type, params = parse_c2c_url(args.url)
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Write a timeline of the export (requests, rate-limit waits, rendering, XML writing) to this file, "
+        + "in Chrome trace format (open it in https://ui.perfetto.dev)",
+    )
 
-    print(f"Fetching {doc_type}...")
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Print API call metrics per endpoint: cache hits, bytes, retries, status codes and latencies",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Write API call metrics to this file, in Prometheus text format",
+    )
+
+    parser.add_argument("--version", action="version", version=__version__)
 
-    if "books/" in doc_type:
-        document_ids = get_book_routes(doc_type)
-        doc_type = "routes"
-    else:
-        document_ids = get_document_ids(doc_type, params)
-    documents_data = get_documents_data(doc_type, document_ids)
-    gpx = build_gpx(doc_type, documents_data)
+    args = parser.parse_args()
 
-    gpx.description = "created with c2c-gpx v" + __version__
-    gpx.link = args.url.replace("&", "&amp;").replace("<", "&lt;")
-    gpx.time = datetime.datetime.now()
+    # the progress of the export is printed along with its reports
+    package_logger = logging.getLogger("c2c_gpx")
+    if not package_logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        package_logger.addHandler(handler)
+    package_logger.setLevel(logging.INFO)
+
+    settings = ExportSettings(
+        session=http_session(None if args.no_http_cache else args.http_cache),
+        langs=args.langs,
+        detail=args.detail,
+        description_budget=args.max_description_bytes,
+        compact=args.compact,
+        render_max_size=args.render_max_size or None,
+        render_timeout=args.render_timeout or None,
+        record_tracks=args.tracks,
+        record_associations=bool(args.associations),
+    )
+    if args.local_index:
+        settings.spatial_index = SpatialIndex(args.local_index)
+        settings.check_new_documents = args.check_new
+        settings.verify_index = args.verify_index
+
+    if args.profile or args.profile_json:
+        profiler.enable()
+    if args.trace:
+        tracer.enable()
+
+    if args.update:
+        if not os.path.isfile(args.update):
+            parser.error(f"--update: no such file {args.update}")
+        if args.format != ["gpx"] or args.shard_size or args.shard_bytes or args.shard_by:
+            parser.error("--update only supports a single GPX output")
+        if args.associations:
+            parser.error("--update does not support --associations")
+        if args.images or args.tracks:
+            parser.error("--update does not support --images and --tracks")
+        if has_tracks(args.update):
+            parser.error(f"--update does not support exports with tracks, {args.update} has some")
+        if len(args.urls) > 1:
+            parser.error("--update supports a single url")
+        args.urls = args.urls or [read_export_link(args.update)]
+    if not args.urls:
+        parser.error("the url argument is required")
+
+    metadata = ExportMetadata(
+        description="created with c2c-gpx v" + __version__, link=args.urls[0], time=datetime.datetime.now()
+    )
 
-    filename = args.output or generate_filename(doc_type, params)
+    print(f"Fetching {', '.join(parse_c2c_url(url)[0] for url in args.urls)}...")
+    collections = get_collection_versions(settings, args.urls, args.workers)
+
+    if args.update:
+        if len(collections) > 1:
+            parser.error(f"--update supports a single document type, {' and '.join(collections)} found")
+        ((doc_type, document_versions),) = collections.items()
+        update_gpx(
+            settings, doc_type, document_versions, args.update, args.output or args.update, metadata, args.workers
+        )
+        print_reports(args, settings)
+        return
+
+    documents = {
+        doc_type: get_documents_data(settings, doc_type, list(versions), workers=args.workers)
+        for doc_type, versions in collections.items()
+    }
+    associated_data: dict[str, dict[int, DocumentRecord]] = {}
+    for doc_type, documents_data in documents.items():
+        associated = get_associated_documents(settings, doc_type, documents_data, args.associations, args.workers)
+        for assoc_type, data in associated.items():
+            exported = documents.get(assoc_type, {})
+            associated_data.setdefault(assoc_type, {}).update(
+                (doc_id, doc_data) for doc_id, doc_data in data.items() if doc_id not in exported
+            )
+    all_documents_data = [
+        *(data.values() for data in documents.values()),
+        *(data.values() for data in associated_data.values()),
+    ]
+
+    filename = args.output or export_filename(args.urls)
     if args.output is not None and os.path.isdir(args.output):
-        filename = os.path.join(args.output, generate_filename(doc_type, params))
-    save_gpx(gpx, filename)
+        filename = os.path.join(args.output, export_filename(args.urls))
+    tracks = {}
+    if args.tracks:
+        tracks = get_tracks(itertools.chain(*all_documents_data), args.track_tolerance)
+    if args.images:
+        settings.image_embedder = get_images(
+            settings,
+            itertools.chain(*all_documents_data),
+            args.image_size,
+            args.image_cache,
+            args.image_budget,
+            f"{split_path(filename)[0]}_images" if args.images == "sidecar" else None,
+            args.image_workers,
+        )
+    writers = create_writers(
+        filename, args.format, metadata, args.shard_size, args.shard_bytes, args.shard_by, args.gzip
+    )
+    with contextlib.ExitStack() as stack:
+        for writer in writers:
+            stack.enter_context(writer)
+        waypoints = itertools.chain(
+            *(iter_waypoints(settings, doc_type, data, tracks) for doc_type, data in documents.items()),
+            *(iter_waypoints(settings, assoc_type, data, tracks) for assoc_type, data in associated_data.items()),
+        )
+        write_outputs(waypoints, writers)
+    for writer in writers:
+        print(writer.summary())
+
+    print_reports(args, settings)
+
+
+def print_reports(args: argparse.Namespace, settings: ExportSettings) -> None:
+    """Print the reports of the export, and save the files of the --metrics-file, --profile-json and --trace flags."""
+    report = settings.report
+    if settings.compact and report.compact_sizes[0]:
+        before, after = report.compact_sizes
+        print(f"descriptions minified from {before / 1e3:.1f} kB to {after / 1e3:.1f} kB ({after / before - 1:.0%})")
+
+    if settings.image_embedder is not None:
+        print(settings.image_embedder.summary())
+
+    if report.render_fallbacks:
+        print(f"{len(report.render_fallbacks)} text fields exceeded the render budget and were exported as plain text:")
+        for document, field in report.render_fallbacks:
+            print(f"  {document} {field}")
+
+    print(metrics.short_summary())
+    if args.metrics:
+        print(metrics.summary())
+    if args.metrics_file:
+        metrics.save_prometheus(args.metrics_file)
+
+    if profiler.enabled:
+        print(profiler.summary())
+        if args.profile_json:
+            profiler.save_json(args.profile_json)
+
+    if args.trace:
+        tracer.save(args.trace)
+        print(f"trace written to {args.trace}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""Counters and latency histograms of the C2C API calls."""
+
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+
+# upper bounds (in seconds) of the latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class EndpointMetrics:
+    requests: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    retries: int = 0
+    bytes_received: int = 0  # as transferred, before decompression, 0 for cache hits
+    bytes_decoded: int = 0  # after decompression
+    status_codes: Counter[int] = field(default_factory=Counter)
+    # latency of the requests actually sent to the API (cache misses)
+    latency_buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    latency_sum: float = 0.0
+
+    def latency_quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q quantile of the latencies."""
+        if not self.cache_misses:
+            return None
+        rank = q * self.cache_misses
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets, strict=False):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsCollector:
+    """Thread-safe collector of the API calls, by endpoint type (search, document, book...)."""
+
+    def __init__(self) -> None:
+        self.endpoints: dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.endpoints = {}
+
+    def record(
+        self, endpoint: str, status: int, from_cache: bool, bytes_received: int, bytes_decoded: int, latency: float
+    ) -> None:
+        with self._lock:
+            metrics = self.endpoints.setdefault(endpoint, EndpointMetrics())
+            metrics.requests += 1
+            metrics.status_codes[status] += 1
+            metrics.bytes_decoded += bytes_decoded
+            if from_cache:
+                metrics.cache_hits += 1
+                return
+            metrics.cache_misses += 1
+            metrics.bytes_received += bytes_received
+            metrics.latency_sum += latency
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    metrics.latency_buckets[i] += 1
+                    break
+            else:
+                metrics.latency_buckets[-1] += 1
+
+    def record_retry(self, endpoint: str) -> None:
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointMetrics()).retries += 1
+
+    def total(self) -> EndpointMetrics:
+        total = EndpointMetrics()
+        with self._lock:
+            for metrics in self.endpoints.values():
+                total.requests += metrics.requests
+                total.cache_hits += metrics.cache_hits
+                total.cache_misses += metrics.cache_misses
+                total.retries += metrics.retries
+                total.bytes_received += metrics.bytes_received
+                total.bytes_decoded += metrics.bytes_decoded
+                total.status_codes.update(metrics.status_codes)
+                total.latency_sum += metrics.latency_sum
+                total.latency_buckets = [
+                    a + b for a, b in zip(total.latency_buckets, metrics.latency_buckets, strict=True)
+                ]
+        return total
+
+    def short_summary(self) -> str:
+        total = self.total()
+        hit_ratio = total.cache_hits / total.requests if total.requests else 0.0
+        return (
+            f"{total.requests} API calls, {total.cache_hits} from cache ({hit_ratio:.0%}), "
+            f"{total.bytes_received / 1e6:.1f} MB downloaded, {total.retries} retries"
+        )
+
+    def summary(self) -> str:
+        lines = [
+            f"{'endpoint':<10} {'calls':>7} {'hits':>7} {'hit %':>6} {'recv MB':>9} {'decoded MB':>11}"
+            + f" {'retries':>8} {'p50 (s)':>8} {'p95 (s)':>8}  status codes"
+        ]
+        with self._lock:
+            endpoints = dict(self.endpoints)
+        for name, metrics in [*endpoints.items(), ("total", self.total())]:
+            hit_ratio = 100 * metrics.cache_hits / metrics.requests if metrics.requests else 0.0
+            p50, p95 = metrics.latency_quantile(0.5), metrics.latency_quantile(0.95)
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(metrics.status_codes.items()))
+            lines.append(
+                f"{name:<10} {metrics.requests:>7} {metrics.cache_hits:>7} {hit_ratio:>6.1f}"
+                + f" {metrics.bytes_received / 1e6:>9.2f} {metrics.bytes_decoded / 1e6:>11.2f} {metrics.retries:>8}"
+                + f" {'-' if p50 is None else f'<={p50}':>8} {'-' if p95 is None else f'<={p95}':>8}  {statuses}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """Metrics in Prometheus text exposition format."""
+        with self._lock:
+            endpoints = dict(self.endpoints)
+
+        lines = []
+
+        def counter(name: str, help: str, values: list[tuple[str, int | float]]) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{{{labels}}} {value}" for labels, value in values)
+
+        counter(
+            "c2c_api_requests_total",
+            "API calls by endpoint type and HTTP status.",
+            [
+                (f'endpoint="{name}",status="{status}"', count)
+                for name, metrics in endpoints.items()
+                for status, count in sorted(metrics.status_codes.items())
+            ],
+        )
+        counter(
+            "c2c_api_cache_hits_total",
+            "API calls served by the HTTP cache.",
+            [(f'endpoint="{name}"', m.cache_hits) for name, m in endpoints.items()],
+        )
+        counter(
+            "c2c_api_cache_misses_total",
+            "API calls sent to the API.",
+            [(f'endpoint="{name}"', m.cache_misses) for name, m in endpoints.items()],
+        )
+        counter(
+            "c2c_api_retries_total",
+            "API calls retried after an error or a rate limiting response.",
+            [(f'endpoint="{name}"', m.retries) for name, m in endpoints.items()],
+        )
+        counter(
+            "c2c_api_received_bytes_total",
+            "Bytes received from the API, before decompression.",
+            [(f'endpoint="{name}"', m.bytes_received) for name, m in endpoints.items()],
+        )
+        counter(
+            "c2c_api_decoded_bytes_total",
+            "Bytes of API responses after decompression, including cache hits.",
+            [(f'endpoint="{name}"', m.bytes_decoded) for name, m in endpoints.items()],
+        )
+
+        name = "c2c_api_request_duration_seconds"
+        lines.append(f"# HELP {name} Latency of the API calls sent to the API.")
+        lines.append(f"# TYPE {name} histogram")
+        for endpoint, metrics in endpoints.items():
+            cumulated = 0
+            for bound, count in zip([*LATENCY_BUCKETS, "+Inf"], metrics.latency_buckets, strict=True):
+                cumulated += count
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulated}')
+            lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {metrics.latency_sum}')
+            lines.append(f'{name}_count{{endpoint="{endpoint}"}} {metrics.cache_misses}')
+
+        return "\n".join(lines) + "\n"
+
+    def save_prometheus(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+metrics = MetricsCollector()
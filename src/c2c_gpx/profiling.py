@@ -0,0 +1,177 @@
+"""Per-stage timing and memory profiling of an export, enabled with the --profile flag."""
+
+import functools
+import heapq
+import json
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, ParamSpec, TypeVar
+
+from .tracing import tracer
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall_time: float = 0.0  # in seconds
+    cpu_time: float = 0.0  # in seconds, of the calling thread
+    # in bytes, allocated above the memory in use when the stage started, None when not measured (see Profiler)
+    peak_memory: int | None = None
+    # min-heap of (wall_time, key) of the slowest keyed calls
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+
+
+class Profiler:
+    """
+    Collects wall time, CPU time, call count and tracemalloc peak of each stage.
+
+    Stages are declared with the stage() decorator or the section() context manager.
+    When the profiler is disabled, they only cost a boolean check.
+    Decorated stages are also recorded as spans when the tracer is enabled.
+
+    The tracemalloc peak is a single counter for the whole process, reset at the start of
+    each stage: the memory is only measured for the stages of the main thread, and their
+    peak includes what the other threads (e.g. the fetch workers) allocate meanwhile.
+    """
+
+    def __init__(self, slowest_count: int = 10) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.slowest_count = slowest_count
+        self.stages: dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, trace_memory: bool = True) -> None:
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        # trace_memory is kept, so that the report still shows memory peaks
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages = {}
+
+    def _memory_stack(self) -> list[list[int]]:
+        # per thread stack of [memory in use at stage start, max peak seen by nested stages]
+        stack: list[list[int]] | None = getattr(self._local, "memory_stack", None)
+        if stack is None:
+            stack = self._local.memory_stack = []
+        return stack
+
+    @contextmanager
+    def section(self, name: str, key: str | None = None) -> Iterator[None]:
+        """Measure the enclosed code as one call of stage name, key identifies the call in the slowest list."""
+        if not self.enabled:
+            yield
+            return
+
+        trace_memory = (
+            self.trace_memory and tracemalloc.is_tracing() and threading.current_thread() is threading.main_thread()
+        )
+        if trace_memory:
+            stack = self._memory_stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            stack.append([current, 0])
+            tracemalloc.reset_peak()
+
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.thread_time() - start_cpu
+
+            peak_memory = None
+            if trace_memory:
+                start_memory, nested_peak = stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+                peak_memory = peak - start_memory
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+
+            self._record(name, key, wall_time, cpu_time, peak_memory)
+
+    def _record(self, name: str, key: str | None, wall_time: float, cpu_time: float, peak_memory: int | None) -> None:
+        with self._lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.wall_time += wall_time
+            stats.cpu_time += cpu_time
+            if peak_memory is not None:
+                stats.peak_memory = max(stats.peak_memory or 0, peak_memory)
+            if key is not None:
+                if len(stats.slowest) < self.slowest_count:
+                    heapq.heappush(stats.slowest, (wall_time, key))
+                else:
+                    heapq.heappushpop(stats.slowest, (wall_time, key))
+
+    def stage(self, name: str, key: Callable[..., str] | None = None) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        """Decorator measuring each call of the function as stage name, key(*args, **kwargs) identifies a call."""
+
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            @functools.wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                if not self.enabled and not tracer.enabled:
+                    return func(*args, **kwargs)
+                call_key = key(*args, **kwargs) if key else None
+                with self.section(name, call_key), tracer.span(name, key=call_key):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats.calls,
+                    "wall_time": stats.wall_time,
+                    "cpu_time": stats.cpu_time,
+                    "peak_memory": stats.peak_memory if self.trace_memory else None,
+                    "slowest": [{"key": key, "wall_time": t} for t, key in sorted(stats.slowest, reverse=True)],
+                }
+                for name, stats in self.stages.items()
+            }
+
+    def save_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.to_dict()}, f, indent=2)
+            f.write("\n")
+
+    def summary(self) -> str:
+        stages = self.to_dict()
+        lines = [f"{'stage':<26} {'calls':>7} {'wall (s)':>10} {'cpu (s)':>10} {'peak mem (MB)':>14}"]
+        for name, stats in stages.items():
+            peak = "-" if stats["peak_memory"] is None else f"{stats['peak_memory'] / 1e6:.1f}"
+            lines.append(
+                f"{name:<26} {stats['calls']:>7} {stats['wall_time']:>10.3f} {stats['cpu_time']:>10.3f} {peak:>14}"
+            )
+
+        slowest = [(s["wall_time"], name, s["key"]) for name, stats in stages.items() for s in stats["slowest"]]
+        if slowest:
+            lines.append("")
+            lines.append("slowest documents:")
+            for wall_time, name, key in sorted(slowest, reverse=True)[: self.slowest_count]:
+                lines.append(f"  {key:<26} {name:<26} {wall_time:>8.3f} s")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
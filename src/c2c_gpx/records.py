@@ -0,0 +1,146 @@
+"""
+Compact records of the exported documents.
+
+An API document holds all its locales, its associations, the line of its geometry and
+metadata, while its waypoint is rendered from a single locale and a few attributes.
+Each fetched document is reduced to a DocumentRecord right away, so that the documents
+of an export are held in a fraction of the memory of their payloads until they are
+written. The line and the associations are only kept when the export uses them, and a
+full document can be fetched again from the HTTP cache.
+"""
+
+import itertools
+import sys
+from collections.abc import Collection
+from dataclasses import dataclass, field
+from typing import Any
+
+from .json_backend import parse_point
+
+# attributes shown in the descriptions, by document type
+ATTRIBUTES = {
+    "routes": (
+        "global_rating", "rock_free_rating", "rock_required_rating", "aid_rating", "engagement_rating",
+        "risk_rating", "equipment_rating", "exposition_rock_rating",
+        "elevation_min", "elevation_max", "orientations",
+        "height_diff_up", "height_diff_down", "height_diff_difficulties",
+    ),
+}  # fmt: skip
+
+# locale fields that are not texts of the document
+LOCALE_METADATA = ("title", "lang", "version", "topic_id")
+
+# association lists of a document, by associated document type
+ASSOCIATION_KEYS = {
+    "waypoints": ("waypoints", "waypoint_children"),
+    "routes": ("routes", "all_routes"),
+    "outings": ("outings", "recent_outings"),
+}
+
+Association = tuple[int, str | None]  # associated document ID, and its waypoint type when listed
+
+
+def document_version(document_data: dict[str, Any], locale: dict[str, Any] | None = None) -> str | None:
+    """
+    Version of a document, of its search listing or of an association, e.g. "12.9.3": C2C counts
+    apart the versions of the document, of its locale (the first one by default) and of its
+    geometry, the last two being left empty when unknown. None when the document version is unknown.
+    """
+    version = document_data.get("version")
+    if version is None:
+        return None
+    if locale is None:
+        locale = (document_data.get("locales") or [{}])[0]
+    geometry = document_data.get("geometry") or {}
+    return ".".join("" if v is None else str(v) for v in (version, locale.get("version"), geometry.get("version")))
+
+
+@dataclass(slots=True)
+class DocumentRecord:
+    """The fields of a document used by its export."""
+
+    document_id: int
+    title: str
+    locale: dict[str, Any]  # texts of the exported locale, in document order, without LOCALE_METADATA
+    version: str | None = None  # see document_version
+    attributes: dict[str, Any] = field(default_factory=dict)  # ATTRIBUTES of the document type
+    coordinates: tuple[float, float] | None = None  # projected (EPSG:3857) point of the document
+    area: str = ""  # title of the main C2C area (mountain range) of the document
+    waypoint_type: str | None = None
+    geom_detail: str | None = None  # line of the routes and outings, when kept for the tracks
+    associations: dict[str, list[Association]] = field(default_factory=dict)  # by ASSOCIATION_KEYS key, when kept
+
+
+def get_locale(route: dict[str, Any], lang: str = "fr") -> dict[str, Any] | None:
+    for loc in route["locales"]:
+        if loc["lang"] == lang:
+            assert isinstance(loc, dict)
+            return loc
+    return None
+
+
+def get_locales(route: dict[str, Any], langs: tuple[str, ...] = ("fr", "en")) -> dict[str, Any]:
+    for lang in langs:
+        if loc := get_locale(route, lang):
+            return loc
+    raise RuntimeError(f"route {route['document_id']} has no locale in {langs}")
+
+
+def get_main_area(document_data: dict[str, Any], lang: str = "fr") -> str:
+    """Title of the mountain range of a document, or of its administrative area or country, preferably in lang."""
+    areas = document_data.get("areas") or []
+    for area_type in ("range", "admin_limits", "country"):
+        for area in areas:
+            if area.get("area_type") == area_type and area.get("locales"):
+                loc = get_locale(area, lang) or area["locales"][0]
+                title = loc["title"]
+                assert isinstance(title, str)
+                return title
+    return ""
+
+
+def get_associations(document_data: dict[str, Any]) -> dict[str, list[Association]]:
+    """Association lists of a document, by key, in both the plain and the {"total", "documents"} formats."""
+    associations = document_data.get("associations") or {}
+    output: dict[str, list[Association]] = {}
+    for key in itertools.chain(*ASSOCIATION_KEYS.values()):
+        documents = associations.get(key) or []
+        if isinstance(documents, dict):
+            documents = documents.get("documents") or []
+        if documents:
+            output[key] = [(d["document_id"], d.get("waypoint_type")) for d in documents]
+    return output
+
+
+def compact_document(
+    doc_type: str,
+    document_data: dict[str, Any],
+    geom_detail: bool = False,
+    associations: bool = False,
+    texts: Collection[str] | None = None,
+    langs: tuple[str, ...] = ("fr", "en"),
+) -> DocumentRecord:
+    """
+    Record of a document payload, keeping its line and its associations only when asked,
+    and only the texts of its locale in texts, when given. The locale is the first found in langs.
+    """
+    loc = get_locales(document_data, langs)
+    geometry = document_data.get("geometry") or {}
+    geom = geometry.get("geom")
+    return DocumentRecord(
+        document_id=document_data["document_id"],
+        title=loc["title"],
+        # strings repeated by most records are shared
+        locale={
+            sys.intern(k): v
+            for k, v in loc.items()
+            if k not in LOCALE_METADATA and v is not None and (texts is None or k in texts)
+        },
+        version=document_version(document_data, loc),
+        attributes={k: document_data[k] for k in ATTRIBUTES.get(doc_type, ()) if k in document_data},
+        coordinates=parse_point(geom) if geom else None,
+        area=sys.intern(get_main_area(document_data, langs[0])),
+        waypoint_type=document_data.get("waypoint_type"),
+        geom_detail=geometry.get("geom_detail") if geom_detail else None,
+        associations=get_associations(document_data) if associations else {},
+    )
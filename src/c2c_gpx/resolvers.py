@@ -0,0 +1,82 @@
+"""
+Documents of the exported URLs: camptocamp.org searches, and collections of documents.
+
+A collection URL is resolved into the documents it gathers, by type:
+
+    books/<id>      the routes of a guidebook
+    areas/<id>      the routes of an area
+    profiles/<id>   the favorite routes and the outings of a user
+
+Several URLs are resolved concurrently, and their documents merged, each document
+being exported once.
+"""
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from .records import document_version
+
+Versions = dict[int, str | None]  # document ID: version (see document_version), None if unknown
+Search = Callable[[str, dict[str, Any]], Versions]
+
+# document types of each kind of collection, with the search parameter selecting the documents of the
+# collection, or None for the documents associated to the collection document
+COLLECTIONS: dict[str, dict[str, str | None]] = {
+    "books": {"routes": None},
+    "areas": {"routes": "a"},
+    "profiles": {"routes": "u", "outings": "u"},
+}
+
+
+def collection_of(path: str) -> tuple[str, int] | None:
+    """Kind and ID of the collection of a URL path, e.g. books/57964/fr/title, or None for other paths."""
+    kind, _, rest = path.strip("/").partition("/")
+    collection_id = rest.split("/")[0]
+    if kind not in COLLECTIONS or not collection_id.isdigit():
+        return None
+    return kind, int(collection_id)
+
+
+def resolve(
+    doc_type: str, params: dict[str, Any], search: Search, get_document: Callable[[str], dict[str, Any]]
+) -> dict[str, Versions]:
+    """
+    Documents of a parsed URL, by type: those found by search(doc_type, params) for a search,
+    and for a collection, those of the searches of its documents, or associated to the
+    collection document, fetched with get_document("books/57964").
+    """
+    collection = collection_of(doc_type)
+    if collection is None:
+        return {doc_type: search(doc_type, params)}
+    kind, collection_id = collection
+    output: dict[str, Versions] = {}
+    for assoc_type, param in COLLECTIONS[kind].items():
+        if param is None:
+            associations = get_document(f"{kind}/{collection_id}").get("associations") or {}
+            output[assoc_type] = {d["document_id"]: document_version(d) for d in associations.get(assoc_type) or []}
+        else:
+            output[assoc_type] = search(assoc_type, {**params, param: collection_id})
+    return output
+
+
+def merge(resolved: Iterable[dict[str, Versions]]) -> dict[str, Versions]:
+    """Documents of several URLs, by type, in order and without duplicates."""
+    output: dict[str, Versions] = {}
+    for documents in resolved:
+        for doc_type, versions in documents.items():
+            merged = output.setdefault(doc_type, {})
+            for document_id, version in versions.items():
+                merged.setdefault(document_id, version)
+    return output
+
+
+def resolve_all(
+    urls: list[tuple[str, dict[str, Any]]],
+    search: Search,
+    get_document: Callable[[str], dict[str, Any]],
+    workers: int = 4,
+) -> dict[str, Versions]:
+    """Documents of the parsed URLs (doc_type, params), resolved in workers threads and merged."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="resolve") as executor:
+        return merge(executor.map(lambda url: resolve(url[0], url[1], search, get_document), urls))
@@ -0,0 +1,135 @@
+"""
+Sharing of the API between concurrent exports, such as those of the export server.
+
+All the uncached API calls of the process are spaced by a single RateLimiter, so the
+request rate to camptocamp.org stays under the limit whatever the number of exports.
+Concurrent fetches (or renders) of the same document are coalesced by a SingleFlight:
+the first caller does the work, the others wait for its result. Exports run as jobs of
+a JobScheduler, a bounded pool of worker threads taking the jobs by priority.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Any, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """
+    Spaces the calls of wait() by at least interval seconds, across threads. The calls
+    also wait for the parent limiter, shared with other limiters, if any.
+    """
+
+    def __init__(self, interval: float, parent: "RateLimiter | None" = None) -> None:
+        self.interval = interval
+        self.parent = parent
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+        if self.parent is not None:
+            self.parent.wait()
+
+
+class SingleFlight:
+    """Coalesces the concurrent calls with the same key: the first one runs, the others share its result."""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, Future[Any]] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0  # calls answered by another one in flight
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            result: T = future.result()
+            return result
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
+
+
+class Cancelled(Exception):
+    """Raised by a job that stopped because it was cancelled."""
+
+
+class Job(Generic[T]):
+    """An export job: future holds its result, cancelled is set when it should stop."""
+
+    def __init__(self, function: Callable[[threading.Event], T], priority: int) -> None:
+        self.function = function
+        self.priority = priority
+        self.future: Future[T] = Future()
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Drop the job if it is still queued, otherwise ask it to stop."""
+        self.cancelled.set()
+        self.future.cancel()
+
+    def run(self) -> None:
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self.function(self.cancelled))
+        except BaseException as e:
+            self.future.set_exception(e)
+
+
+class JobScheduler:
+    """Runs jobs in workers threads, by priority (lowest first) then in order of submission."""
+
+    def __init__(self, workers: int = 4) -> None:
+        self._queue: queue.PriorityQueue[tuple[float, int, Job[Any] | None]] = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self) -> None:
+        while (job := self._queue.get()[2]) is not None:
+            job.run()
+
+    def submit(self, function: Callable[[threading.Event], T], priority: int = 0) -> Job[T]:
+        """Queue function(cancelled), where cancelled is a threading.Event set when the job is cancelled."""
+        job = Job(function, priority)
+        self._queue.put((priority, next(self._sequence), job))
+        return job
+
+    def pending(self) -> int:
+        """Number of queued jobs, not yet started."""
+        return self._queue.qsize()
+
+    def shutdown(self) -> None:
+        """Stop the workers once the queued jobs are done."""
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._sequence), None))
+        for worker in self._workers:
+            worker.join()
@@ -0,0 +1,441 @@
+"""
+HTTP export service, started with c2c_gpx_server.
+
+One warm process serves all the exports: the HTTP cache, the markdown renderer and
+the local index stay loaded between requests. Each export fetches its documents in a
+few threads (see c2c_gpx.main.fetch_records) and renders them in another one, while the GPX is streamed to the client as
+soon as each waypoint is rendered (chunked transfer encoding).
+
+Finished exports are cached by canonical search URL (see c2c_gpx.export_cache), so
+that repeating an export is answered from disk, with an X-Cache: hit header.
+
+Exports are queued by priority for a bounded pool of workers. Concurrent exports
+share the API calls and the renders of their common documents, and all the API calls
+of the process stay under the rate limit (see c2c_gpx.scheduler).
+
+Renders run in worker threads, where the markdown renderer cannot be interrupted (see
+c2c_markdown.time_budget): they are only bounded by the render_max_size of the settings,
+the render_timeout being checked once each text field is rendered.
+
+    GET /export?url=<camptocamp.org search or collection URL>[&priority=<n>]
+                                                  the GPX export, its id is in the X-Export-Id header,
+                                                  lower priorities are started first (default: 0)
+    GET /exports/<id>/events                      progress of an export, as server-sent events
+    DELETE /exports/<id>                          cancel an export
+    GET /health
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import functools
+import json
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO
+from urllib.parse import parse_qs, urlparse
+
+from . import main as exporter
+from .export_cache import ExportCache, canonical_search
+from .records import DocumentRecord
+from .resolvers import collection_of
+from .scheduler import Cancelled, Job, JobScheduler, SingleFlight
+from .settings import ExportSettings
+from .writers import ExportMetadata, GpxWriter
+
+DOC_TYPES = ("routes", "outings", "waypoints", "xreports")
+# documents fetched ahead of the renderer, and rendered waypoints ahead of the client
+FETCH_AHEAD = 16
+FETCH_WORKERS = 4  # threads fetching the documents of each export
+RECORDS_AHEAD = 64
+CHUNK_SIZE = 64 * 1024  # in bytes, records are grouped in chunks up to this size
+MAX_FINISHED_EXPORTS = 100  # kept for their events
+FINISHED = ("done", "failed", "cancelled")
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+@dataclass
+class Export:
+    id: str
+    url: str
+    state: str = "queued"  # queued, searching, exporting, done, failed, cancelled
+    total: int | None = None  # documents found by the search
+    fetched: int = 0
+    written: int = 0
+    error: str | None = None
+    listeners: list["asyncio.Queue[dict[str, Any]]"] = field(default_factory=list)
+    job: Job[None] | None = None
+
+    def event(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "fetched": self.fetched,
+            "written": self.written,
+            "error": self.error,
+        }
+
+    def publish(self) -> None:
+        """Send the current progress to the listeners, from the event loop thread."""
+        event = self.event()
+        for listener in self.listeners:
+            listener.put_nowait(event)
+
+
+class ExportService:
+    """The exports of the server, running in worker threads and streamed by the event loop."""
+
+    def __init__(
+        self, workers: int = 4, cache: ExportCache | None = None, settings: ExportSettings | None = None
+    ) -> None:
+        self.exports: OrderedDict[str, Export] = OrderedDict()
+        self.cache = cache
+        # settings of all the exports
+        self.settings = settings if settings is not None else ExportSettings()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.scheduler = JobScheduler(workers)
+        # waypoints rendered for concurrent exports, by document version
+        self.renders = SingleFlight()
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        self.loop = asyncio.get_running_loop()
+        return await asyncio.start_server(self.handle, host, port)
+
+    def _forget_finished(self) -> None:
+        while len(self.exports) > MAX_FINISHED_EXPORTS:
+            oldest = next(iter(self.exports.values()))
+            if oldest.state not in FINISHED:
+                break
+            self.exports.popitem(last=False)
+
+    def _update(self, export: Export, **changes: Any) -> None:
+        """Update the progress of an export from a worker thread."""
+        assert self.loop is not None
+
+        def update() -> None:
+            for name, value in changes.items():
+                setattr(export, name, value)
+            export.publish()
+
+        self.loop.call_soon_threadsafe(update)
+
+    def _produce(
+        self,
+        export: Export,
+        gpx: GpxWriter,
+        records: "asyncio.Queue[str | Exception | None]",
+        cancelled: threading.Event,
+    ) -> None:
+        """Run an export in a worker thread: put its records in records, then None or the raised exception."""
+        assert self.loop is not None
+        loop = self.loop
+
+        def emit(item: str | Exception | None) -> None:
+            # blocks while the client is behind
+            asyncio.run_coroutine_threadsafe(records.put(item), loop).result()
+
+        settings = self.settings.new_export()
+        try:
+            self._update(export, state="searching")
+            document_ids = [
+                (doc_type, document_id)
+                for doc_type, versions in exporter.get_collection_versions(settings, [export.url]).items()
+                for document_id in versions
+            ]
+            self._update(export, state="exporting", total=len(document_ids))
+
+            documents: queue.Queue[tuple[str, DocumentRecord] | Exception | None] = queue.Queue(maxsize=FETCH_AHEAD)
+
+            def fetch() -> None:
+                try:
+                    with contextlib.closing(exporter.fetch_records(settings, document_ids, FETCH_WORKERS)) as fetched:
+                        for count, (doc_type, _, record) in enumerate(fetched, 1):
+                            if cancelled.is_set():
+                                break
+                            assert record is not None  # not skip_missing
+                            documents.put((doc_type, record))
+                            self._update(export, fetched=count)
+                    documents.put(None)
+                except Exception as e:
+                    documents.put(e)
+
+            fetcher = threading.Thread(target=fetch, name=f"fetch-{export.id}", daemon=True)
+            fetcher.start()
+            written = 0
+            while (item := documents.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                if cancelled.is_set():
+                    continue  # until the fetcher stops
+                doc_type, record = item
+                key = (doc_type, record.document_id, record.version)
+                render = functools.partial(exporter.create_waypoint, settings, doc_type, record)
+                waypoint = self.renders.do(key, render)
+                emit(gpx.record(waypoint))
+                written += 1
+                self._update(export, written=written)
+            if cancelled.is_set():
+                raise Cancelled("export cancelled")
+            emit(None)
+        except Exception as e:
+            emit(e)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            while (await reader.readline()).strip():
+                pass  # request headers are not used
+            method, target, _ = request_line.split(" ", 2)
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+
+        url = urlparse(target)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.strip("/").split("/")
+        try:
+            if method == "DELETE" and len(path) == 2 and path[0] == "exports" and path[1] in self.exports:
+                await self.cancel(writer, self.exports[path[1]])
+            elif method != "GET":
+                await self.respond(writer, 405, "only GET requests are supported, and DELETE of exports\n")
+            elif path == ["health"]:
+                await self.respond(writer, 200, "ok\n")
+            elif path == ["export"]:
+                await self.export(writer, query.get("url", ""), query.get("priority", "0"))
+            elif len(path) == 3 and path[0] == "exports" and path[2] == "events" and path[1] in self.exports:
+                await self.events(writer, self.exports[path[1]])
+            else:
+                await self.respond(writer, 404, "not found\n")
+        except ConnectionError:
+            pass  # the client is gone
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, body: str) -> None:
+        data = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + data
+        )
+        await writer.drain()
+
+    async def export(self, writer: asyncio.StreamWriter, search_url: str, priority: str) -> None:
+        doc_type, params = exporter.parse_c2c_url(search_url)
+        if doc_type not in DOC_TYPES and collection_of(doc_type) is None:
+            await self.respond(writer, 400, f"not a camptocamp.org search or collection URL: {search_url!r}\n")
+            return
+        if not priority.lstrip("-").isdigit():
+            await self.respond(writer, 400, f"priority is not an integer: {priority!r}\n")
+            return
+
+        export = Export(uuid.uuid4().hex[:12], search_url)
+        self.exports[export.id] = export
+        self._forget_finished()
+
+        filename = exporter.export_filename([search_url])
+        headers = (
+            "HTTP/1.1 200 OK\r\nContent-Type: application/gpx+xml; charset=utf-8\r\n"
+            f'Content-Disposition: attachment; filename="{filename}"\r\nX-Export-Id: {export.id}\r\n'
+        )
+        # the descriptions depend on the options of the server
+        settings = self.settings
+        key = (
+            f"{canonical_search(doc_type, params)}"
+            + f"#detail={settings.detail}&compact={settings.compact}&langs={','.join(settings.langs)}"
+        )
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            path, entry = cached
+            export.state, export.total = "done", entry["waypoints"]
+            export.fetched = export.written = entry["waypoints"]
+            writer.write(
+                f"{headers}X-Cache: hit\r\nContent-Length: {entry['size']}\r\nConnection: close\r\n\r\n".encode(
+                    "latin-1"
+                )
+            )
+            # the disk reads are kept out of the event loop
+            f = await asyncio.to_thread(open, path, "rb")
+            with f:
+                while data := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                    writer.write(data)
+                    await writer.drain()
+            return
+
+        writer.write(
+            f"{headers}X-Cache: miss\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n".encode("latin-1")
+        )
+        metadata = ExportMetadata(
+            description="created with c2c-gpx v" + exporter.__version__, link=search_url, time=datetime.datetime.now()
+        )
+        gpx = GpxWriter(filename, metadata)
+        # copy of the response, stored in the cache once complete
+        cache = self.cache
+        file = cache.open(key) if cache is not None else None
+        await self.write_chunk(writer, gpx.header(), file)
+
+        records: asyncio.Queue[str | Exception | None] = asyncio.Queue(maxsize=RECORDS_AHEAD)
+        assert self.loop is not None
+        loop = self.loop
+
+        def dropped(future: "Future[None]") -> None:
+            # cancelled before it started, the producer will not end the records
+            if future.cancelled():
+                loop.call_soon_threadsafe(records.put_nowait, Cancelled("export cancelled"))
+
+        job = export.job = self.scheduler.submit(functools.partial(self._produce, export, gpx, records), int(priority))
+        job.future.add_done_callback(dropped)
+        try:
+            while True:
+                item = await records.get()
+                chunk = []
+                size = 0
+                while isinstance(item, str):
+                    chunk.append(item)
+                    size += len(item)
+                    if size >= CHUNK_SIZE or records.empty():
+                        break
+                    item = records.get_nowait()
+                if chunk:
+                    await self.write_chunk(writer, "".join(chunk), file)
+                if isinstance(item, Cancelled):
+                    export.state = "cancelled"
+                    export.publish()
+                    return
+                if isinstance(item, Exception):
+                    export.state, export.error = "failed", f"{type(item).__name__}: {item}"
+                    export.publish()
+                    # the client sees an incomplete chunked response
+                    return
+                if item is None:
+                    break
+            await self.write_chunk(writer, gpx.footer(), file)
+            if cache is not None and file is not None:
+                cache.commit(key, file, export.written)
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            export.state = "done"
+            export.publish()
+        finally:
+            if cache is not None and file is not None and not file.closed:
+                cache.discard(file)
+            if not job.future.done():
+                # the client is gone: stop the producer, and drain its records until it ends
+                job.cancel()
+                while not job.future.done() or not records.empty():
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(records.get(), timeout=0.1)
+                if export.state not in FINISHED:
+                    export.state, export.error = "failed", "client disconnected"
+                    export.publish()
+
+    async def cancel(self, writer: asyncio.StreamWriter, export: Export) -> None:
+        if export.state in FINISHED or export.job is None:
+            await self.respond(writer, 200, f"export {export.state}\n")
+            return
+        export.job.cancel()
+        await self.respond(writer, 200, "export cancelled\n")
+
+    async def write_chunk(self, writer: asyncio.StreamWriter, text: str, file: BinaryIO | None = None) -> None:
+        data = text.encode("utf-8")
+        if file is not None:
+            file.write(data)
+        if data:
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+    async def events(self, writer: asyncio.StreamWriter, export: Export) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        listener: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        export.listeners.append(listener)
+        try:
+            event = export.event()
+            while True:
+                writer.write(f"event: {event['state']}\ndata: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+                if event["state"] in FINISHED:
+                    break
+                event = await listener.get()
+                # only the latest progress is sent to slow clients
+                while not listener.empty():
+                    event = listener.get_nowait()
+        finally:
+            export.listeners.remove(listener)
+
+
+async def serve(host: str, port: int, workers: int, cache: ExportCache | None, settings: ExportSettings) -> None:
+    server = await ExportService(workers, cache, settings).start(host, port)
+    for sock in server.sockets:
+        print(f"serving exports on http://{sock.getsockname()[0]}:{sock.getsockname()[1]}/export?url=...")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve camptocamp.org GPX exports over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Listening address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8000, help="Listening port (default: %(default)s)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Exports running at the same time, others are queued (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--detail",
+        choices=exporter.DETAIL_LEVELS,
+        default=ExportSettings.detail,
+        help="Level of detail of the descriptions (default: %(default)s)",
+    )
+    parser.add_argument("--compact", action="store_true", help="Minify the descriptions")
+    parser.add_argument(
+        "--langs",
+        type=exporter.parse_langs,
+        default=ExportSettings.langs,
+        help="Comma separated languages of the texts, by preference (default: fr,en)",
+    )
+    parser.add_argument(
+        "--http-cache",
+        default="c2c_cache",
+        metavar="CACHE_FILE",
+        help="SQLite file caching the API responses for a day (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="c2c_exports",
+        help="Directory of the cache of the finished exports (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        default=24.0,
+        help="Age (in hours) above which a cached export is run again (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=exporter.parse_size,
+        default="500M",
+        help="Total size of the cached exports, the least recently used are removed beyond it (default: 500M)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Run every export, without caching them")
+    args = parser.parse_args()
+
+    settings = ExportSettings(
+        session=exporter.http_session(args.http_cache), langs=args.langs, detail=args.detail, compact=args.compact
+    )
+    cache = None if args.no_cache else ExportCache(args.cache_dir, args.cache_max_age * 3600, args.cache_size)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(args.host, args.port, args.workers, cache, settings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Settings of an export.
+
+The c2c_gpx command, the Exporter and the export server each build an ExportSettings and
+pass it to the functions of c2c_gpx.main fetching and rendering the documents, so that
+exports with different settings can run at the same time in a process.
+"""
+
+from dataclasses import dataclass, field, replace
+
+import requests
+
+from .images import ImageEmbedder
+from .scheduler import RateLimiter
+from .spatial_index import SpatialIndex
+
+
+@dataclass
+class ExportReport:
+    """What happened during an export, printed by the c2c_gpx command once it is over."""
+
+    # (document, field) of the texts that exceeded the render budget
+    render_fallbacks: list[tuple[str, str]] = field(default_factory=list)
+    # total size (in bytes) of the minified descriptions (--compact), before and after minification
+    compact_sizes: list[int] = field(default_factory=lambda: [0, 0])
+
+
+@dataclass
+class ExportSettings:
+    """Settings of an export, those of the c2c_gpx command options of the same name."""
+
+    # HTTP session of the API calls, with its cache (see main.http_session), None for uncached calls
+    session: requests.Session | None = None
+    # spaces the API calls sent to the network, None for the limiter shared by the process (main.api_rate_limiter),
+    # which a private limiter should have as its parent
+    rate_limiter: RateLimiter | None = None
+
+    # languages of the exported texts, by preference: documents are fetched with their locale in the first one,
+    # or in the next ones when they are not translated in it
+    langs: tuple[str, ...] = ("fr", "en")
+    # level of detail of the descriptions: title (link only), summary (main fields and summary) or full
+    detail: str = "full"
+    # max size (in bytes) of a description, its sections are truncated or dropped in priority order to fit
+    description_budget: int | None = None
+    # minify the descriptions (--compact)
+    compact: bool = False
+
+    # budget for rendering one text field, above which it is exported as plain text
+    render_max_size: int | None = 100_000  # in characters
+    render_timeout: float | None = 5.0  # in seconds
+
+    # answers the searches in areas already searched (--local-index), optionally checking their count with
+    # the API, or comparing them with the API search (--verify-index)
+    spatial_index: SpatialIndex | None = None
+    check_new_documents: bool = False
+    verify_index: bool = False
+
+    # replaces the image links of the descriptions by thumbnails (--images)
+    image_embedder: ImageEmbedder | None = None
+
+    # optional fields kept in the document records
+    record_tracks: bool = False  # line of the routes and outings (--tracks)
+    record_associations: bool = False  # associated documents (--associations)
+
+    # filled by the export, new ones for each export (see new_export)
+    report: ExportReport = field(default_factory=ExportReport)
+    # languages of the documents listed by the searches (their available_langs), by (doc_type, document_id)
+    document_langs: dict[tuple[str, int], tuple[str, ...]] = field(default_factory=dict)
+
+    def new_export(self) -> "ExportSettings":
+        """Copy of the settings for a new export, with an empty report."""
+        return replace(self, report=ExportReport(), document_langs={})
@@ -0,0 +1,165 @@
+"""
+Local index of the documents returned by the searches, enabled with the --local-index flag.
+
+Each search is recorded with the area it covers: its bbox, for the documents matching
+its other parameters. The documents are indexed by coordinates in an SQLite R-tree, so
+that a later search of the same documents in a sub-area is answered locally, without
+the paginated API calls.
+
+The common filters (activities, ratings, elevations...) are evaluated locally on the
+indexed fields of the documents, so that a search narrowing the filters of a previous
+one is answered locally too.
+"""
+
+import json
+import math
+import sqlite3
+import threading
+import time
+from typing import Any
+from urllib.parse import urlencode
+
+from .filters import INDEXED_FIELDS, LocalFilters, implies, matches, split_filters
+from .json_backend import parse_point
+from .records import document_version
+from .resolvers import Versions
+
+# search parameters that do not change the set of matching documents
+PAGING_PARAMS = ("bbox", "limit", "offset")
+
+SCHEMA_VERSION = 3  # older index files are emptied
+SCHEMA = """
+-- exact coordinates (the R-tree stores them as 32 bits floats) and filtered fields (JSON) of the search results
+CREATE TABLE documents (document_id INTEGER PRIMARY KEY, version TEXT, x REAL, y REAL, fields TEXT);
+CREATE VIRTUAL TABLE document_points USING rtree(id, min_x, max_x, min_y, max_y);
+-- documents found by the searches, by their filters that are not evaluated locally
+CREATE TABLE search_documents (filters TEXT, document_id INTEGER, PRIMARY KEY (filters, document_id)) WITHOUT ROWID;
+-- bbox and locally evaluated filters (JSON) of the searches
+CREATE TABLE coverage (filters TEXT, local TEXT, min_x REAL, min_y REAL, max_x REAL, max_y REAL, time REAL);
+CREATE INDEX coverage_filters ON coverage (filters);
+"""
+TABLES = ("documents", "document_points", "search_documents", "coverage")
+
+# documents in a bbox, pre-selected with the R-tree, parameters are the bbox twice (min x, max x, min y, max y)
+IN_BBOX = (
+    "SELECT d.document_id FROM document_points p JOIN documents d ON d.document_id = p.id "
+    + "WHERE p.max_x >= ? AND p.min_x <= ? AND p.max_y >= ? AND p.min_y <= ? "
+    + "AND d.x BETWEEN ? AND ? AND d.y BETWEEN ? AND ?"
+)
+
+BBox = tuple[float, float, float, float]  # min x, min y, max x, max y in Web Mercator
+WORLD: BBox = (-math.inf, -math.inf, math.inf, math.inf)
+
+
+def search_filters(doc_type: str, params: dict[str, Any]) -> tuple[str, LocalFilters]:
+    """Key of the filters of a search left to the API, and its filters evaluated locally (bbox excluded)."""
+    local, remote = split_filters(doc_type, {k: v for k, v in params.items() if k not in PAGING_PARAMS})
+    return f"{doc_type}?{urlencode(sorted((k, str(v)) for k, v in remote.items()))}", local
+
+
+def search_bbox(params: dict[str, Any]) -> BBox:
+    if "bbox" not in params:
+        return WORLD
+    min_x, min_y, max_x, max_y = (float(v) for v in str(params["bbox"]).split(","))
+    return min_x, min_y, max_x, max_y
+
+
+def document_point(document: dict[str, Any]) -> tuple[float, float] | None:
+    geom = (document.get("geometry") or {}).get("geom")
+    if not geom:
+        return None
+    return parse_point(geom)
+
+
+class SpatialIndex:
+    """SQLite R-tree of the documents of the searches, and of the areas covered by each search."""
+
+    def __init__(self, path: str, max_age: float = 86400.0) -> None:
+        self.path = path
+        self.max_age = max_age  # in seconds, older searches are sent to the API again
+        # shared by the threads resolving several URLs
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            with self.connection:
+                for table in TABLES:
+                    self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self.connection.executescript(SCHEMA)
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add_search(self, doc_type: str, params: dict[str, Any], documents: list[dict[str, Any]]) -> bool:
+        """
+        Record the documents (with their geometry) of a search, replacing those of the previous
+        searches in its bbox and matching its filters. Returns False when a document has no
+        coordinates, the search is then not recorded.
+        """
+        points = [(document, document_point(document)) for document in documents]
+        if any(point is None for _, point in points):
+            return False
+        filters, local = search_filters(doc_type, params)
+        min_x, min_y, max_x, max_y = search_bbox(params)
+        with self._lock, self.connection:
+            # documents that the search would have found if they still matched
+            previous = [
+                document_id
+                for document_id, _, fields in self._documents(filters, (min_x, min_y, max_x, max_y))
+                if matches(doc_type, fields, local)
+            ]
+            self.connection.executemany(
+                "DELETE FROM search_documents WHERE filters = ? AND document_id = ?",
+                [(filters, document_id) for document_id in previous],
+            )
+            for document, point in points:
+                assert point is not None
+                document_id = document["document_id"]
+                fields = {field: document[field] for field in INDEXED_FIELDS if field in document}
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                    (document_id, document_version(document), *point, json.dumps(fields)),
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO document_points VALUES (?, ?, ?, ?, ?)",
+                    (document_id, point[0], point[0], point[1], point[1]),
+                )
+                self.connection.execute("INSERT OR IGNORE INTO search_documents VALUES (?, ?)", (filters, document_id))
+            self.connection.execute(
+                "INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filters, json.dumps(local), min_x, min_y, max_x, max_y, time.time()),
+            )
+        return True
+
+    def _documents(self, filters: str, bbox: BBox) -> list[tuple[int, str | None, dict[str, Any]]]:
+        """ID, version and indexed fields of the documents found by searches with filters in bbox."""
+        min_x, min_y, max_x, max_y = bbox
+        rows = self.connection.execute(
+            "SELECT d.document_id, d.version, d.fields FROM documents d JOIN search_documents s USING (document_id) "
+            + f"WHERE s.filters = ? AND d.document_id IN ({IN_BBOX})",
+            (filters, *(min_x, max_x, min_y, max_y) * 2),
+        )
+        return [(document_id, version, json.loads(fields)) for document_id, version, fields in rows]
+
+    def query(self, doc_type: str, params: dict[str, Any]) -> Versions | None:
+        """
+        IDs and versions of the documents of a search, None unless its bbox is within the
+        area of a recent search with the same API filters, and the same or wider local filters.
+        """
+        filters, local = search_filters(doc_type, params)
+        bbox = min_x, min_y, max_x, max_y = search_bbox(params)
+        with self._lock:
+            searches = self.connection.execute(
+                "SELECT local FROM coverage WHERE filters = ? AND min_x <= ? AND min_y <= ? AND max_x >= ? "
+                + "AND max_y >= ? AND time >= ?",
+                (filters, min_x, min_y, max_x, max_y, time.time() - self.max_age),
+            ).fetchall()
+            if not any(
+                implies(doc_type, local, {key: tuple(value) for key, value in json.loads(covered).items()})
+                for (covered,) in searches
+            ):
+                return None
+            documents = self._documents(filters, bbox)
+        found = {document_id: version for document_id, version, fields in documents if matches(doc_type, fields, local)}
+        return dict(sorted(found.items(), reverse=True))
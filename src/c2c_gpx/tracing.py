@@ -0,0 +1,104 @@
+"""Timeline of an export as Chrome trace events, enabled with the --trace flag.
+
+The written file can be loaded in https://ui.perfetto.dev or chrome://tracing.
+Format reference: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager
+from typing import Any
+
+_NO_SPAN: AbstractContextManager[None] = contextlib.nullcontext()
+
+
+class Tracer:
+    """Records spans as complete ("X") trace events, with one track per thread."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter_ns()
+        self._thread_names: dict[int, str] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.events = []
+            self._thread_names = {}
+            self._origin = time.perf_counter_ns()
+
+    def _now(self) -> float:
+        # trace event timestamps are in microseconds
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def _span_stack(self) -> list[dict[str, Any]]:
+        stack: list[dict[str, Any]] | None = getattr(self._local, "span_stack", None)
+        if stack is None:
+            stack = self._local.span_stack = []
+        return stack
+
+    def span(self, name: str, category: str = "export", **args: Any) -> AbstractContextManager[None]:
+        """Record the enclosed code as a span, args are shown in the span details."""
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, category, args)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, category: str, args: dict[str, Any]) -> Iterator[None]:
+        thread = threading.current_thread()
+        start = self._now()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start,
+            "pid": os.getpid(),
+            "tid": thread.native_id,
+            "args": {k: v for k, v in args.items() if v is not None},
+        }
+        stack = self._span_stack()
+        stack.append(event)
+        try:
+            yield
+        finally:
+            stack.pop()
+            event["dur"] = self._now() - start
+            with self._lock:
+                self.events.append(event)
+                assert thread.native_id is not None
+                self._thread_names.setdefault(thread.native_id, thread.name)
+
+    def annotate(self, **args: Any) -> None:
+        """Add args to the innermost open span of the current thread."""
+        if not self.enabled:
+            return
+        stack = self._span_stack()
+        if stack:
+            stack[-1]["args"].update(args)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._thread_names.items()
+            ]
+            return {"traceEvents": metadata + sorted(self.events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+
+tracer = Tracer()
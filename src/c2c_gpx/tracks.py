@@ -0,0 +1,127 @@
+"""
+Tracks of the routes and outings, exported with the --tracks flag.
+
+The geom_detail lines of the documents are simplified with the Douglas-Peucker
+algorithm in Web Mercator, then converted to WGS84 with a single transform call for
+all the documents. Point distances are computed on NumPy arrays when it is installed
+(pip install c2c_gpx[tracks]), and point by point otherwise.
+"""
+
+import math
+from collections.abc import Callable, Hashable, Sequence
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from .json_backend import loads
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    try:
+        import numpy as np
+    except ImportError:  # optional dependency
+        np = None
+
+K = TypeVar("K", bound=Hashable)
+
+# a line of (x, y) or (longitude, latitude) points
+Segment = list[tuple[float, float]]
+
+EARTH_RADIUS = 6378137.0  # of the Web Mercator projection, in meters
+COORDINATE_DECIMALS = 6  # about 0.1 m
+
+
+def parse_geom_detail(geom_detail: str) -> list[Segment]:
+    """Segments of a (multi) line geometry as (x, y) points, elevations and times are dropped."""
+    geometry = loads(geom_detail)
+    if geometry["type"] == "LineString":
+        lines = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiLineString":
+        lines = geometry["coordinates"]
+    else:
+        return []
+    return [[(point[0], point[1]) for point in line] for line in lines if len(line) >= 2]
+
+
+def _farthest_point(points: Sequence[tuple[float, float]], first: int, last: int) -> tuple[int, float]:
+    """Index and distance of the point between first and last that is the farthest from the [first, last] line."""
+    (ax, ay), (bx, by) = points[first], points[last]
+    dx, dy = bx - ax, by - ay
+    norm = math.hypot(dx, dy)
+    index, distance = first, -1.0
+    for i in range(first + 1, last):
+        x, y = points[i]
+        d = abs(dx * (y - ay) - dy * (x - ax)) / norm if norm else math.hypot(x - ax, y - ay)
+        if d > distance:
+            index, distance = i, d
+    return index, distance
+
+
+def _farthest_point_numpy(points: Any, first: int, last: int) -> tuple[int, float]:
+    a, b = points[first], points[last]
+    inner = points[first + 1 : last]
+    dx, dy = b - a
+    norm = math.hypot(dx, dy)
+    if norm:
+        distances = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / norm
+    else:
+        distances = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+    i = int(np.argmax(distances))
+    return first + 1 + i, float(distances[i])
+
+
+def simplify(points: Segment, tolerance: float) -> Segment:
+    """
+    Douglas-Peucker simplification of a Web Mercator line, keeping the points farther than
+    tolerance meters (on the ground) from the simplified line.
+    """
+    if tolerance <= 0 or len(points) < 3:
+        return points
+    # Web Mercator distances are stretched by 1 / cos(latitude) = cosh(y / R)
+    tolerance *= math.cosh(points[0][1] / EARTH_RADIUS)
+
+    if np is not None:
+        array = np.asarray(points, dtype=float)
+        farthest_point: Callable[[Any, int, int], tuple[int, float]] = _farthest_point_numpy
+    else:
+        array, farthest_point = points, _farthest_point
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, distance = farthest_point(array, first, last)
+        if distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep, strict=True) if kept]
+
+
+def to_wgs84(
+    tracks: dict[K, list[Segment]], transform: Callable[[Any, Any], tuple[Any, Any]]
+) -> dict[K, list[Segment]]:
+    """Convert the Web Mercator tracks to (longitude, latitude) points with a single transform(xs, ys) call."""
+    xs = [x for segments in tracks.values() for segment in segments for x, _ in segment]
+    ys = [y for segments in tracks.values() for segment in segments for _, y in segment]
+    if not xs:
+        return {key: [] for key in tracks}
+    if np is not None:
+        lons, lats = transform(np.asarray(xs), np.asarray(ys))
+        lons, lats = np.round(lons, COORDINATE_DECIMALS).tolist(), np.round(lats, COORDINATE_DECIMALS).tolist()
+    else:
+        lons, lats = transform(xs, ys)
+        lons = [round(lon, COORDINATE_DECIMALS) for lon in lons]
+        lats = [round(lat, COORDINATE_DECIMALS) for lat in lats]
+
+    converted: dict[K, list[Segment]] = {}
+    start = 0
+    for key, segments in tracks.items():
+        converted[key] = []
+        for segment in segments:
+            end = start + len(segment)
+            converted[key].append(list(zip(lons[start:end], lats[start:end], strict=True)))
+            start = end
+    return converted
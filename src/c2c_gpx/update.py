@@ -0,0 +1,72 @@
+"""
+Reading of an existing GPX export, for the --update mode.
+
+Waypoints are read as XML text, one at a time, so that the unchanged ones can be
+written back verbatim. They are identified by the camptocamp.org link at the start
+of their description, and by the document version stored in their <src> element (see
+records.document_version). Exports with tracks are not supported, their tracks would be
+dropped.
+"""
+
+import gzip
+import html
+import io
+import re
+from collections.abc import Iterator
+from typing import IO
+
+WPT_RE = re.compile(r"<wpt\b.*?</wpt>", re.DOTALL)
+DOCUMENT_LINK_RE = re.compile(r"camptocamp\.org/([a-z]+)/(\d+)")
+VERSION_RE = re.compile(r"<src>camptocamp\.org version ([^<]+)</src>")
+EXPORT_LINK_RE = re.compile(r'<metadata>.*?<link href="([^"]*)"', re.DOTALL)
+
+
+def open_text(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.GzipFile(path, "r"), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_gpx_waypoints(path: str, chunk_size: int = 1 << 20) -> Iterator[str]:
+    """Yield the XML of each <wpt> element of a GPX file, reading it by chunks."""
+    with open_text(path) as f:
+        buffer = ""
+        while chunk := f.read(chunk_size):
+            buffer += chunk
+            end = 0
+            for match in WPT_RE.finditer(buffer):
+                yield match[0]
+                end = match.end()
+            # keep an unfinished waypoint, or what may be the start of its tag
+            start = buffer.find("<wpt", end)
+            buffer = buffer[start:] if start != -1 else buffer[-len("<wpt") :]
+
+
+def has_tracks(path: str, chunk_size: int = 1 << 20) -> bool:
+    """Whether a GPX file has <trk> elements, reading it by chunks."""
+    with open_text(path) as f:
+        buffer = ""
+        while chunk := f.read(chunk_size):
+            buffer = buffer[-len("<trk") :] + chunk
+            if "<trk>" in buffer:
+                return True
+    return False
+
+
+def read_waypoint_key(xml: str) -> tuple[str, int, str | None] | None:
+    """(document type, document id, version) of a waypoint, None if it is not a camptocamp.org document."""
+    desc_start = xml.find("<desc>")
+    link = DOCUMENT_LINK_RE.search(xml, desc_start) if desc_start != -1 else None
+    if link is None:
+        return None
+    version = VERSION_RE.search(xml)
+    return link[1], int(link[2]), version[1] if version else None
+
+
+def read_export_link(path: str) -> str | None:
+    """Search URL stored in the metadata of an export."""
+    with open_text(path) as f:
+        header = f.read(1 << 16)
+    header = header.split("<wpt", 1)[0]
+    match = EXPORT_LINK_RE.search(header)
+    return html.unescape(match[1]) if match else None
@@ -0,0 +1,544 @@
+"""
+Output writers of an export, fed one waypoint at a time.
+
+Each writer streams its format to a file: the header when entered, one record per
+write() call and the footer when exited, so that several formats can be written in
+the same pass over the documents without holding the whole output in memory.
+
+ShardedWriter splits the output of a writer into several files, by waypoint count,
+byte size, grid cell or C2C area, and writes an index of the shards.
+
+Outputs with a .gz suffix are compressed while they are written. A writer can also
+write to an open text stream, which is left open.
+"""
+
+import csv
+import datetime
+import gzip
+import io
+import json
+import math
+import os
+import re
+import tempfile
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import IO, ClassVar
+from xml.sax.saxutils import escape, quoteattr
+
+import gpxpy.gpx
+import gpxpy.gpxfield
+
+
+@dataclass
+class Waypoint:
+    """A document exported as a point, shared by all the output formats."""
+
+    doc_type: str
+    document_id: int
+    name: str
+    latitude: float
+    longitude: float
+    description: str  # HTML
+    url: str
+    area: str = ""  # title of the main C2C area (mountain range) of the document
+    version: str | None = None  # of the C2C document (see records.document_version)
+    # segments of (longitude, latitude) points of the route or outing line (--tracks)
+    track: list[list[tuple[float, float]]] | None = None
+
+    def to_gpx(self) -> gpxpy.gpx.GPXWaypoint:
+        wp = gpxpy.gpx.GPXWaypoint(
+            latitude=self.latitude, longitude=self.longitude, name=self.name, description=self.description
+        )
+        if self.version is not None:
+            # read back by --update
+            wp.source = f"camptocamp.org version {self.version}"
+        return wp
+
+
+@dataclass
+class ExportMetadata:
+    description: str
+    link: str  # search URL of the export
+    time: datetime.datetime
+
+
+class Writer(ABC):
+    """Base class of the writers, subclasses define the extension and the header, record and footer texts."""
+
+    extension: ClassVar[str]
+    newline: ClassVar[str | None] = None
+
+    def __init__(self, path: str, metadata: ExportMetadata, stream: IO[str] | None = None) -> None:
+        self.path = path  # name of the output, the stream when there is one
+        self.metadata = metadata
+        self.stream = stream
+        self.count = 0
+        self.size = 0  # in bytes, written so far, before compression
+        self._file: IO[str] | None = None
+        self._paused = False
+
+    @property
+    def compressed(self) -> bool:
+        return self.path.endswith(".gz")
+
+    def _open(self, mode: str) -> IO[str]:
+        if self.stream is not None:
+            return self.stream
+        if self.compressed:
+            return io.TextIOWrapper(gzip.GzipFile(self.path, mode), encoding="utf-8", newline=self.newline)
+        return open(self.path, mode, encoding="utf-8", newline=self.newline)
+
+    def __enter__(self) -> "Writer":
+        self._file = self._open("w")
+        self._write_text(self.header())
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        if self._file is None and not self._paused:
+            # already closed
+            return
+        self._resume()
+        assert self._file is not None
+        try:
+            if exc_type is None:
+                self._write_text(self.footer())
+        finally:
+            if self.stream is None:
+                self._file.close()
+            self._file = None
+
+    def pause(self) -> None:
+        """Close the file until the next write, to bound the number of open files."""
+        if self._file is not None and not self._paused and self.stream is None:
+            self._file.close()
+            self._paused = True
+
+    def _resume(self) -> None:
+        if self._paused:
+            # appended to a gzip file, the output is a valid multi-member gzip stream
+            self._file = self._open("a")
+            self._paused = False
+
+    def _write_text(self, text: str) -> None:
+        assert self._file is not None, "writers must be entered before writing"
+        self._file.write(text)
+        self.size += len(text.encode("utf-8"))
+
+    def write(self, waypoint: Waypoint) -> None:
+        self.write_record(self.record(waypoint))
+        self.write_track(waypoint)
+
+    def write_record(self, record: str) -> None:
+        """Write the text returned by record() for the next waypoint."""
+        self._resume()
+        self._write_text(record)
+        self.count += 1
+
+    def write_track(self, waypoint: Waypoint) -> None:  # noqa: B027, optional for the subclasses
+        """Write the track of the last written waypoint, for formats that do not include it in its record."""
+
+    def file_size(self) -> int:
+        """Size of the closed output file, after compression."""
+        if self.stream is not None:
+            return self.size
+        return os.path.getsize(self.path)
+
+    def summary(self) -> str:
+        return f"file {self.path} created with {self.count} waypoints ({format_sizes(self.size, self.file_size())})"
+
+    def header(self) -> str:
+        return ""
+
+    @abstractmethod
+    def record(self, waypoint: Waypoint) -> str:
+        """Text of a waypoint, written between the header and the footer."""
+
+    def footer(self) -> str:
+        return ""
+
+
+class GpxWriter(Writer):
+    """
+    GPX 1.1, byte for byte what gpxpy writes for the same waypoints.
+
+    Tracks follow all the waypoints in the GPX schema, they are kept until the footer,
+    in memory up to tracks_spool_size characters and in a temporary file beyond.
+    """
+
+    extension = "gpx"
+    version = "1.1"
+    tracks_spool_size = 1 << 20
+
+    def __init__(self, path: str, metadata: ExportMetadata, stream: IO[str] | None = None) -> None:
+        super().__init__(path, metadata, stream)
+        self._tracks: tempfile.SpooledTemporaryFile[str] | None = None
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        try:
+            super().__exit__(exc_type, exc, traceback)
+        finally:
+            if self._tracks is not None:
+                self._tracks.close()
+                self._tracks = None
+
+    def header(self) -> str:
+        gpx = gpxpy.gpx.GPX()
+        gpx.description = self.metadata.description
+        gpx.link = self.metadata.link.replace("&", "&amp;").replace("<", "&lt;")
+        gpx.time = self.metadata.time
+        # the XML of a GPX without waypoints, up to its closing tag
+        xml = gpx.to_xml(self.version)
+        return xml.removesuffix("</gpx>").rstrip("\n")
+
+    def record(self, waypoint: Waypoint) -> str:
+        return gpxpy.gpxfield.gpx_fields_to_xml(waypoint.to_gpx(), "wpt", self.version, indent="  ")
+
+    def write_track(self, waypoint: Waypoint) -> None:
+        if waypoint.track:
+            if self._tracks is None:
+                # closed by __exit__
+                self._tracks = tempfile.SpooledTemporaryFile(  # noqa: SIM115
+                    self.tracks_spool_size, mode="w+", encoding="utf-8"
+                )
+            self._tracks.write(self.track_record(waypoint))
+
+    def track_record(self, waypoint: Waypoint) -> str:
+        assert waypoint.track
+        segments = "".join(
+            "\n    <trkseg>"
+            + "".join(f'\n      <trkpt lat="{lat}" lon="{lon}"></trkpt>' for lon, lat in segment)
+            + "\n    </trkseg>"
+            for segment in waypoint.track
+        )
+        return (
+            f"\n  <trk>\n    <name>{escape(waypoint.name)}</name>\n    <link href={quoteattr(waypoint.url)}></link>"
+            + f"{segments}\n  </trk>"
+        )
+
+    def footer(self) -> str:
+        if self._tracks is not None:
+            # copied by chunks rather than returned with the closing tag
+            self._tracks.seek(0)
+            while chunk := self._tracks.read(1 << 16):
+                self._write_text(chunk)
+        return "\n</gpx>"
+
+
+class GeoJsonWriter(Writer):
+    """GeoJSON FeatureCollection of points, the export metadata is stored as a foreign member."""
+
+    extension = "geojson"
+
+    def header(self) -> str:
+        metadata = {
+            "description": self.metadata.description,
+            "link": self.metadata.link,
+            "time": self.metadata.time.isoformat(),
+        }
+        return f'{{"type": "FeatureCollection", "metadata": {json.dumps(metadata)}, "features": ['
+
+    def record(self, waypoint: Waypoint) -> str:
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [waypoint.longitude, waypoint.latitude]},
+            "properties": {
+                "doc_type": waypoint.doc_type,
+                "document_id": waypoint.document_id,
+                "name": waypoint.name,
+                "url": waypoint.url,
+                "description": waypoint.description,
+            },
+        }
+        separator = "," if self.count else ""
+        record = f"{separator}\n{json.dumps(feature, ensure_ascii=False)}"
+        if waypoint.track:
+            # the track is a feature of its own, described by the point one
+            line = {
+                "type": "Feature",
+                "geometry": {"type": "MultiLineString", "coordinates": waypoint.track},
+                "properties": {
+                    "doc_type": waypoint.doc_type,
+                    "document_id": waypoint.document_id,
+                    "name": waypoint.name,
+                    "url": waypoint.url,
+                },
+            }
+            record += f",\n{json.dumps(line, ensure_ascii=False)}"
+        return record
+
+    def footer(self) -> str:
+        return "\n]}\n"
+
+
+class KmlWriter(Writer):
+    """KML 2.2 document of placemarks, descriptions are escaped HTML."""
+
+    extension = "kml"
+
+    def header(self) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+            "<Document>\n"
+            f"  <name>{escape(self.metadata.description)}</name>\n"
+            f'  <atom:link xmlns:atom="http://www.w3.org/2005/Atom" href={quoteattr(self.metadata.link)}/>\n'
+        )
+
+    def record(self, waypoint: Waypoint) -> str:
+        return (
+            f"  <Placemark id={quoteattr(f'{waypoint.doc_type}-{waypoint.document_id}')}>\n"
+            f"    <name>{escape(waypoint.name)}</name>\n"
+            f"    <description>{escape(waypoint.description)}</description>\n"
+            f"{self.geometry(waypoint)}"
+            "  </Placemark>\n"
+        )
+
+    def geometry(self, waypoint: Waypoint) -> str:
+        point = f"<Point><coordinates>{waypoint.longitude},{waypoint.latitude}</coordinates></Point>"
+        if not waypoint.track:
+            return f"    {point}\n"
+        lines = "".join(
+            "\n      <LineString><coordinates>"
+            + " ".join(f"{lon},{lat}" for lon, lat in segment)
+            + "</coordinates></LineString>"
+            for segment in waypoint.track
+        )
+        return f"    <MultiGeometry>\n      {point}{lines}\n    </MultiGeometry>\n"
+
+    def footer(self) -> str:
+        return "</Document>\n</kml>\n"
+
+
+class CsvWriter(Writer):
+    """One row per waypoint, with a header row. Tracks are not exported."""
+
+    extension = "csv"
+    newline = ""  # the csv module writes its own line endings
+    columns = ("doc_type", "document_id", "name", "latitude", "longitude", "area", "url", "description")
+
+    def _row(self, values: Iterable[object]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        return self._row(self.columns)
+
+    def record(self, waypoint: Waypoint) -> str:
+        return self._row(getattr(waypoint, column) for column in self.columns)
+
+
+WRITERS: dict[str, type[Writer]] = {
+    writer.extension: writer for writer in (GpxWriter, GeoJsonWriter, KmlWriter, CsvWriter)
+}
+
+
+def format_sizes(size: int, file_size: int) -> str:
+    if file_size == size:
+        return f"{size / 1e3:.1f} kB"
+    return f"{size / 1e3:.1f} kB, {file_size / 1e3:.1f} kB compressed"
+
+
+def split_path(path: str) -> tuple[str, str, str]:
+    """Split path into stem, writer extension (empty if unknown) and compression suffix (.gz or empty)."""
+    suffix = ".gz" if path.endswith(".gz") else ""
+    stem, dot, extension = path.removesuffix(suffix).rpartition(".")
+    if not dot or extension not in WRITERS:
+        return path.removesuffix(suffix), "", suffix
+    return stem, extension, suffix
+
+
+def output_paths(filename: str, formats: list[str], compress: bool = False) -> dict[str, str]:
+    """
+    Path of each output format.
+
+    A single output is written to filename as is, several ones share its stem
+    with the extension of their format. With compress, paths get a .gz suffix.
+    """
+    stem, _, suffix = split_path(filename)
+    if compress:
+        suffix = ".gz"
+    if len(formats) == 1:
+        return {formats[0]: filename.removesuffix(".gz") + suffix}
+    return {fmt: f"{stem}.{WRITERS[fmt].extension}{suffix}" for fmt in formats}
+
+
+def slugify(text: str) -> str:
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", ascii_text.lower()).strip("-")
+
+
+def grid_key(cell_size: float) -> Callable[[Waypoint], str]:
+    """Shard key of the grid cell (of cell_size degrees) holding a waypoint, named after its south west corner."""
+
+    def key(waypoint: Waypoint) -> str:
+        lat = math.floor(waypoint.latitude / cell_size) * cell_size
+        lon = math.floor(waypoint.longitude / cell_size) * cell_size
+        return f"{'N' if lat >= 0 else 'S'}{abs(lat):05.2f}_{'E' if lon >= 0 else 'W'}{abs(lon):06.2f}"
+
+    return key
+
+
+def area_key(waypoint: Waypoint) -> str:
+    return slugify(waypoint.area) or "no-area"
+
+
+@dataclass
+class Shard:
+    key: str | None
+    number: int
+    writer: Writer
+    # west, south, east, north
+    bbox: list[float] = field(default_factory=lambda: [math.inf, math.inf, -math.inf, -math.inf])
+
+    def extend(self, waypoint: Waypoint) -> None:
+        self.bbox = [
+            min(self.bbox[0], waypoint.longitude),
+            min(self.bbox[1], waypoint.latitude),
+            max(self.bbox[2], waypoint.longitude),
+            max(self.bbox[3], waypoint.latitude),
+        ]
+
+
+class ShardedWriter:
+    """
+    Splits the output of a writer class into shards, each one written as its own stream.
+
+    Waypoints are grouped by key(waypoint) when a key is given, then each group is cut
+    into files of at most max_count waypoints and about max_size bytes. Shards are named
+    {stem}_{key}_{number}.{extension}, and listed in {stem}_index.{extension}.json.
+    At most max_open_files shards are kept open, the least recently written ones are
+    paused until their next waypoint.
+    """
+
+    def __init__(
+        self,
+        writer_class: type[Writer],
+        path: str,
+        metadata: ExportMetadata,
+        max_count: int | None = None,
+        max_size: int | None = None,
+        key: Callable[[Waypoint], str] | None = None,
+        max_open_files: int = 64,
+    ) -> None:
+        self.writer_class = writer_class
+        self.metadata = metadata
+        self.max_count = max_count
+        self.max_size = max_size
+        self.key = key
+        self.max_open_files = max_open_files
+        stem, extension, self.suffix = split_path(path)
+        self.stem = stem if extension == writer_class.extension else path.removesuffix(self.suffix)
+        self.path = f"{self.stem}_index.{writer_class.extension}.json"
+        self.shards: list[Shard] = []
+        self._current: dict[str | None, Shard] = {}
+        # open shards, least recently written first
+        self._open: OrderedDict[int, Shard] = OrderedDict()
+
+    @property
+    def count(self) -> int:
+        return sum(shard.writer.count for shard in self.shards)
+
+    def __enter__(self) -> "ShardedWriter":
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        # every shard is closed, the first error is raised once they are
+        error: BaseException | None = None
+        for shard in self.shards:
+            try:
+                shard.writer.__exit__(exc_type, exc, traceback)
+            except BaseException as e:
+                error = error or e
+        if exc_type is None:
+            self.save_index()
+        if error is not None:
+            raise error
+
+    def _shard_path(self, key: str | None, number: int) -> str:
+        parts = [self.stem] + ([key] if key else []) + [f"{number:03d}"]
+        return f"{'_'.join(parts)}.{self.writer_class.extension}{self.suffix}"
+
+    def _new_shard(self, key: str | None) -> Shard:
+        previous = self._current.get(key)
+        number = previous.number + 1 if previous else 1
+        shard = Shard(key, number, self.writer_class(self._shard_path(key, number), self.metadata))
+        shard.writer.__enter__()
+        self.shards.append(shard)
+        self._current[key] = shard
+        return shard
+
+    def _is_full(self, shard: Shard, record: str) -> bool:
+        if shard.writer.count == 0:
+            return False
+        if self.max_count is not None and shard.writer.count >= self.max_count:
+            return True
+        return self.max_size is not None and shard.writer.size + len(record.encode("utf-8")) > self.max_size
+
+    def write(self, waypoint: Waypoint) -> None:
+        key = self.key(waypoint) if self.key else None
+        shard = self._current.get(key) or self._new_shard(key)
+        record = shard.writer.record(waypoint)
+        if self._is_full(shard, record):
+            # shards of a key are written in order, a full one is done
+            shard.writer.__exit__(None, None, None)
+            self._open.pop(id(shard), None)
+            shard = self._new_shard(key)
+            record = shard.writer.record(waypoint)
+
+        shard.writer.write_record(record)
+        shard.writer.write_track(waypoint)
+        shard.extend(waypoint)
+
+        self._open[id(shard)] = shard
+        self._open.move_to_end(id(shard))
+        while len(self._open) > self.max_open_files:
+            self._open.popitem(last=False)[1].writer.pause()
+
+    def index(self) -> dict[str, object]:
+        return {
+            "description": self.metadata.description,
+            "link": self.metadata.link,
+            "time": self.metadata.time.isoformat(),
+            "format": self.writer_class.extension,
+            "waypoints": self.count,
+            "shards": [
+                {
+                    "path": os.path.basename(shard.writer.path),
+                    "key": shard.key,
+                    "waypoints": shard.writer.count,
+                    "bytes": shard.writer.size,
+                    "file_bytes": shard.writer.file_size(),
+                    "bbox": shard.bbox,
+                }
+                for shard in self.shards
+            ],
+        }
+
+    def save_index(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.index(), f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    def summary(self) -> str:
+        pattern = f"{self.stem}_*.{self.writer_class.extension}{self.suffix}"
+        size = sum(shard.writer.size for shard in self.shards)
+        file_size = sum(shard.writer.file_size() for shard in self.shards)
+        return (
+            f"{len(self.shards)} files {pattern} created with {self.count} waypoints"
+            + f" ({format_sizes(size, file_size)}), index {self.path}"
+        )
+
+
+OutputWriter = Writer | ShardedWriter
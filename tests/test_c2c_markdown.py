@@ -0,0 +1,61 @@
+"""Tests for the c2c_markdown package."""
+
+from c2c_gpx import c2c_markdown
+from c2c_gpx.c2c_markdown.prefilter import get_block_markers
+
+import pytest
+
+
+class TestBlockMarkers:
+    """Tests for the block processor prefilter."""
+
+    def test_plain_text(self) -> None:
+        """Test that plain text has no marker."""
+        parser = c2c_markdown._get_markdown_parser().parser
+        assert get_block_markers(parser, "some text\nwith L# and ## inside") == frozenset()
+
+    def test_all_markers(self) -> None:
+        """Test that each block syntax is detected at line start."""
+        parser = c2c_markdown._get_markdown_parser().parser
+        block = "\n".join(
+            [
+                "## header",
+                "   L# | 5a",
+                "R# | 5b",
+                "  !!! warning",
+                "[img=12/]",
+                "[video]https://vimeo.com/1[/video]",
+                "[p]",
+            ]
+        )
+        assert get_block_markers(parser, block) == {"header", "ltag", "alert", "image", "video", "ptag"}
+
+    def test_rendering(self) -> None:
+        """Test that prefiltered processors still render their blocks."""
+        html = c2c_markdown.parse_code("text\n\n## Approach # 10 mn\n\n!! info\n\nL# | 6a")
+        assert "<h3" in html
+        assert 'c2c:role="info"' in html
+        assert 'c2c:role="ltag"' in html
+
+
+class TestRenderBudget:
+    """Tests for the state of the renderer after an interrupted parsing."""
+
+    def test_interrupted_cleaner_dropped(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a cleaner interrupted by the time budget is not reused."""
+
+        class Cleaner:
+            def clean(self, text: str) -> str:
+                raise c2c_markdown.RenderBudgetExceeded("parsing took more than 1s")
+
+        monkeypatch.setattr(c2c_markdown, "_cleaner", Cleaner())
+        with pytest.raises(c2c_markdown.RenderBudgetExceeded):
+            c2c_markdown.parse_code("text")
+        assert c2c_markdown._cleaner is None
+        assert c2c_markdown.parse_code("text") == "<p>text</p>"
+
+    def test_preprocess(self) -> None:
+        """Test that the text is checked against max_size before being preprocessed, then parsed."""
+        assert c2c_markdown.parse_code("text", max_size=4, preprocess=str.upper) == "<p>TEXT</p>"
+        with pytest.raises(c2c_markdown.RenderBudgetExceeded):
+            c2c_markdown.parse_code("text", max_size=3, preprocess=str.upper)
@@ -0,0 +1,43 @@
+"""Tests for the c2c_gpx compact module."""
+
+from c2c_gpx.compact import minify_html
+
+
+class TestMinifyHtml:
+    """Tests for the minify_html function."""
+
+    def test_whitespace_and_line_breaks(self) -> None:
+        """Test that whitespace and line breaks around blocks are collapsed, but not inline spaces."""
+        text = "<p> a <b>x</b> <i>y</i></p>\n<br/><br/>z<br/><br/><br/>w</br><hr>"
+        assert minify_html(text) == "<p>a <b>x</b> <i>y</i></p>z<br/>w<hr>"
+
+    def test_empty_sections(self) -> None:
+        """Test that empty paragraphs and headings without content are dropped."""
+        text = "<h1>Historique</h1> <p> </p><h1>Description</h1><h3>Approche</h3><p>text</p><h1>Remarques</h1> "
+        assert minify_html(text) == "<h1>Description</h1><h3>Approche</h3><p>text</p>"
+
+    def test_pre_is_kept(self) -> None:
+        """Test that the whitespace of preformatted blocks is kept."""
+        assert minify_html("<pre>a\n  b</pre>  <p> c </p>") == "<pre>a\n  b</pre><p>c</p>"
+
+    def test_c2c_links_and_attributes(self) -> None:
+        """Test that camptocamp.org URL slugs and site attributes are stripped."""
+        text = (
+            '<h3 id="approche">Approche</h3><p><a href="https://www.camptocamp.org/waypoints/39912/fr/parking">P</a>'
+            + '<span translate="">L</span><img alt="x" c2c:role="emoji" c2c:svg-name="rock"></p>'
+        )
+        assert minify_html(text) == (
+            '<h3 id="approche">Approche</h3><p><a href="https://www.camptocamp.org/waypoints/39912">P</a>'
+            + '<span>L</span><img alt="x"></p>'
+        )
+
+    def test_toc_anchors(self) -> None:
+        """Test that the headings keep the ids the table of contents links to, and empty ones are still dropped."""
+        text = (
+            '<div c2c:role="toc"><ul><li><a href="#voie">Voie</a></li></ul></div>'
+            + '<h3 id="voie" c2c:role="header">Voie</h3><p>text</p><h3 id="vide">Vide</h3>'
+        )
+        assert (
+            minify_html(text)
+            == '<div><ul><li><a href="#voie">Voie</a></li></ul></div><h3 id="voie">Voie</h3><p>text</p>'
+        )
@@ -0,0 +1,71 @@
+"""Tests for the c2c_gpx export_cache module."""
+
+import os
+import time
+from pathlib import Path
+
+from c2c_gpx.export_cache import ExportCache, canonical_search
+
+
+def store(cache: ExportCache, key: str, data: bytes) -> None:
+    file = cache.open(key)
+    file.write(data)
+    cache.commit(key, file, 1)
+
+
+class TestExportCache:
+    """Tests for the cache of the finished exports."""
+
+    def test_canonical_search(self) -> None:
+        """Test that searches of the same documents have the same canonical form."""
+        search = canonical_search(
+            "routes", {"act": "skitouring,rock_climbing", "bbox": "600000.2,5700000,700000,5800000.4", "limit": 30}
+        )
+        assert search == canonical_search(
+            "routes", {"bbox": "600000,5700000,700000,5800000", "act": ["rock_climbing", "skitouring"], "offset": 30}
+        )
+        assert search == "routes?act=rock_climbing%2Cskitouring&bbox=600000%2C5700000%2C700000%2C5800000"
+
+        # ranges and unknown parameters keep their order
+        assert canonical_search("routes", {"frat": "5a,7a"}) != canonical_search("routes", {"frat": "7a,5a"})
+        assert canonical_search("routes", {"u": "1,2"}) != canonical_search("routes", {"u": "2,1"})
+        assert canonical_search("routes", {"act": "hiking"}) != canonical_search("outings", {"act": "hiking"})
+
+    def test_freshness(self, tmp_path: Path) -> None:
+        """Test that exports are served until max_age, also by a new cache of the same directory."""
+        cache = ExportCache(str(tmp_path), max_age=60)
+        assert cache.get("routes?") is None
+        store(cache, "routes?", b"<gpx/>")
+
+        cached = ExportCache(str(tmp_path), max_age=60).get("routes?")
+        assert cached is not None
+        path, entry = cached
+        assert Path(path).read_bytes() == b"<gpx/>"
+        assert (entry["size"], entry["waypoints"]) == (6, 1)
+
+        cache.index["routes?"]["time"] = time.time() - 61
+        assert cache.get("routes?") is None
+
+    def test_eviction(self, tmp_path: Path) -> None:
+        """Test that the least recently used exports are removed beyond max_bytes, with their file."""
+        cache = ExportCache(str(tmp_path), max_bytes=25)
+        for key in ("a", "b"):
+            store(cache, key, b"x" * 10)
+        b_path = os.path.join(tmp_path, cache.index["b"]["file"])
+        cache.index["a"]["used"] = cache.index["b"]["used"] + 1  # a served after b
+        store(cache, "c", b"x" * 10)
+
+        assert sorted(cache.index) == ["a", "c"]
+        assert not os.path.exists(b_path)
+        assert sorted(os.listdir(tmp_path)) == sorted(
+            [cache.index["a"]["file"], cache.index["c"]["file"], "index.json"]
+        )
+
+    def test_discard(self, tmp_path: Path) -> None:
+        """Test that an incomplete export leaves no file."""
+        cache = ExportCache(str(tmp_path))
+        file = cache.open("routes?")
+        file.write(b"<gpx>")
+        cache.discard(file)
+        assert os.listdir(tmp_path) == []
+        assert cache.get("routes?") is None
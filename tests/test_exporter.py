@@ -0,0 +1,92 @@
+"""Tests for the c2c_gpx exporter module."""
+
+import io
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+from c2c_gpx import Exporter
+from c2c_gpx.settings import ExportSettings
+
+import gpxpy
+import pytest
+
+ROUTE_URL = "https://www.camptocamp.org/routes?act=rock_climbing"
+
+
+def route(document_id: int) -> dict[str, Any]:
+    return {
+        "document_id": document_id,
+        "version": 2,
+        "elevation_min": 1650,
+        "elevation_max": None,
+        "orientations": ["S"],
+        "height_diff_up": None,
+        "height_diff_down": None,
+        "height_diff_difficulties": 200,
+        "geometry": {"geom": '{"type": "Point", "coordinates": [700000.0, 5700000.0]}'},
+        "locales": [{"lang": "fr", "title": f"Voie {document_id}", "description": "Belle *voie*"}],
+        "areas": [],
+    }
+
+
+@pytest.fixture
+def api(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    """Serve routes 1 to 5 without calling the API, return the IDs of the fetched documents."""
+    fetched: list[int] = []
+
+    def get_document_data(settings: ExportSettings, doc_type: str, document_id: int) -> dict[str, Any]:
+        fetched.append(document_id)
+        return route(document_id)
+
+    monkeypatch.setattr(
+        "c2c_gpx.main.get_document_versions", lambda settings, doc_type, params: dict.fromkeys(range(1, 6), 2)
+    )
+    monkeypatch.setattr("c2c_gpx.main.get_document_data", get_document_data)
+    return fetched
+
+
+class TestExporter:
+    """Tests for the Python API."""
+
+    def test_import_has_no_side_effect(self, tmp_path: Path) -> None:
+        """Test that importing the package creates no HTTP cache."""
+        subprocess.run([sys.executable, "-c", "import c2c_gpx.main"], cwd=tmp_path, check=True)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_waypoints(self, api: list[int]) -> None:
+        """Test that the waypoints are rendered lazily, with the settings of the exporter."""
+        with Exporter(http_cache=None, detail="title", workers=1) as exporter:
+            waypoints = exporter.waypoints(ROUTE_URL)
+            first = next(waypoints)
+            assert len(api) < 5
+            assert first.name == "Voie 1"
+            assert "Belle" not in first.description
+            assert [waypoint.document_id for waypoint in waypoints] == [2, 3, 4, 5]
+
+    def test_write(self, api: list[int]) -> None:
+        """Test that an export is written to a text stream, left open."""
+        stream = io.StringIO()
+        with Exporter(http_cache=None) as exporter:
+            assert exporter.write(stream, ROUTE_URL) == 5
+        gpx = gpxpy.parse(stream.getvalue())
+        assert [waypoint.name for waypoint in gpx.waypoints] == [f"Voie {i}" for i in range(1, 6)]
+        assert gpx.link == ROUTE_URL
+        assert "<em>voie</em>" in (gpx.waypoints[0].description or "")
+
+    def test_report_per_export(self, api: list[int]) -> None:
+        """Test that each export has its own report."""
+        with Exporter(http_cache=None, compact=True) as exporter:
+            exporter.write(io.StringIO(), ROUTE_URL)
+            sizes = list(exporter.report.compact_sizes)
+            exporter.write(io.StringIO(), ROUTE_URL)
+        assert sizes[0] > sizes[1] > 0
+        assert exporter.report.compact_sizes == sizes
+
+    def test_invalid_settings(self) -> None:
+        """Test that invalid settings are rejected."""
+        with pytest.raises(ValueError, match="unknown detail"):
+            Exporter(http_cache=None, detail="everything")
+        with pytest.raises(ValueError, match="unknown format"):
+            Exporter(http_cache=None).write(io.StringIO(), ROUTE_URL, format="pdf")
@@ -0,0 +1,57 @@
+"""Tests for the c2c_gpx filters module."""
+
+from c2c_gpx.filters import implies, matches, split_filters
+
+ROUTE = {
+    "activities": ["rock_climbing", "mountain_climbing"],
+    "orientations": ["S", "SE"],
+    "global_rating": "AD+",
+    "rock_free_rating": "5c+",
+    "elevation_min": 1200,
+    "elevation_max": 2150,
+    "areas": [{"document_id": 14274}, {"document_id": 14384}],
+}
+
+
+class TestFilters:
+    """Tests for the local evaluation of the search filters."""
+
+    def test_split_filters(self) -> None:
+        """Test that supported filters are parsed, and the others left to the API."""
+        local, remote = split_filters("routes", {"act": "rock_climbing,skitouring", "frat": "5a,6a", "u": "12"})
+        assert local == {"act": ("rock_climbing", "skitouring"), "frat": (7, 13)}
+        assert remote == {"u": "12"}
+        assert split_filters("routes", {"frat": "6a"}) == ({}, {"frat": "6a"})
+        assert split_filters("xreports", {"act": "skitouring"}) == ({}, {"act": "skitouring"})
+
+    def test_matches(self) -> None:
+        """Test the evaluation of the lists and ranges, with their bounds."""
+        cases = {
+            "act=skitouring,rock_climbing": True,
+            "act=skitouring": False,
+            "fac=N,SE": True,
+            "a=14384": True,
+            "a=1": False,
+            "grat=AD+,TD": True,
+            "grat=F,AD": False,
+            "frat=5c+,5c+": True,
+            "frat=6a,9c+": False,
+            "rmaxa=2000,2150": True,
+            "rmina=1300,2000": False,
+            "act=rock_climbing&frat=4a,5c": False,
+        }
+        for query, expected in cases.items():
+            params = dict(param.split("=") for param in query.split("&"))
+            local, _ = split_filters("routes", params)
+            assert matches("routes", ROUTE, local) == expected, query
+
+        local, _ = split_filters("waypoints", {"walt": "1000,2000"})
+        assert not matches("waypoints", {"waypoint_type": "hut"}, local)
+
+    def test_implies(self) -> None:
+        """Test that narrower filters imply wider ones."""
+        wide, _ = split_filters("routes", {"act": "rock_climbing,skitouring", "frat": "5a,7a"})
+        narrow, _ = split_filters("routes", {"act": "rock_climbing", "frat": "6a,6c", "fac": "S"})
+        assert implies("routes", narrow, wide)
+        assert not implies("routes", wide, narrow)
+        assert implies("routes", narrow, {})
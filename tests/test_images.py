@@ -0,0 +1,106 @@
+"""Tests for the c2c_gpx images module."""
+
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from c2c_gpx.images import ImageEmbedder, ThumbnailCache, collect_image_ids, get_thumbnails
+
+LINK = '<a href="https://media.camptocamp.org/c2corg-active/uploads/images/{}.jpg">[📸 {}]</a>'
+
+
+def fake_image(image_id: int) -> bytes:
+    return b"\xff\xd8" + str(image_id).encode() * 10 + b"\xff\xd9"
+
+
+class TestThumbnails:
+    """Tests for the download and cache of the thumbnails."""
+
+    def test_collect_image_ids(self) -> None:
+        """Test that image references are collected once, in order."""
+        texts = ["[img=12 right]caption[/img] and [img=3/]", "[img=12/] [[images/4|not a reference]]"]
+        assert collect_image_ids(texts) == [12, 3]
+
+    def test_thumbnails_are_cached(self, tmp_path: Path) -> None:
+        """Test that thumbnails are downloaded once, skipped on errors, and reused by the next exports."""
+        fetched: list[int] = []
+
+        def fetch(image_id: int) -> bytes:
+            fetched.append(image_id)
+            if image_id == 2:
+                raise ValueError("not found")
+            return fake_image(image_id)
+
+        cache_dir = os.path.join(tmp_path, "cache")
+        thumbnails = get_thumbnails([1, 2, 3], fetch, ThumbnailCache(cache_dir), 200, workers=2)
+        assert thumbnails == {1: fake_image(1), 3: fake_image(3)}
+        assert sorted(fetched) == [1, 2, 3]
+
+        fetched.clear()
+        thumbnails = get_thumbnails([3, 1], fetch, ThumbnailCache(cache_dir), 200)
+        assert list(thumbnails) == [3, 1]
+        assert fetched == []
+
+    def test_identical_images_are_stored_once(self, tmp_path: Path) -> None:
+        """Test that the cache is addressed by content."""
+        cache = ThumbnailCache(str(tmp_path))
+        assert cache.put("1:200", b"same") == cache.put("2:200", b"same")
+        assert cache.get("2:200") == b"same"
+        assert cache.get("3:200") is None
+
+    def test_concurrent_put(self, tmp_path: Path) -> None:
+        """Test that an image stored by several threads at once is written whole, without temporary files left."""
+        cache = ThumbnailCache(str(tmp_path))
+        data = fake_image(1) * 10_000
+        with ThreadPoolExecutor(8) as executor:
+            digests = set(executor.map(lambda i: cache.put(f"{i}:200", data), range(32)))
+        (digest,) = digests
+        assert cache.get("31:200") == data
+        assert os.listdir(os.path.join(tmp_path, digest[:2])) == [f"{digest}.jpg"]
+
+
+class TestImageEmbedder:
+    """Tests for the substitution of the image links."""
+
+    def test_data_uri(self) -> None:
+        """Test that linked images are inlined with their caption, and others are left as is."""
+        embedder = ImageEmbedder({1: fake_image(1)})
+        text = f"<p>{LINK.format(1, 'the crux')} {LINK.format(2, 'missing')}</p>"
+        data = base64.b64encode(fake_image(1)).decode()
+        assert embedder.substitute(text) == (
+            f'<p><span><img src="data:image/jpeg;base64,{data}" alt="the crux"><br/><i>the crux</i></span> '
+            + f"{LINK.format(2, 'missing')}</p>"
+        )
+
+    def test_caption_alt(self) -> None:
+        """Test that the alt text of a sanitized caption is its text, not escaped again."""
+        embedder = ImageEmbedder({1: fake_image(1)})
+        text = embedder.substitute(LINK.format(1, 'fissure <em>"large"</em> &amp; dalle'))
+        assert 'alt="fissure &quot;large&quot; &amp; dalle"' in text
+        assert '<i>fissure <em>"large"</em> &amp; dalle</i>' in text
+
+    def test_budget(self) -> None:
+        """Test that images over the budget are kept as links, repeated data URIs being counted each time."""
+        # data URIs of 43 and 55 bytes
+        embedder = ImageEmbedder({1: fake_image(1), 22: fake_image(22)}, budget=100)
+        text = embedder.substitute(LINK.format(1, "") + LINK.format(22, "") + LINK.format(1, ""))
+        assert text.count("<img") == 2
+        assert text.endswith(LINK.format(1, ""))
+        assert embedder.used == 98
+        assert embedder.skipped == set()
+
+        embedder = ImageEmbedder({1: fake_image(1), 22: fake_image(22)}, budget=60)
+        text = embedder.substitute(LINK.format(1, "") + LINK.format(22, "") + LINK.format(1, ""))
+        assert text.count("<img") == 1
+        assert embedder.skipped == {22}
+
+    def test_sidecar(self, tmp_path: Path) -> None:
+        """Test that sidecar images are written once and referenced relatively to the output."""
+        sidecar_dir = os.path.join(tmp_path, "out_images")
+        embedder = ImageEmbedder({1: fake_image(1)}, sidecar_dir=sidecar_dir)
+        text = embedder.substitute(LINK.format(1, "") + LINK.format(1, ""))
+        (name,) = os.listdir(sidecar_dir)
+        assert text == f'<span><img src="out_images/{name}" alt="1"></span>' * 2
+        with open(os.path.join(sidecar_dir, name), "rb") as f:
+            assert f.read() == fake_image(1)
@@ -0,0 +1,49 @@
+"""Tests for the c2c_gpx json_backend module."""
+
+from typing import Any
+
+from c2c_gpx import json_backend
+from c2c_gpx.json_backend import loads, parse_point
+
+import pytest
+
+POINTS = {
+    '{"type": "Point", "coordinates": [700000.5, 5700000.25]}': (700000.5, 5700000.25),
+    '{"type":"Point","coordinates":[ -1e3 , 2 ]}': (-1000.0, 2.0),
+    '{"coordinates": [1.5, 2.5, 1200.0], "type": "Point"}': (1.5, 2.5),
+    '{"type": "Point", "bbox": [0, 0, 9, 9], "coordinates": [3, 4]}': (3.0, 4.0),
+}
+
+
+class TestJsonBackend:
+    """Tests for the decoding of the responses and geometries."""
+
+    def test_loads(self) -> None:
+        """Test that the backend decodes both bytes and text."""
+        assert loads(b'{"documents": [{"document_id": 1}], "total": 1}') == {
+            "documents": [{"document_id": 1}],
+            "total": 1,
+        }
+        assert loads('{"title": "Arête"}') == {"title": "Arête"}
+
+    @pytest.mark.parametrize("backend", ["json", json_backend.BACKEND])
+    def test_parse_point(self, backend: str, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test the points parsed directly and by the installed backend."""
+        monkeypatch.setattr("c2c_gpx.json_backend.BACKEND", backend)
+        for geom, point in POINTS.items():
+            assert parse_point(geom) == point
+
+    def test_direct_parse(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that points are parsed without the JSON decoder of the standard library."""
+        decoded: list[str] = []
+
+        def loads(text: str) -> dict[str, Any]:
+            decoded.append(text)
+            return {"coordinates": [0, 0]}
+
+        monkeypatch.setattr("c2c_gpx.json_backend.BACKEND", "json")
+        monkeypatch.setattr("c2c_gpx.json_backend.loads", loads)
+        assert parse_point('{"type": "Point", "coordinates": [700000.0, 5700000.0]}') == (700000.0, 5700000.0)
+        assert decoded == []
+        assert parse_point('{"type": "Point", "coordinates": ["x", "y"]}') == (0.0, 0.0)
+        assert len(decoded) == 1
@@ -1,21 +1,47 @@
 """Tests for the c2c_gpx main module."""
 
-from typing import Any
+import argparse
+import dataclasses
+import datetime
+import io
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import IO, Any
 
 from c2c_gpx.main import (
+    api_get,
     clean_and_html,
     create_route_altitude,
     create_route_grade,
     create_route_height,
     create_route_orientation,
+    export_filename,
+    format_route_description,
     generate_filename,
-    get_locale,
-    get_locales,
+    get_associated_documents,
+    get_associated_ids,
+    get_document_data,
+    get_documents_data,
     increment_pitches,
     parse_c2c_url,
+    parse_langs,
+    render_field,
+    update_gpx,
 )
+from c2c_gpx.records import DocumentRecord, compact_document, get_associations, get_locale, get_locales
+from c2c_gpx.scheduler import RateLimiter
+from c2c_gpx.settings import ExportSettings
+from c2c_gpx.writers import ExportMetadata, GpxWriter, Waypoint
 
 import pytest
+import requests
+import requests_cache
+import urllib3
 
 
 class TestCreateRouteGrade:
@@ -299,6 +325,158 @@ class TestCleanAndHtml:
         assert "<b>L1</b>" in result
 
 
+class TestRenderField:
+    """Tests for render_field function."""
+
+    def test_within_budget(self) -> None:
+        """Test that a normal field is rendered as markdown."""
+        result = render_field(ExportSettings(), "**bold**", "routes", 1, "description")
+        assert "<strong>bold</strong>" in result
+
+    def test_too_long(self) -> None:
+        """Test that a field longer than the budget is exported as escaped plain text."""
+        settings = ExportSettings(render_max_size=10)
+        result = render_field(settings, "**<b>bold</b>**\nsecond line", "routes", 1, "description")
+        assert result == "**&lt;b&gt;bold&lt;/b&gt;**<br/>second line"
+        assert settings.report.render_fallbacks == [("routes/1", "description")]
+
+    def test_too_slow(self) -> None:
+        """Test that a field with catastrophic backtracking is interrupted."""
+        text = "[img=1]" * 14000
+        settings = ExportSettings(render_timeout=0.2)
+        result = render_field(settings, text, "waypoints", 2, "remarks")
+        assert result == text
+        assert settings.report.render_fallbacks == [("waypoints/2", "remarks")]
+
+
+ROUTE = compact_document(
+    "routes",
+    {
+        "document_id": 1,
+        "global_rating": "D",
+        "elevation_min": 1650,
+        "elevation_max": 1910,
+        "orientations": ["S"],
+        "height_diff_up": 300,
+        "height_diff_down": None,
+        "height_diff_difficulties": 260,
+        "locales": [
+            {
+                "lang": "fr",
+                "title": "Voie des Dalles",
+                "summary": "Belle voie",
+                "description": "\n\n".join(f"Paragraphe {i} " + "x" * 200 for i in range(10)),
+                "gear": "Dégaines",
+                "route_history": "Ouverte en 1987 " + "y" * 2000,
+            }
+        ],
+    },
+)
+
+
+class TestFormatRouteDescription:
+    """Tests for the detail levels and size budget of format_route_description."""
+
+    def rendered_fields(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        fields: list[str] = []
+
+        def render_field(settings: ExportSettings, text: str, doc_type: str, document_id: int, field: str) -> str:
+            fields.append(field)
+            return f"<p>{text}</p>"
+
+        monkeypatch.setattr("c2c_gpx.main.render_field", render_field)
+        return fields
+
+    def test_full(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that all sections are rendered and shown in document order."""
+        fields = self.rendered_fields(monkeypatch)
+        result = format_route_description(ExportSettings(), ROUTE)
+        assert fields == ["summary", "description", "gear", "route_history"]
+        assert result.index("Historique") < result.index("Description") < result.index("Équipement")
+
+    def test_summary(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the sections of the full description are not rendered."""
+        fields = self.rendered_fields(monkeypatch)
+        result = format_route_description(ExportSettings(detail="summary"), ROUTE)
+        assert fields == ["summary"]
+        assert "<b>Cotations</b> : D" in result
+        assert "Description" not in result
+
+    def test_title(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that nothing is rendered."""
+        fields = self.rendered_fields(monkeypatch)
+        assert "Cotations" not in format_route_description(ExportSettings(detail="title"), ROUTE)
+        assert fields == []
+
+    def test_budget(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that sections are truncated and dropped in priority order, without rendering dropped ones."""
+        fields = self.rendered_fields(monkeypatch)
+        result = format_route_description(ExportSettings(description_budget=1000), ROUTE)
+        assert len(result.encode("utf-8")) <= 1000
+        assert "Paragraphe 2" in result
+        assert "Paragraphe 9" not in result
+        assert "<p>…</p>" in result
+        assert fields == ["summary", "description", "gear"]
+
+
+class TestAssociations:
+    """Tests for the export of associated documents."""
+
+    ROUTES: dict[int, DocumentRecord] = {
+        document_id: DocumentRecord(document_id, f"Route {document_id}", {}, associations=get_associations(data))
+        for document_id, data in {
+            1: {
+                "associations": {
+                    "waypoints": [{"document_id": 10, "waypoint_type": "access"}, {"document_id": 11}],
+                    "routes": [{"document_id": 2}, {"document_id": 3}],
+                    "recent_outings": {"total": 1, "documents": [{"document_id": 100}]},
+                }
+            },
+            2: {
+                "associations": {
+                    "waypoints": [
+                        {"document_id": 10, "waypoint_type": "access"},
+                        {"document_id": 12, "waypoint_type": "hut"},
+                    ],
+                    "routes": [{"document_id": 1}],
+                }
+            },
+        }.items()
+    }
+
+    def test_get_associated_ids(self) -> None:
+        """Test both association list formats, and the waypoint type filter."""
+        assert get_associated_ids(self.ROUTES[1], "outings") == [100]
+        assert get_associated_ids(self.ROUTES[1], "routes") == [2, 3]
+        # waypoints listed without type are kept until they are fetched
+        assert get_associated_ids(self.ROUTES[2], "waypoints", {"hut"}) == [12]
+        assert get_associated_ids(self.ROUTES[1], "waypoints", {"hut"}) == [11]
+
+    def test_fetched_once(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that associations are deduplicated, and exclude the exported documents."""
+        fetched: list[tuple[str, list[int]]] = []
+
+        def get_documents_data(
+            settings: ExportSettings,
+            doc_type: str,
+            document_ids: list[int],
+            skip_missing: bool = False,
+            workers: int = 4,
+        ) -> dict[int, DocumentRecord]:
+            fetched.append((doc_type, document_ids))
+            return {
+                doc_id: DocumentRecord(doc_id, "", {}, coordinates=(0.0, 0.0), waypoint_type="access")
+                for doc_id in document_ids
+            }
+
+        monkeypatch.setattr("c2c_gpx.main.get_documents_data", get_documents_data)
+        result = get_associated_documents(
+            ExportSettings(), "routes", self.ROUTES, {"waypoints": {"access"}, "routes": None}
+        )
+        assert fetched == [("waypoints", [10, 11]), ("routes", [3])]
+        assert list(result["waypoints"]) == [10, 11]
+
+
 class TestGetLocale:
     """Tests for get_locale function."""
 
@@ -385,6 +563,183 @@ class TestGetLocales:
         assert "has no locale in" in str(exc_info.value)
 
 
+class TestGetDocumentData:
+    """Tests for the languages of the fetched documents."""
+
+    def fake_api(self, monkeypatch: pytest.MonkeyPatch, langs: list[str]) -> list[dict[str, Any] | None]:
+        """Serve documents having locales in langs, return the parameters of the API calls."""
+        calls: list[dict[str, Any] | None] = []
+
+        def api_get(
+            settings: ExportSettings, path: str, endpoint: str, params: dict[str, Any] | None = None
+        ) -> SimpleNamespace:
+            assert params is not None
+            calls.append(params)
+            locales = [{"lang": lang, "title": lang} for lang in langs if lang == params["l"]]
+            document = {"document_id": 1, "locales": locales, "available_langs": langs}
+            return SimpleNamespace(content=json.dumps(document).encode())
+
+        monkeypatch.setattr("c2c_gpx.main.api_get", api_get)
+        return calls
+
+    def test_first_language(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that only the locale in the first language is requested."""
+        calls = self.fake_api(monkeypatch, ["en", "fr", "de"])
+        settings = ExportSettings(langs=("fr", "en"))
+        assert get_document_data(settings, "routes", 1)["locales"] == [{"lang": "fr", "title": "fr"}]
+        assert calls == [{"l": "fr"}]
+
+    def test_listed_language(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the preferred language of the languages listed by a search is requested, in a single call."""
+        calls = self.fake_api(monkeypatch, ["de", "en"])
+        settings = ExportSettings(langs=("it", "en", "de"), document_langs={("routes", 1): ("de", "en")})
+        assert get_document_data(settings, "routes", 1)["locales"] == [{"lang": "en", "title": "en"}]
+        assert calls == [{"l": "en"}]
+
+    def test_fallback(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a document not listed and not translated in the first language is requested again."""
+        calls = self.fake_api(monkeypatch, ["de", "en"])
+        settings = ExportSettings(langs=("it", "en", "de"))
+        assert get_document_data(settings, "routes", 1)["locales"] == [{"lang": "en", "title": "en"}]
+        assert calls == [{"l": "it"}, {"l": "en"}]
+
+    def test_parse_langs(self) -> None:
+        """Test that languages are deduplicated in order, and checked."""
+        assert parse_langs("EN, fr,en") == ("en", "fr")
+        with pytest.raises(argparse.ArgumentTypeError, match="unknown language xx"):
+            parse_langs("fr,xx")
+
+
+class TestGetDocumentsData:
+    """Tests for the concurrent fetch of the documents."""
+
+    def test_concurrent_fetch(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that documents are fetched by several threads, in order, skipping the missing ones."""
+        threads: set[str] = set()
+
+        def get_document_record(settings: ExportSettings, doc_type: str, document_id: int) -> DocumentRecord:
+            threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            if document_id == 3:
+                raise requests.HTTPError(response=SimpleNamespace(status_code=404))  # type: ignore[arg-type]
+            return DocumentRecord(document_id, f"Route {document_id}", {})
+
+        monkeypatch.setattr("c2c_gpx.main.get_document_record", get_document_record)
+        records = get_documents_data(ExportSettings(), "routes", list(range(10)), skip_missing=True, workers=4)
+        assert list(records) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+        assert len(threads) > 1
+        with pytest.raises(requests.HTTPError):
+            get_documents_data(ExportSettings(), "routes", [1, 2, 3])
+
+
+METADATA = ExportMetadata("created with c2c-gpx", "https://www.camptocamp.org/routes", datetime.datetime(2025, 1, 1))
+
+
+def route_waypoint(document_id: int, version: str) -> Waypoint:
+    url = f"https://www.camptocamp.org/routes/{document_id}"
+    return Waypoint(
+        "routes", document_id, f"route {document_id}", 45.0, 6.0, f'<a href="{url}">x</a>', url, version=version
+    )
+
+
+class TestUpdateGpx:
+    """Tests for the update of an existing export."""
+
+    def test_changed_versions(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that the documents whose locale or geometry only has changed are fetched again."""
+        fetched: list[int] = []
+
+        def get_documents_data(
+            settings: ExportSettings, doc_type: str, ids: list[int], **kwargs: Any
+        ) -> dict[int, Any]:
+            fetched.extend(ids)
+            return {}
+
+        existing = str(tmp_path / "out.gpx")
+        with GpxWriter(existing, METADATA) as writer:
+            for document_id in (1, 2, 3, 4):
+                writer.write(route_waypoint(document_id, "3.1.1"))
+        monkeypatch.setattr("c2c_gpx.main.get_documents_data", get_documents_data)
+        versions: dict[int, str | None] = {1: "3.1.1", 2: "3.2.1", 3: "3.1.2", 4: "4.1.1", 5: "1.1.1"}
+        update_gpx(ExportSettings(), "routes", versions, existing, existing, METADATA)
+        assert fetched == [2, 3, 4, 5]
+
+    def test_tracks_not_supported(self, tmp_path: Path) -> None:
+        """Test that an export with tracks is not updated, rather than losing its tracks."""
+        existing = str(tmp_path / "out.gpx")
+        with GpxWriter(existing, METADATA) as writer:
+            writer.write(dataclasses.replace(route_waypoint(1, "3.1.1"), track=[[(6.0, 45.0), (6.1, 45.1)]]))
+        with pytest.raises(ValueError, match="has tracks"):
+            update_gpx(ExportSettings(), "routes", {1: "3.1.1"}, existing, existing, METADATA)
+
+    def test_error_before_output_created(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that the error of a writer failing to create the output is raised, not the cleanup one."""
+        existing = str(tmp_path / "out.gpx")
+        with GpxWriter(existing, METADATA):
+            pass
+
+        def fail_open(writer: GpxWriter, mode: str) -> IO[str]:
+            raise PermissionError("read-only directory")
+
+        monkeypatch.setattr(GpxWriter, "_open", fail_open)
+        with pytest.raises(PermissionError, match="read-only directory"):
+            update_gpx(ExportSettings(), "routes", {}, existing, existing, METADATA)
+        assert [path.name for path in tmp_path.iterdir()] == ["out.gpx"]
+
+
+class TestApiGet:
+    """Tests for the rate limiting of the API calls."""
+
+    def test_requests_spaced_across_threads(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that concurrent threads send their requests delay seconds apart, the first ones included."""
+        sent: list[float] = []
+
+        def get(url: str, **kwargs: Any) -> SimpleNamespace:
+            sent.append(time.monotonic())
+            return SimpleNamespace(status_code=200, content=b"{}", headers={}, raise_for_status=lambda: None)
+
+        monkeypatch.setattr("c2c_gpx.main.requests.get", get)
+        settings = ExportSettings(rate_limiter=RateLimiter(0.05))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: api_get(settings, f"routes/{i}", "document"), range(6)))
+        sent.sort()
+        assert len(sent) == 6
+        assert all(b - a >= 0.04 for a, b in itertools.pairwise(sent))
+
+    def test_latency_excludes_rate_limit(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the time spent waiting for a rate limit slot is not counted as API latency."""
+        latencies: list[float] = []
+
+        def get(url: str, **kwargs: Any) -> SimpleNamespace:
+            return SimpleNamespace(status_code=200, content=b"{}", headers={}, raise_for_status=lambda: None)
+
+        monkeypatch.setattr("c2c_gpx.main.requests.get", get)
+        monkeypatch.setattr("c2c_gpx.main.metrics.record", lambda *args: latencies.append(args[-1]))
+        settings = ExportSettings(rate_limiter=RateLimiter(0.1))
+        for i in range(3):
+            api_get(settings, f"routes/{i}", "document")
+        assert len(latencies) == 3
+        assert max(latencies) < 0.05
+
+    def test_cache_hits_not_delayed(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that only the requests missing from the HTTP cache wait for a slot."""
+        waits: list[None] = []
+
+        class Adapter(requests.adapters.HTTPAdapter):
+            def send(self, request: requests.PreparedRequest, *args: Any, **kwargs: Any) -> requests.Response:
+                response = requests.Response()
+                response.status_code, response.url, response.request = 200, request.url or "", request
+                response.raw = urllib3.HTTPResponse(body=io.BytesIO(b"{}"), status=200, preload_content=False)
+                return response
+
+        session = requests_cache.CachedSession(backend="memory")
+        session.mount("https://", Adapter())
+        monkeypatch.setattr("c2c_gpx.main.rate_limit_wait", lambda settings: waits.append(None))
+        settings = ExportSettings(session=session)
+        assert [api_get(settings, "routes/1", "document").content for _ in range(3)] == [b"{}"] * 3
+        assert len(waits) == 1
+
+
 class TestParseC2cUrl:
     """Tests for parse_c2c_url function."""
 
@@ -487,3 +842,8 @@ class TestGenerateFilename:
         params: dict[str, Any] = {"type": "summit"}
         result = generate_filename(doc_type, params)
         assert result == "waypoints_type-summit.gpx"
+
+    def test_export_filename(self) -> None:
+        """Test the filename of the export of several search and collection URLs."""
+        urls = ["https://www.camptocamp.org/books/57964/fr/title", "https://www.camptocamp.org/routes?act=hiking"]
+        assert export_filename(urls) == "books-57964_routes_act-hiking.gpx"
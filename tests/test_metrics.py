@@ -0,0 +1,40 @@
+"""Tests for the c2c_gpx metrics module."""
+
+from c2c_gpx.metrics import MetricsCollector
+
+
+class TestMetricsCollector:
+    """Tests for the MetricsCollector class."""
+
+    def test_record(self) -> None:
+        """Test that cache hits are counted but kept out of the bytes received and latencies."""
+        metrics = MetricsCollector()
+        metrics.record("document", 200, False, 1000, 4000, 0.2)
+        metrics.record("document", 200, True, 0, 4000, 0.0)
+        metrics.record("search", 429, False, 100, 100, 3.0)
+        metrics.record_retry("search")
+
+        document = metrics.endpoints["document"]
+        assert (document.requests, document.cache_hits, document.cache_misses) == (2, 1, 1)
+        assert (document.bytes_received, document.bytes_decoded) == (1000, 8000)
+        assert document.latency_quantile(0.5) == 0.25
+
+        total = metrics.total()
+        assert total.requests == 3
+        assert total.retries == 1
+        assert total.status_codes == {200: 2, 429: 1}
+        assert total.latency_quantile(0.95) == 5.0
+        assert "3 API calls, 1 from cache (33%)" in metrics.short_summary()
+
+    def test_prometheus(self) -> None:
+        """Test that the latency histogram buckets are cumulative."""
+        metrics = MetricsCollector()
+        metrics.record("document", 200, False, 1000, 1000, 0.02)
+        metrics.record("document", 200, False, 1000, 1000, 20.0)
+
+        lines = metrics.to_prometheus().splitlines()
+        assert 'c2c_api_requests_total{endpoint="document",status="200"} 2' in lines
+        assert 'c2c_api_request_duration_seconds_bucket{endpoint="document",le="0.025"} 1' in lines
+        assert 'c2c_api_request_duration_seconds_bucket{endpoint="document",le="10.0"} 1' in lines
+        assert 'c2c_api_request_duration_seconds_bucket{endpoint="document",le="+Inf"} 2' in lines
+        assert 'c2c_api_request_duration_seconds_count{endpoint="document"} 2' in lines
@@ -0,0 +1,78 @@
+"""Tests for the c2c_gpx profiling module."""
+
+import threading
+
+from c2c_gpx.profiling import Profiler
+
+
+class TestProfiler:
+    """Tests for the Profiler class."""
+
+    def test_disabled(self) -> None:
+        """Test that nothing is recorded when the profiler is disabled."""
+        profiler = Profiler()
+
+        @profiler.stage("double")
+        def double(x: int) -> int:
+            return 2 * x
+
+        assert double(2) == 4
+        assert profiler.stages == {}
+
+    def test_enabled(self) -> None:
+        """Test that calls, slowest keys and memory peaks are recorded."""
+        profiler = Profiler(slowest_count=2)
+
+        @profiler.stage("allocate", key=lambda size: f"size {size}")
+        def allocate(size: int) -> int:
+            return len(bytearray(size))
+
+        profiler.enable()
+        try:
+            for size in (10, 1_000_000, 1000):
+                allocate(size)
+        finally:
+            profiler.disable()
+
+        stats = profiler.to_dict()["allocate"]
+        assert stats["calls"] == 3
+        assert stats["peak_memory"] >= 1_000_000
+        assert len(stats["slowest"]) == 2
+
+    def test_nested_sections(self) -> None:
+        """Test that an outer section includes the memory peak of nested ones."""
+        profiler = Profiler()
+        profiler.enable()
+        try:
+            with profiler.section("outer"):
+                with profiler.section("inner"):
+                    data = bytearray(2_000_000)
+                del data
+        finally:
+            profiler.disable()
+
+        stages = profiler.to_dict()
+        assert stages["inner"]["peak_memory"] >= 2_000_000
+        assert stages["outer"]["peak_memory"] >= 2_000_000
+
+    def test_memory_of_main_thread_only(self) -> None:
+        """Test that the memory of the stages of other threads is not measured, the tracemalloc peak being global."""
+        profiler = Profiler()
+
+        @profiler.stage("allocate")
+        def allocate() -> int:
+            return len(bytearray(1_000_000))
+
+        profiler.enable()
+        try:
+            thread = threading.Thread(target=allocate)
+            thread.start()
+            thread.join()
+            assert profiler.to_dict()["allocate"]["peak_memory"] is None
+            allocate()
+        finally:
+            profiler.disable()
+
+        stats = profiler.to_dict()["allocate"]
+        assert stats["calls"] == 2
+        assert stats["peak_memory"] >= 1_000_000
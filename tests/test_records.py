@@ -0,0 +1,61 @@
+"""Tests for the c2c_gpx records module."""
+
+from typing import Any
+
+from c2c_gpx.records import compact_document
+
+WAYPOINT: dict[str, Any] = {
+    "document_id": 42,
+    "version": 3,
+    "waypoint_type": "hut",
+    "elevation": 2800,
+    "geometry": {"geom": '{"type": "Point", "coordinates": [700000.0, 5700000.0]}', "geom_detail": None, "version": 2},
+    "areas": [
+        {"area_type": "country", "locales": [{"lang": "fr", "title": "France"}]},
+        {"area_type": "range", "locales": [{"lang": "en", "title": "Ecrins"}]},
+    ],
+    "locales": [
+        {"lang": "en", "title": "Hut", "summary": "In English", "version": 1, "topic_id": None},
+        {
+            "lang": "fr",
+            "title": "Refuge",
+            "summary": "Gardé l'été",
+            "description": None,
+            "access": "Par le col",
+            "version": 5,
+        },
+    ],
+    "associations": {
+        "waypoint_children": [{"document_id": 43, "waypoint_type": "access"}],
+        "recent_outings": {"total": 1, "documents": [{"document_id": 100}]},
+        "images": [{"document_id": 7}],
+    },
+}
+
+
+class TestCompactDocument:
+    """Tests for the records of the fetched documents."""
+
+    def test_fields(self) -> None:
+        """Test that the record keeps the texts of a single locale, and the fields shown in the waypoint."""
+        record = compact_document("waypoints", WAYPOINT)
+        assert record.document_id == 42
+        assert record.version == "3.5.2"
+        assert record.title == "Refuge"
+        assert record.locale == {"summary": "Gardé l'été", "access": "Par le col"}
+        assert record.coordinates == (700000.0, 5700000.0)
+        assert record.area == "Ecrins"
+        assert record.waypoint_type == "hut"
+        assert record.attributes == {}
+        assert record.geom_detail is None
+        assert record.associations == {}
+
+    def test_optional_fields(self) -> None:
+        """Test that the line and the associations are kept when asked, associations in a single format."""
+        line = '{"type": "LineString", "coordinates": [[0, 0], [1, 1]]}'
+        route = {**WAYPOINT, "geometry": {"geom": None, "geom_detail": line}, "elevation_min": 1200}
+        record = compact_document("routes", route, geom_detail=True, associations=True)
+        assert record.coordinates is None
+        assert record.geom_detail == line
+        assert record.attributes == {"elevation_min": 1200}
+        assert record.associations == {"waypoint_children": [(43, "access")], "recent_outings": [(100, None)]}
@@ -0,0 +1,53 @@
+"""Tests for the c2c_gpx resolvers module."""
+
+from typing import Any
+
+from c2c_gpx.resolvers import Versions, collection_of, resolve, resolve_all
+
+
+def search(doc_type: str, params: dict[str, Any]) -> Versions:
+    """Fake search: documents 1 to 3 for u=1, 3 to 4 for a=2, document 5 otherwise."""
+    if params.get("u") == 1:
+        return {1: "1", 2: "1", 3: "1"} if doc_type == "routes" else {10: "2"}
+    if params.get("a") == 2:
+        return {3: "1", 4: "1"}
+    return {5: "1"}
+
+
+def get_document(path: str) -> dict[str, Any]:
+    assert path == "books/7"
+    return {
+        "document_id": 7,
+        "associations": {"routes": [{"document_id": 4, "version": 1, "locales": [{"version": 2}]}, {"document_id": 6}]},
+    }
+
+
+class TestResolvers:
+    """Tests for the resolution of the exported URLs."""
+
+    def test_collection_of(self) -> None:
+        """Test that collection URL paths are recognized, with or without language and title."""
+        assert collection_of("books/57964/fr/ecrins-rock") == ("books", 57964)
+        assert collection_of("/areas/14274") == ("areas", 14274)
+        assert collection_of("profiles/123") == ("profiles", 123)
+        assert collection_of("routes") is None
+        assert collection_of("routes/123") is None
+        assert collection_of("books") is None
+
+    def test_resolve(self) -> None:
+        """Test the documents of searches and collections, by type."""
+        assert resolve("routes", {"act": "hiking"}, search, get_document) == {"routes": {5: "1"}}
+        assert resolve("books/7/fr/title", {}, search, get_document) == {"routes": {4: "1.2.", 6: None}}
+        assert resolve("areas/2", {"limit": 100}, search, get_document) == {"routes": {3: "1", 4: "1"}}
+        assert resolve("profiles/1", {}, search, get_document) == {
+            "routes": {1: "1", 2: "1", 3: "1"},
+            "outings": {10: "2"},
+        }
+
+    def test_resolve_all(self) -> None:
+        """Test that the documents of several URLs are merged by type, in order and each once."""
+        urls: list[tuple[str, dict[str, Any]]] = [("profiles/1", {}), ("areas/2", {}), ("books/7", {}), ("routes", {})]
+        assert resolve_all(urls, search, get_document, workers=3) == {
+            "routes": {1: "1", 2: "1", 3: "1", 4: "1", 6: None, 5: "1"},
+            "outings": {10: "2"},
+        }
@@ -0,0 +1,106 @@
+"""Tests for the c2c_gpx scheduler module."""
+
+import functools
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from c2c_gpx.scheduler import Job, JobScheduler, RateLimiter, SingleFlight
+
+import pytest
+
+
+class TestScheduler:
+    """Tests for the sharing of the API between concurrent exports."""
+
+    def test_single_flight(self) -> None:
+        """Test that concurrent calls with the same key share the result of the first one."""
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls: list[str] = []
+
+        def fetch(key: str) -> str:
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return key.upper()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            first = executor.submit(flights.do, "a", lambda: fetch("a"))
+            started.wait(5)
+            others = [executor.submit(flights.do, "a", lambda: fetch("a")) for _ in range(2)]
+            while flights.coalesced < 2:
+                time.sleep(0.01)
+            release.set()
+            assert [future.result() for future in (first, *others)] == ["A", "A", "A"]
+        assert calls == ["a"]
+
+        # the result is not kept once the call is done
+        assert flights.do("a", lambda: fetch("a")) == "A"
+        assert calls == ["a", "a"]
+
+    def test_single_flight_error(self) -> None:
+        """Test that an error is raised to all the callers, and that the next call runs again."""
+        flights = SingleFlight()
+
+        def fail() -> None:
+            raise ValueError("API error")
+
+        with pytest.raises(ValueError, match="API error"):
+            flights.do(1, fail)
+        assert flights.do(1, lambda: 2) == 2
+
+    @staticmethod
+    def append(order: list[str], name: str, cancelled: threading.Event) -> None:
+        order.append(name)
+
+    def test_jobs_by_priority(self) -> None:
+        """Test that queued jobs run by priority, then in order of submission, and can be cancelled."""
+        scheduler = JobScheduler(workers=1)
+        release = threading.Event()
+        order: list[str] = []
+        blocking = scheduler.submit(lambda cancelled: release.wait(5))
+        jobs: dict[str, Job[None]] = {}
+        for name, priority in [("low", 5), ("high", -1), ("normal", 0), ("dropped", 0), ("normal 2", 0)]:
+            jobs[name] = scheduler.submit(functools.partial(self.append, order, name), priority)
+        jobs["dropped"].cancel()
+        release.set()
+        scheduler.shutdown()
+
+        assert blocking.future.result() is True
+        assert order == ["high", "normal", "normal 2", "low"]
+        with pytest.raises(CancelledError):
+            jobs["dropped"].future.result()
+
+    def test_cancel_running_job(self) -> None:
+        """Test that a running job is asked to stop."""
+        scheduler = JobScheduler(workers=2)
+        job = scheduler.submit(lambda cancelled: cancelled.wait(5))
+        while not job.future.running():
+            time.sleep(0.01)
+        job.cancel()
+        assert job.future.result(timeout=5) is True
+        scheduler.shutdown()
+
+    def test_rate_limiter(self) -> None:
+        """Test that the calls of all the threads are spaced by the interval."""
+        limiter = RateLimiter(0.05)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: limiter.wait(), range(4)))
+        assert time.monotonic() - start >= 0.15
+
+    def test_rate_limiter_parent(self) -> None:
+        """Test that limiters sharing a parent are spaced by the longest of their intervals and the parent one."""
+        parent = RateLimiter(0.05)
+        limiters = [RateLimiter(0.1, parent), RateLimiter(0.0, parent)]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: limiters[i % 2].wait(), range(4)))
+        # 3 intervals of the parent, and the second call of the slow limiter 0.1 s after its first one
+        assert time.monotonic() - start >= 0.15
+        start = time.monotonic()
+        limiters[0].wait()
+        limiters[0].wait()
+        assert time.monotonic() - start >= 0.1
@@ -0,0 +1,148 @@
+"""Tests for the c2c_gpx server module."""
+
+import asyncio
+import http.client
+import io
+import json
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from c2c_gpx.export_cache import ExportCache
+from c2c_gpx.records import DocumentRecord
+from c2c_gpx.server import ExportService
+from c2c_gpx.settings import ExportSettings
+from c2c_gpx.writers import Waypoint
+
+import gpxpy
+import pytest
+
+SEARCH_URL = "https://www.camptocamp.org/routes?act=rock_climbing"
+
+
+def fake_exporter(monkeypatch: pytest.MonkeyPatch, fail_at: int | None = None) -> None:
+    """Serve 3 routes without calling the API, failing to fetch the fail_at one."""
+
+    def get_document_record(settings: ExportSettings, doc_type: str, document_id: int) -> DocumentRecord:
+        if document_id == fail_at:
+            raise ValueError("API error")
+        return DocumentRecord(document_id, f"route {document_id}", {})
+
+    def create_waypoint(settings: ExportSettings, doc_type: str, record: DocumentRecord) -> Waypoint:
+        document_id = record.document_id
+        url = f"https://www.camptocamp.org/routes/{document_id}"
+        return Waypoint(doc_type, document_id, f"route {document_id}", 45.0, 6.0, "<p>desc</p>", url)
+
+    monkeypatch.setattr("c2c_gpx.main.get_document_versions", lambda settings, doc_type, params: {1: 1, 2: 1, 3: 1})
+    monkeypatch.setattr("c2c_gpx.main.get_document_record", get_document_record)
+    monkeypatch.setattr("c2c_gpx.main.create_waypoint", create_waypoint)
+
+
+def with_server(client: Callable[[int], Any], cache: ExportCache | None = None) -> Any:
+    """Run client(port) in a thread, against a server in the event loop of this one."""
+
+    async def run() -> Any:
+        server = await ExportService(cache=cache).start("127.0.0.1", 0)
+        async with server:
+            return await asyncio.to_thread(client, server.sockets[0].getsockname()[1])
+
+    return asyncio.run(run())
+
+
+def get(port: int, path: str) -> tuple[http.client.HTTPResponse, http.client.HTTPConnection]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("GET", path)
+    return connection.getresponse(), connection
+
+
+class TestServer:
+    """Tests for the streamed exports."""
+
+    def test_export(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the GPX is streamed in chunks, and its progress sent as events."""
+        fake_exporter(monkeypatch)
+
+        def client(port: int) -> tuple[str, str]:
+            response, _ = get(port, f"/export?url={SEARCH_URL.replace('&', '%26')}")
+            assert response.status == 200
+            assert response.getheader("Transfer-Encoding") == "chunked"
+            events, _ = get(port, f"/exports/{response.getheader('X-Export-Id')}/events")
+            return response.read().decode(), events.read().decode()
+
+        body, events = with_server(client)
+        gpx = gpxpy.parse(io.StringIO(body))
+        assert [waypoint.name for waypoint in gpx.waypoints] == ["route 1", "route 2", "route 3"]
+        assert gpx.link == SEARCH_URL
+
+        last = json.loads(events.strip().split("\n")[-1].removeprefix("data: "))
+        assert last["state"] == "done"
+        assert (last["total"], last["fetched"], last["written"]) == (3, 3, 3)
+
+    def test_failed_export(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that an export failing after its first waypoints ends with an incomplete response."""
+        fake_exporter(monkeypatch, fail_at=3)
+
+        def client(port: int) -> tuple[str, str]:
+            response, _ = get(port, f"/export?url={SEARCH_URL}")
+            with pytest.raises(http.client.IncompleteRead) as e:
+                response.read()
+            events, _ = get(port, f"/exports/{response.getheader('X-Export-Id')}/events")
+            return e.value.partial.decode(), events.read().decode()
+
+        partial, events = with_server(client)
+        assert partial.count("<wpt") == 2
+        assert "event: failed" in events
+        assert "ValueError: API error" in events
+
+    def test_cancel(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a cancelled export stops, with an incomplete response."""
+        fake_exporter(monkeypatch)
+        release = threading.Event()
+        monkeypatch.setattr("c2c_gpx.main.get_document_record", lambda settings, doc_type, document_id: release.wait(5))
+
+        def client(port: int) -> tuple[int, str]:
+            response, _ = get(port, f"/export?url={SEARCH_URL}")
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            connection.request("DELETE", f"/exports/{response.getheader('X-Export-Id')}")
+            status = connection.getresponse().status
+            release.set()
+            with pytest.raises(http.client.IncompleteRead):
+                response.read()
+            events, _ = get(port, f"/exports/{response.getheader('X-Export-Id')}/events")
+            return status, events.read().decode()
+
+        status, events = with_server(client)
+        assert status == 200
+        assert "event: cancelled" in events
+
+    def test_cached_export(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        """Test that a repeated export, with reordered parameters, is served from the cache."""
+        fake_exporter(monkeypatch)
+        cache = ExportCache(str(tmp_path))
+        urls = [
+            "https://www.camptocamp.org/routes?act=rock_climbing,snow_ice_mixed%26frat=5a,7a",
+            "https://www.camptocamp.org/routes?frat=5a,7a%26limit=30%26act=snow_ice_mixed,rock_climbing",
+        ]
+
+        def client(port: int) -> list[tuple[str | None, str]]:
+            responses = []
+            for url in urls:
+                response, _ = get(port, f"/export?url={url}")
+                responses.append((response.getheader("X-Cache"), response.read().decode()))
+                monkeypatch.setattr("c2c_gpx.main.get_document_versions", None)
+            return responses
+
+        (first_cache, first), (second_cache, second) = with_server(client, cache)
+        assert (first_cache, second_cache) == ("miss", "hit")
+        assert second == first
+        assert [waypoint.name for waypoint in gpxpy.parse(second).waypoints] == ["route 1", "route 2", "route 3"]
+
+    def test_errors(self) -> None:
+        """Test the responses to invalid requests."""
+
+        def client(port: int) -> list[int]:
+            paths = ["/health", "/export?url=https://www.camptocamp.org/articles", "/exports/123/events", "/other"]
+            return [get(port, path)[0].status for path in paths]
+
+        assert with_server(client) == [200, 400, 404, 404]
@@ -0,0 +1,78 @@
+"""Tests for the c2c_gpx spatial_index module."""
+
+import json
+import os
+from pathlib import Path
+
+from c2c_gpx.spatial_index import SpatialIndex
+
+
+def listing(document_id: int, x: float, y: float, **fields: object) -> dict[str, object]:
+    geom = json.dumps({"type": "Point", "coordinates": [x, y]})
+    document = {
+        "document_id": document_id,
+        "version": 1,
+        "locales": [{"lang": "fr", "version": 3}],
+        "geometry": {"geom": geom, "version": 2},
+        "activities": ["rock_climbing"],
+    }
+    return {**document, **fields}
+
+
+SEARCH = {"act": "rock_climbing", "bbox": "0,0,100,100", "limit": 100}
+DOCUMENTS = [
+    listing(1, 10.0, 10.0, rock_free_rating="5c", global_rating="AD"),
+    listing(2, 50.0, 50.0, rock_free_rating="6a+", global_rating="D"),
+    listing(3, 90.5, 20.25, rock_free_rating="7b", activities=["rock_climbing", "mountain_climbing"]),
+]
+
+
+class TestSpatialIndex:
+    """Tests for the local answers to the searches."""
+
+    def test_sub_area(self, tmp_path: Path) -> None:
+        """Test that searches within an indexed area are answered locally, with the same filters only."""
+        index = SpatialIndex(os.path.join(tmp_path, "index.sqlite"))
+        assert index.query("routes", SEARCH) is None
+        assert index.add_search("routes", SEARCH, DOCUMENTS)
+
+        assert index.query("routes", {**SEARCH, "limit": 30}) == {3: "1.3.2", 2: "1.3.2", 1: "1.3.2"}
+        assert index.query("routes", {**SEARCH, "bbox": "40,0,90.5,60"}) == {3: "1.3.2", 2: "1.3.2"}
+        assert index.query("routes", {**SEARCH, "bbox": "40,0,120,60"}) is None
+        assert index.query("routes", {**SEARCH, "act": "skitouring"}) is None
+        assert index.query("outings", SEARCH) is None
+
+    def test_narrower_filters(self, tmp_path: Path) -> None:
+        """Test that searches with narrower local filters are answered locally, and wider ones are not."""
+        index = SpatialIndex(os.path.join(tmp_path, "index.sqlite"))
+        index.add_search("routes", {**SEARCH, "frat": "5a,7c"}, DOCUMENTS)
+
+        assert index.query("routes", {**SEARCH, "frat": "5c,6c"}) == {2: "1.3.2", 1: "1.3.2"}
+        assert index.query("routes", {**SEARCH, "frat": "6a,7c", "grat": "PD,D+"}) == {2: "1.3.2"}
+        assert index.query("routes", {**SEARCH, "frat": "4a,6c"}) is None
+        assert index.query("routes", SEARCH) is None
+        # the API decides for the filters that are not supported or not understood
+        assert index.query("routes", {**SEARCH, "frat": "5a,7c", "u": "12"}) is None
+        assert index.query("routes", {**SEARCH, "frat": "5a,7z"}) is None
+
+    def test_new_search_replaces_documents(self, tmp_path: Path) -> None:
+        """Test that documents no longer found by a search of the area are removed, and others kept."""
+        path = os.path.join(tmp_path, "index.sqlite")
+        index = SpatialIndex(path)
+        index.add_search("routes", SEARCH, DOCUMENTS)
+        index.add_search("routes", {**SEARCH, "bbox": "0,0,60,60"}, [listing(4, 20.0, 20.0)])
+        # documents out of the filters of the new search are kept
+        index.add_search("routes", {**SEARCH, "act": "skitouring"}, [])
+        index.close()
+
+        assert SpatialIndex(path).query("routes", SEARCH) == {4: "1.3.2", 3: "1.3.2"}
+
+    def test_expired_and_unlocated_searches(self, tmp_path: Path) -> None:
+        """Test that old searches and searches of documents without coordinates are not used."""
+        index = SpatialIndex(os.path.join(tmp_path, "index.sqlite"), max_age=0)
+        index.add_search("routes", SEARCH, DOCUMENTS)
+        assert index.query("routes", SEARCH) is None
+
+        index = SpatialIndex(os.path.join(tmp_path, "other.sqlite"))
+        assert not index.add_search("routes", SEARCH, [*DOCUMENTS, {"document_id": 5, "geometry": None}])
+        assert index.query("routes", SEARCH) is None
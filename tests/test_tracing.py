@@ -0,0 +1,29 @@
+"""Tests for the c2c_gpx tracing module."""
+
+from c2c_gpx.tracing import Tracer
+
+
+class TestTracer:
+    """Tests for the Tracer class."""
+
+    def test_disabled(self) -> None:
+        """Test that no event is recorded when the tracer is disabled."""
+        tracer = Tracer()
+        with tracer.span("fetch"):
+            tracer.annotate(cache="hit")
+        assert tracer.events == []
+
+    def test_nested_spans(self) -> None:
+        """Test that spans are recorded as complete events with their annotations."""
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.span("render", key="routes/1"), tracer.span("fetch"):
+            tracer.annotate(cache="miss")
+
+        events = {e["name"]: e for e in tracer.to_dict()["traceEvents"]}
+        assert events["fetch"]["ph"] == "X"
+        assert events["fetch"]["args"] == {"cache": "miss"}
+        assert events["render"]["args"] == {"key": "routes/1"}
+        assert events["render"]["ts"] <= events["fetch"]["ts"]
+        assert events["render"]["dur"] >= events["fetch"]["dur"]
+        assert events["thread_name"]["ph"] == "M"
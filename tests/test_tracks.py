@@ -0,0 +1,47 @@
+"""Tests for the c2c_gpx tracks module."""
+
+import json
+import math
+
+from c2c_gpx.tracks import EARTH_RADIUS, parse_geom_detail, simplify, to_wgs84
+
+
+class TestTracks:
+    """Tests for the parsing, simplification and conversion of the tracks."""
+
+    def test_parse_geom_detail(self) -> None:
+        """Test that lines are read as segments of (x, y) points, without elevations."""
+        line = {"type": "LineString", "coordinates": [[1.0, 2.0, 1500.0], [3.0, 4.0, 1510.0]]}
+        assert parse_geom_detail(json.dumps(line)) == [[(1.0, 2.0), (3.0, 4.0)]]
+        lines = {"type": "MultiLineString", "coordinates": [[[1.0, 2.0], [3.0, 4.0]], [[5.0, 6.0]]]}
+        assert parse_geom_detail(json.dumps(lines)) == [[(1.0, 2.0), (3.0, 4.0)]]
+        assert parse_geom_detail(json.dumps({"type": "Polygon", "coordinates": []})) == []
+
+    def test_simplify(self) -> None:
+        """Test that points closer than the tolerance to the simplified line are dropped."""
+        points = [(0.0, 0.0), (10.0, 1.0), (20.0, 0.0), (30.0, 50.0), (40.0, 0.0), (40.0, 0.0), (50.0, 0.0)]
+        assert simplify(points, 2.0) == [(0.0, 0.0), (20.0, 0.0), (30.0, 50.0), (40.0, 0.0), (50.0, 0.0)]
+        assert simplify(points, 0.5) == [p for i, p in enumerate(points) if i != 5]
+        assert simplify(points, 0) == points
+
+    def test_simplify_tolerance_is_on_the_ground(self) -> None:
+        """Test that the tolerance is scaled by the Web Mercator stretching at the latitude of the line."""
+        y = EARTH_RADIUS * math.asinh(math.tan(math.radians(60)))  # stretched twice
+        points = [(0.0, y), (10.0, y + 15.0), (20.0, y)]
+        assert len(simplify(points, 10.0)) == 2
+        assert len(simplify(points, 7.0)) == 3
+
+    def test_to_wgs84(self) -> None:
+        """Test that all the tracks are converted in a single call, and split back by document and segment."""
+        calls = []
+
+        def transform(xs: list[float], ys: list[float]) -> tuple[list[float], list[float]]:
+            calls.append(len(xs))
+            return [x / 3 for x in xs], [y * 2 for y in ys]
+
+        tracks = {1: [[(1.0, 2.0), (3.0, 4.0)], [(5.0, 6.0), (7.0, 8.0)]], 2: [[(9.0, 10.0), (11.0, 12.0)]]}
+        assert to_wgs84(tracks, transform) == {
+            1: [[(0.333333, 4.0), (1.0, 8.0)], [(1.666667, 12.0), (2.333333, 16.0)]],
+            2: [[(3.0, 20.0), (3.666667, 24.0)]],
+        }
+        assert calls == [6]
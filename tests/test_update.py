@@ -0,0 +1,65 @@
+"""Tests for the c2c_gpx update module."""
+
+import dataclasses
+import datetime
+import os
+from pathlib import Path
+
+from c2c_gpx.update import has_tracks, iter_gpx_waypoints, read_export_link, read_waypoint_key
+from c2c_gpx.writers import ExportMetadata, GpxWriter, Waypoint
+
+METADATA = ExportMetadata(
+    description="created with c2c-gpx",
+    link="https://www.camptocamp.org/routes?act=rock_climbing&bbox=1,2,3,4",
+    time=datetime.datetime(2025, 1, 1),
+)
+
+
+def waypoint(document_id: int, version: str | None) -> Waypoint:
+    url = f"https://www.camptocamp.org/routes/{document_id}"
+    description = (
+        f'<p> <a href="{url}">{document_id}</a></p><p>see <a href="https://www.camptocamp.org/waypoints/1">x</a></p>'
+    )
+    return Waypoint("routes", document_id, f"route {document_id}", 45.0, 6.0, description, url, version=version)
+
+
+class TestUpdate:
+    """Tests for the reading of existing exports."""
+
+    def test_waypoints_are_read_verbatim(self, tmp_path: Path) -> None:
+        """Test that waypoints are read back as written, whatever the chunk size."""
+        path = os.path.join(tmp_path, "out.gpx.gz")
+        with GpxWriter(path, METADATA) as writer:
+            records = [writer.record(waypoint(i, f"{i + 10}.1.1")) for i in range(1, 4)]
+            for record in records:
+                writer.write_record(record)
+
+        for chunk_size in (7, 1 << 20):
+            assert [f"\n  {xml}" for xml in iter_gpx_waypoints(path, chunk_size)] == records
+
+    def test_waypoint_key(self) -> None:
+        """Test that waypoints are identified by their first link and source version."""
+        writer = GpxWriter("unused.gpx", METADATA)
+        assert read_waypoint_key(writer.record(waypoint(53914, "12.9.3"))) == ("routes", 53914, "12.9.3")
+        # exports of the previous versions stored the document version only
+        xml = "<wpt><desc>camptocamp.org/routes/1</desc><src>camptocamp.org version 12</src></wpt>"
+        assert read_waypoint_key(xml) == ("routes", 1, "12")
+        assert read_waypoint_key(writer.record(waypoint(53914, None))) == ("routes", 53914, None)
+        assert read_waypoint_key('<wpt lat="1" lon="2"><name>x</name></wpt>') is None
+
+    def test_export_link(self, tmp_path: Path) -> None:
+        """Test that the search URL of an export is read from its metadata."""
+        path = os.path.join(tmp_path, "out.gpx")
+        with GpxWriter(path, METADATA) as writer:
+            writer.write(waypoint(1, "1.1.1"))
+        assert read_export_link(path) == METADATA.link
+
+    def test_has_tracks(self, tmp_path: Path) -> None:
+        """Test that the tracks of an export are found, whatever the chunk size."""
+        path = os.path.join(tmp_path, "out.gpx")
+        with GpxWriter(path, METADATA) as writer:
+            writer.write(waypoint(1, "1.1.1"))
+        assert not has_tracks(path, chunk_size=3)
+        with GpxWriter(path, METADATA) as writer:
+            writer.write(dataclasses.replace(waypoint(1, "1.1.1"), track=[[(6.0, 45.0), (6.1, 45.1)]]))
+        assert has_tracks(path, chunk_size=3)
@@ -0,0 +1,200 @@
+"""Tests for the c2c_gpx writers module."""
+
+import csv
+import dataclasses
+import datetime
+import gzip
+import json
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any
+
+from c2c_gpx.writers import WRITERS, ExportMetadata, GpxWriter, ShardedWriter, Waypoint, grid_key, output_paths
+
+import gpxpy
+import gpxpy.gpx
+import pytest
+
+METADATA = ExportMetadata(
+    description="created with c2c-gpx",
+    link="https://www.camptocamp.org/routes?a=1&b=2",
+    time=datetime.datetime(2025, 1, 1),
+)
+
+WAYPOINTS = [
+    Waypoint("routes", 1, "Dalle <du> Jour", 45.5, 6.25, "<p>6a &amp; 5c</p>", "https://www.camptocamp.org/routes/1"),
+    Waypoint("routes", 2, 'Arête "sud"', 45.75, 6.5, "", "https://www.camptocamp.org/routes/2"),
+]
+
+
+def write(writer_class: type, path: str) -> None:
+    with writer_class(path, METADATA) as writer:
+        for waypoint in WAYPOINTS:
+            writer.write(waypoint)
+
+
+class TestWriters:
+    """Tests for the output writers."""
+
+    def test_gpx_matches_gpxpy(self, tmp_path: Path) -> None:
+        """Test that the streamed GPX is identical to the one written by gpxpy."""
+        path = os.path.join(tmp_path, "out.gpx")
+        write(GpxWriter, path)
+
+        gpx = gpxpy.gpx.GPX()
+        gpx.description = METADATA.description
+        gpx.link = METADATA.link.replace("&", "&amp;")
+        gpx.time = METADATA.time
+        gpx.waypoints = [waypoint.to_gpx() for waypoint in WAYPOINTS]
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == gpx.to_xml()
+
+    def test_other_formats(self, tmp_path: Path) -> None:
+        """Test that GeoJSON, KML and CSV outputs parse back."""
+        paths = output_paths(os.path.join(tmp_path, "out.gpx"), ["geojson", "kml", "csv"])
+        for fmt, path in paths.items():
+            write(WRITERS[fmt], path)
+
+        with open(paths["geojson"], encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        assert [f["geometry"]["coordinates"] for f in features] == [[6.25, 45.5], [6.5, 45.75]]
+        assert features[0]["properties"]["name"] == "Dalle <du> Jour"
+
+        names = ET.parse(paths["kml"]).findall(".//{http://www.opengis.net/kml/2.2}Placemark/{*}name")
+        assert [name.text for name in names] == ["Dalle <du> Jour", 'Arête "sud"']
+
+        with open(paths["csv"], encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert rows[0]["description"] == "<p>6a &amp; 5c</p>"
+        assert rows[1]["document_id"] == "2"
+
+    def test_tracks(self, tmp_path: Path) -> None:
+        """Test that tracks are written after the waypoints in GPX, and along their point in GeoJSON and KML."""
+        track = [[(6.25, 45.5), (6.3, 45.6)], [(6.4, 45.7), (6.5, 45.75)]]
+        waypoints = [dataclasses.replace(WAYPOINTS[0], track=track), WAYPOINTS[1]]
+        paths = output_paths(os.path.join(tmp_path, "out.gpx"), ["gpx", "geojson", "kml"])
+        for fmt, path in paths.items():
+            with WRITERS[fmt](path, METADATA) as writer:
+                for waypoint in waypoints:
+                    writer.write(waypoint)
+
+        with open(paths["gpx"], encoding="utf-8") as f:
+            gpx = gpxpy.parse(f)
+        assert len(gpx.waypoints) == 2
+        (gpx_track,) = gpx.tracks
+        assert gpx_track.name == "Dalle <du> Jour"
+        assert [[(p.longitude, p.latitude) for p in segment.points] for segment in gpx_track.segments] == track
+
+        with open(paths["geojson"], encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        assert [f["geometry"]["type"] for f in features] == ["Point", "MultiLineString", "Point"]
+        assert features[1]["geometry"]["coordinates"] == [[list(point) for point in segment] for segment in track]
+
+        lines = ET.parse(paths["kml"]).findall(".//{*}Placemark/{*}MultiGeometry/{*}LineString/{*}coordinates")
+        assert [line.text for line in lines] == ["6.25,45.5 6.3,45.6", "6.4,45.7 6.5,45.75"]
+
+    def test_spooled_tracks(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the GPX tracks spooled to a temporary file are written in order after the waypoints."""
+        monkeypatch.setattr(GpxWriter, "tracks_spool_size", 100)
+        waypoints = [
+            dataclasses.replace(
+                WAYPOINTS[0], document_id=i, name=f"Voie {i}", track=[[(6.0, 45.0 + i / 10), (6.1, 45.0)]]
+            )
+            for i in range(5)
+        ]
+        path = os.path.join(tmp_path, "out.gpx")
+        with GpxWriter(path, METADATA) as writer:
+            for waypoint in waypoints:
+                writer.write(waypoint)
+
+        with open(path, encoding="utf-8") as f:
+            gpx = gpxpy.parse(f)
+        assert len(gpx.waypoints) == 5
+        assert [track.name for track in gpx.tracks] == [waypoint.name for waypoint in waypoints]
+
+    def test_output_paths(self) -> None:
+        """Test that a single output keeps its filename and several ones get their extension."""
+        assert output_paths("out.xml", ["gpx"]) == {"gpx": "out.xml"}
+        assert output_paths("out.gpx", ["gpx", "csv"]) == {"gpx": "out.gpx", "csv": "out.csv"}
+        assert output_paths("out.v2", ["gpx", "kml"]) == {"gpx": "out.v2.gpx", "kml": "out.v2.kml"}
+        assert output_paths("out.gpx", ["gpx"], compress=True) == {"gpx": "out.gpx.gz"}
+        assert output_paths("out.gpx.gz", ["gpx", "csv"]) == {"gpx": "out.gpx.gz", "csv": "out.csv.gz"}
+
+    def test_gzip(self, tmp_path: Path) -> None:
+        """Test that .gz outputs are compressed, including after a pause."""
+        path = os.path.join(tmp_path, "out.gpx.gz")
+        with GpxWriter(path, METADATA) as writer:
+            writer.write(WAYPOINTS[0])
+            writer.pause()
+            writer.write(WAYPOINTS[1])
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            gpx = gpxpy.parse(f)
+        assert [waypoint.name for waypoint in gpx.waypoints] == [waypoint.name for waypoint in WAYPOINTS]
+        assert writer.file_size() < writer.size
+
+
+class TestShardedWriter:
+    """Tests for the ShardedWriter class."""
+
+    def test_shard_by_count(self, tmp_path: Path) -> None:
+        """Test that shards hold at most max_count waypoints and are listed in the index."""
+        path = os.path.join(tmp_path, "out.gpx")
+        with ShardedWriter(GpxWriter, path, METADATA, max_count=3) as writer:
+            for waypoint in WAYPOINTS * 4:
+                writer.write(waypoint)
+
+        with open(writer.path, encoding="utf-8") as f:
+            index = json.load(f)
+        assert [shard["path"] for shard in index["shards"]] == ["out_001.gpx", "out_002.gpx", "out_003.gpx"]
+        assert index["waypoints"] == 8
+        for shard in index["shards"]:
+            with open(os.path.join(tmp_path, shard["path"]), encoding="utf-8") as f:
+                gpx = gpxpy.parse(f)
+            assert len(gpx.waypoints) == shard["waypoints"]
+            assert os.path.getsize(os.path.join(tmp_path, shard["path"])) == shard["bytes"]
+
+    def test_shard_by_size(self, tmp_path: Path) -> None:
+        """Test that shards stay below max_size bytes."""
+        path = os.path.join(tmp_path, "out.geojson")
+        with ShardedWriter(WRITERS["geojson"], path, METADATA, max_size=1000) as writer:
+            for waypoint in WAYPOINTS * 5:
+                writer.write(waypoint)
+
+        assert len(writer.shards) > 1
+        for shard in writer.shards:
+            assert shard.writer.size <= 1000
+            with open(shard.writer.path, encoding="utf-8") as f:
+                assert len(json.load(f)["features"]) == shard.writer.count
+
+    def test_shard_by_grid(self, tmp_path: Path) -> None:
+        """Test spatial shards with more cells than open files."""
+        path = os.path.join(tmp_path, "out.csv")
+        with ShardedWriter(WRITERS["csv"], path, METADATA, key=grid_key(0.1), max_open_files=1) as writer:
+            for waypoint in WAYPOINTS * 3:
+                writer.write(waypoint)
+
+        assert [shard.key for shard in writer.shards] == ["N45.50_E006.20", "N45.70_E006.50"]
+        with open(os.path.join(tmp_path, "out_N45.70_E006.50_001.csv"), encoding="utf-8", newline="") as f:
+            assert len(list(csv.DictReader(f))) == 3
+
+    def test_shard_close_error(self, tmp_path: Path) -> None:
+        """Test that the shards after one failing to close are closed, and the index written, before the error."""
+
+        class FailingWriter(GpxWriter):
+            def __exit__(self, *exc_info: Any) -> None:
+                super().__exit__(*exc_info)
+                if self.path.endswith("_N45.50_E006.20_001.gpx"):
+                    raise OSError("disk full")
+
+        path = os.path.join(tmp_path, "out.gpx")
+        writer = ShardedWriter(FailingWriter, path, METADATA, key=grid_key(0.1))
+        with pytest.raises(OSError, match="disk full"), writer:
+            for waypoint in WAYPOINTS:
+                writer.write(waypoint)
+
+        with open(os.path.join(tmp_path, "out_N45.70_E006.50_001.gpx"), encoding="utf-8") as f:
+            assert len(gpxpy.parse(f).waypoints) == 1
+        with open(writer.path, encoding="utf-8") as f:
+            assert len(json.load(f)["shards"]) == 2